@@ -30,8 +30,7 @@ class AdminCog(commands.Cog):
         
         @discord.ui.button(label="確認", style=discord.ButtonStyle.green)
         async def confirm_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-            self.config.ADMIN_IDS.add(self.target_user.id)
-            self.config.save_config()
+            self.config.add_admin(self.target_user.id)
             
             # 新しい管理者にDMを送信
             try:
@@ -60,8 +59,7 @@ class AdminCog(commands.Cog):
         
         @discord.ui.button(label="確認", style=discord.ButtonStyle.green)
         async def confirm_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-            self.config.ADMIN_IDS.discard(self.target_user.id)
-            self.config.save_config()
+            self.config.remove_admin(self.target_user.id)
             
             await interaction.response.edit_message(content=f"✅ {self.target_user.name} を管理者から削除しました", view=None)
             print(f"✅ {self.target_user.name} ({self.target_user.id}) を管理者から削除しました")
@@ -154,8 +152,7 @@ class AdminCog(commands.Cog):
                 if not has_any(unified, REMOVE_KEYWORDS):
                     if message.mentions:
                         user = message.mentions[0]
-                        config.ADMIN_IDS.add(user.id)
-                        config.save_config()
+                        config.add_admin(user.id)
                         await message.reply(f"{user.mention} を管理者に追加したよ！")
                         return True # 処理終了
             
@@ -163,8 +160,7 @@ class AdminCog(commands.Cog):
             if has_any(unified, admin_add_keywords) and has_any(unified, REMOVE_KEYWORDS):
                 if message.mentions:
                     user = message.mentions[0]
-                    config.ADMIN_IDS.discard(user.id)
-                    config.save_config()
+                    config.remove_admin(user.id)
                     await message.reply(f"{user.mention} を管理者から削除したよ！")
                     return True # 処理終了
             
@@ -172,15 +168,13 @@ class AdminCog(commands.Cog):
             autoping_keywords = ["autoping", "オートピング", "おーとぴんぐ", "自動ピング", "自動ping", "オートping", "自動通知", "ping通知"]
             if has_any(unified, autoping_keywords):
                 if has_any(unified, OFF_KEYWORDS):
-                    config.AUTO_PING_CHANNEL_ID = 0
-                    config.save_config()
+                    config.set_option("auto_ping_channel_id", 0)
                     await message.reply("オートピングを無効化したよ！")
                     return True # 処理終了
                 if has_any(unified, ON_KEYWORDS + ["設定", "セット", "変更", "指定"]):
                     if message.channel_mentions:
                         channel = message.channel_mentions[0]
-                        config.AUTO_PING_CHANNEL_ID = channel.id
-                        config.save_config()
+                        config.set_option("auto_ping_channel_id", channel.id)
                         await message.reply("オートピングを設定したよ！")
                         return True # 処理終了
             
@@ -189,8 +183,7 @@ class AdminCog(commands.Cog):
             if has_any(unified, block_keywords) and not has_any(unified, REMOVE_KEYWORDS):
                 if message.mentions:
                     user = message.mentions[0]
-                    config.BLOCKED_USERS.add(user.id)
-                    config.save_config()
+                    config.add_blocked_user(user.id)
                     await message.reply(f"{user.mention} を出禁にしたよ！")
                     return True # 処理終了
             
@@ -198,8 +191,7 @@ class AdminCog(commands.Cog):
             if has_any(unified, block_keywords) and has_any(unified, REMOVE_KEYWORDS):
                 if message.mentions:
                     user = message.mentions[0]
-                    config.BLOCKED_USERS.discard(user.id)
-                    config.save_config()
+                    config.remove_blocked_user(user.id)
                     await message.reply(f"{user.mention} を出禁から解除したよ！")
                     return True # 処理終了
             
@@ -210,8 +202,7 @@ class AdminCog(commands.Cog):
                     match = re.search(r"(\d{17,20})", content)
                     if match:
                         vc_id = int(match.group(1))
-                        config.TARGET_VC_IDS.add(vc_id)
-                        config.save_config()
+                        config.add_target_vc(vc_id)
                         await message.reply(f"チャンネルID {vc_id} を監視対象に追加したよ！")
                         return True # 処理終了
             
@@ -220,8 +211,7 @@ class AdminCog(commands.Cog):
                 match = re.search(r"(\d{17,20})", content)
                 if match:
                     vc_id = int(match.group(1))
-                    config.TARGET_VC_IDS.discard(vc_id)
-                    config.save_config()
+                    config.remove_target_vc(vc_id)
                     await message.reply(f"チャンネルID {vc_id} を監視対象から削除したよ！")
                     return True # 処理終了
             
@@ -341,13 +331,11 @@ class AdminCog(commands.Cog):
             monitor_keywords = ["監視", "ウォッチ", "watch", "ブロック機能", "出禁機能", "vc機能", "自動切断", "自動キック"]
             if has_any(unified, monitor_keywords) and has_any(unified, ["機能", "システム", "モード"]):
                 if has_any(unified, ON_KEYWORDS):
-                    config.vc_block_enabled = True
-                    config.save_config()
+                    config.set_option("vc_block_enabled", True)
                     await message.reply("監視機能をオンにしたよ！")
                     return True
                 if has_any(unified, OFF_KEYWORDS):
-                    config.vc_block_enabled = False
-                    config.save_config()
+                    config.set_option("vc_block_enabled", False)
                     await message.reply("監視機能をオフにしたよ！")
                     return True
             
@@ -393,8 +381,7 @@ class AdminCog(commands.Cog):
             # 「削除」+ メンション -> 出禁解除 (より明確なキーワードを要求)
             if ("出禁" in unified or "ブロック" in unified) and "削除" in unified and message.mentions:
                  user = message.mentions[0]
-                 config.BLOCKED_USERS.discard(user.id)
-                 config.save_config()
+                 config.remove_blocked_user(user.id)
                  await message.reply(f"{user.mention} を出禁解除したよ！")
                  return True
 
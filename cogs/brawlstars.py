@@ -6,23 +6,37 @@ import datetime
 import unicodedata
 from datetime import datetime, timezone, timedelta
 import os
+import time
 import aiohttp
 import asyncio
+import functools
 import json as json_lib
-import gc
 # Google関連のライブラリ
 from google.cloud import vision
 from google.oauth2 import service_account
 import google.generativeai as genai
-from PIL import Image
-import io
 
+from utils.aimd import AimdController
+from utils.attachments import AttachmentBuffer, AttachmentFetcher
+from utils.cascade import CascadeTracker, confidence
 from utils.discord_helpers import log_to_owner, send_error_to_owner
+from utils.hazard import MATCH_LABELS, find_hazard, fuzzy_matches, merge_identity
+from utils.image_pipeline import MODEL_MAX_SIZE, ImagePreprocessor
+from utils.engine_router import EngineRouter
+from utils.hedging import HedgeTracker, run_hedged
+from utils.ocr_engines import EngineError, EngineThrottled, GeminiEngine, VisionEngine
+from utils.player_index import normalize_sc_id
+from utils.ratelimit import QuotaReservations, Reservation
+from utils.roi import RoiTracker, relevant_bottom, scale_annotations
+from utils.scan_scheduler import ScanScheduler, estimate_drain
 from utils.helpers import normalize_text
 
 JST = timezone(timedelta(hours=9))
 
 class BrawlStarsCog(commands.Cog):
+    # プロフィール画面の判定に使う文字 (2つ以上含まれていればプロフィール画面とみなす)
+    ANCHOR_KEYWORDS = ("トロフィー", "ガチバトル", "勝利数", "ポイント", "最高", "現在", "プロフィール", "シーズン記録", "歴代記録")
+
     def __init__(self, bot):
         self.bot = bot
         self.BRAWLSTARS_CHANNELS = {
@@ -46,25 +60,51 @@ class BrawlStarsCog(commands.Cog):
         self.ERRO_CLEANUP_TIMEOUT = 180 # 3分間
         self.error_cleanup.start()
         
-        # レート制限履歴 {user_id: [タイムスタンプ]}
-        self.SCAN_HISTORY_FILE = "scan_history.json"
-        self.scan_history = self.load_scan_history()
-        
         # Cogロード時に永続的なViewを登録
         # これにより、再起動後もボタンが機能するようになります
         self.bot.add_view(self.PlayerListPagination(self.bot))
         
         # レート制限用の並行処理ロック
         self.lock = asyncio.Lock()
-
-        # 並行処理制限（待機列）用のセマフォとカウンター
-        self.queue_semaphore = asyncio.Semaphore(1)
+        # 受付時に確保するエンジンの回数枠 (解析に成功したエンジンの分を確定し、残りは返却する)
+        self.reservations = QuotaReservations(bot.config.QUOTA_RESERVATION_TTL)
+
+        # 添付画像のダウンロード (1枚につき1回だけ取得し、解析と保存で共有する)
+        self.fetcher = AttachmentFetcher(bot, bot.config.CDN_RESIZE)
+        # 画像の前処理 (デコード・リサイズ・エンコード) 用のプロセスプール
+        self.preprocessor = ImagePreprocessor(bot.config.IMAGE_WORKERS)
+        # OCR エンジンへ送る画像の注目領域 (上端からの帯) と、全体画像との A/B 統計
+        self.roi = RoiTracker(bot.config.ROI_MODE, bot.config.ROI_RATIO)
+
+        # 画像解析のワーカープール (同時解析数・エンジンごとの同時実行数は設定で変更可能)
+        self.scheduler = ScanScheduler(bot.config.SCAN_WORKERS, bot.config.scan_engine_caps())
+        # エンジンごとの同時呼び出し数を上流の混雑 (429・タイムアウト) に合わせて調整
+        # (設定の同時呼び出し数から始めて AIMD_MAX_* まで。回数枠の判定は別に行う)
+        self.concurrency = AimdController(
+            bot.config.aimd_engine_ceilings(), self.scheduler.engine_caps, bot.config.ADAPTIVE_CONCURRENCY
+        )
+        self.scheduler.adaptive = self.concurrency
+        # エンジンの健全性・応答時間の記録と、画像ごとに試すエンジンの順番の決定
+        self.router = EngineRouter(
+            bot.config.ROUTER_LATENCY_TARGET * 1000, bot.config.ROUTER_COOLDOWN, bot.config.ROUTER_FAILURES
+        )
+        # OCR エンジンの非同期アダプター (同時呼び出し数はワーカープールの上限、応答待ちは設定の上限まで)
+        self.engines = self.setup_engines()
+        # 最初のエンジンが遅いときに次のエンジンも並行して呼び出すか (ヘッジ) と、その統計
+        self.hedge = HedgeTracker(bot.config.HEDGE_MODE, bot.config.HEDGE_MIN_DELAY)
+        # 安い Vision を先に試し、結果の信頼度が低いときだけ Flash / Lite へ進むか (逆順カスケード) と、その統計
+        self.cascade = CascadeTracker(bot.config.CASCADE_MODE, bot.config.CASCADE_THRESHOLD, bot.config.CASCADE_FIXTURES_FILE)
+        self.export_engine_state.start()
+
+        # 待機列の通知用カウンター
         self.queue_count = 0
         self.queue_msg = None
         self.queue_lock = asyncio.Lock() # 通知更新用ロック
 
     def cog_unload(self):
         self.error_cleanup.cancel()
+        self.export_engine_state.cancel()
+        self.preprocessor.close()
 
     @tasks.loop(minutes=2.0)
     async def error_cleanup(self):
@@ -77,33 +117,27 @@ class BrawlStarsCog(commands.Cog):
         if len(self.pending_error_messages) > 100:
             self.pending_error_messages.clear()
 
-    def load_scan_history(self):
-        """スキャン履歴をJSONから読み込む"""
-        if os.path.exists(self.SCAN_HISTORY_FILE):
-            try:
-                with open(self.SCAN_HISTORY_FILE, "r", encoding="utf-8") as f:
-                    data = json_lib.load(f)
-                    # keyをint型に戻す (GLOBAL_KEY=0も含む)
-                    return {int(k): v for k, v in data.items()}
-            except:
-                pass
-        return {}
-
-    def save_scan_history(self):
-        """スキャン履歴をJSONに保存"""
+    @tasks.loop(seconds=30)
+    async def export_engine_state(self):
+        """エンジンごとの同時呼び出し数の上限・実行中の数・遮断状態をファイルに書き出す (ダッシュボード用)"""
         try:
-            with open(self.SCAN_HISTORY_FILE, "w", encoding="utf-8") as f:
-                json_lib.dump(self.scan_history, f, indent=2)
+            extra = {
+                "running": dict(self.scheduler.engine_running),
+                "router": self.router.get_stats(),
+            }
+            await asyncio.to_thread(self.concurrency.export, self.bot.config.ENGINE_STATE_FILE, extra)
         except Exception as e:
-            print(f"⚠️ スキャン履歴保存エラー: {e}")
+            print(f"❌ エンジン状態の書き出しエラー: {e}")
 
 
     class HazardDecisionView(discord.ui.View):
-        def __init__(self, bot, user, player_name, player_id, sc_id, message_id, channel_id, cog):
+        def __init__(self, bot, user, player_name, player_id, sc_id, message_id, channel_id, cog, hazard_name=None):
             super().__init__(timeout=None)
             self.bot = bot
             self.user = user
             self.player_name = player_name
+            # お荷物リスト上の登録名 (プレイヤーIDで一致した場合は読み取った名前と異なる)
+            self.hazard_name = hazard_name or player_name
             self.player_id = player_id
             self.sc_id = sc_id
             self.message_id = message_id
@@ -122,8 +156,8 @@ class BrawlStarsCog(commands.Cog):
             config = self.bot.config
             
             # 1. データの移動 (player_names -> check_player_names)
-            if self.player_name in config.player_names:
-                del config.player_names[self.player_name]
+            if self.hazard_name in config.player_names:
+                del config.player_names[self.hazard_name]
             
             config.check_player_names[self.player_name] = {
                 'name': self.player_name,
@@ -133,8 +167,8 @@ class BrawlStarsCog(commands.Cog):
                 'user_id': self.user.id,
                 'message_id': self.message_id
             }
-            config.save_player_names()
-            config.save_check_player_names()
+            config.save_player(self.hazard_name)
+            config.save_check_player(self.player_name)
             
             # 2. ロール付与
             try:
@@ -252,7 +286,7 @@ class BrawlStarsCog(commands.Cog):
                     'message_id': self.new_message.id
                 }
                 config.check_player_register_count[self.new_player_name] = config.check_player_register_count.get(self.new_player_name, 0) + 1
-                config.save_check_player_names()
+                config.save_check_player(old_player_name, self.new_player_name)
 
                 await interaction.response.send_message("✨ データを上書きして記録しました！", delete_after=15)
                 try:
@@ -300,7 +334,7 @@ class BrawlStarsCog(commands.Cog):
                 'message_id': self.new_message.id
             }
             config.check_player_register_count[self.new_player_name] = config.check_player_register_count.get(self.new_player_name, 0) + 1
-            config.save_check_player_names()
+            config.save_check_player(self.new_player_name)
 
             await interaction.response.send_message(f"✨ {len(self.existing_accounts)+1}個目のアカウントを新しく記録しました！", delete_after=15)
             try:
@@ -382,7 +416,7 @@ class BrawlStarsCog(commands.Cog):
                     'message_id': view.new_message.id
                 }
                 config.check_player_register_count[view.new_player_name] = config.check_player_register_count.get(view.new_player_name, 0) + 1
-                config.save_check_player_names()
+                config.save_check_player(self.account_name, view.new_player_name)
 
                 await interaction.response.send_message(f"✨ 「{self.account_name}」のデータを更新しました！", delete_after=15)
                 try:
@@ -401,11 +435,11 @@ class BrawlStarsCog(commands.Cog):
             if credentials_json:
                 credentials_dict = json_lib.loads(credentials_json)
                 credentials = service_account.Credentials.from_service_account_info(credentials_dict)
-                client = vision.ImageAnnotatorClient(credentials=credentials)
+                client = vision.ImageAnnotatorAsyncClient(credentials=credentials)
                 print("✅ Google Vision API初期化完了")
                 return client
             elif os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"):
-                client = vision.ImageAnnotatorClient()
+                client = vision.ImageAnnotatorAsyncClient()
                 print("✅ Google Vision API初期化完了")
                 return client
             else:
@@ -431,6 +465,21 @@ class BrawlStarsCog(commands.Cog):
             print(f"❌ Gemini API初期化失敗: {e}")
             return None, None
 
+    def setup_engines(self) -> dict:
+        """初期化できたエンジンのアダプター (エンジン名 -> アダプター)"""
+        timeouts = self.bot.config.ocr_engine_timeouts()
+        slot = self.scheduler.engine_slot
+        # 呼び出し結果はエンジンの選択 (遮断・応答時間) と同時呼び出し数の調整の両方に使う
+        monitors = (self.router, self.concurrency)
+        engines = {}
+        if self.gemini_flash:
+            engines["flash"] = GeminiEngine("flash", self.gemini_flash, timeouts["flash"], slot, monitors)
+        if self.gemini_lite:
+            engines["lite"] = GeminiEngine("lite", self.gemini_lite, timeouts["lite"], slot, monitors)
+        if self.vision_client:
+            engines["vision"] = VisionEngine(self.vision_client, timeouts["vision"], slot, monitors)
+        return engines
+
     async def cleanup_user_errors(self, user_id: int):
         """ユーザーの古いエラーメッセージがあれば削除する"""
         prev_err = self.pending_error_messages.pop(user_id, None)
@@ -440,6 +489,22 @@ class BrawlStarsCog(commands.Cog):
             except:
                 pass
 
+    def estimate_wait(self) -> float:
+        """予約済みの画像の解析がすべて終わるまでの目安 (秒)
+
+        受付時に予約したエンジンごとの件数・同時呼び出し数・直近の p90 応答時間 (記録がなければ10秒) から計算します。
+        受付は投稿順に処理されるため、受付した直後に呼べばその画像が終わるまでの目安になります。
+        """
+        now = datetime.now(JST).timestamp()
+        engines = self.bot.config.ENGINES
+        pending = {name: self.reservations.active(name, now) for name in engines}
+        concurrency = {name: self.scheduler.engine_cap(name) for name in engines}
+        latency = {}
+        for name in engines:
+            p90 = self.router.latency_p90(name)
+            latency[name] = p90 / 1000 if p90 is not None else 10.0
+        return estimate_drain(pending, concurrency, self.scheduler.workers, latency)
+
     async def update_queue_status(self, channel: discord.abc.Messageable):
         """待機列の状況を通知メッセージとして更新または送信する"""
         async with self.queue_lock:
@@ -452,12 +517,13 @@ class BrawlStarsCog(commands.Cog):
                     self.queue_msg = None
                 return
 
+            # 受付時に予約したエンジンごとの件数・同時呼び出し数・直近の応答時間から計算した目安
+            wait_time = max(1, round(self.estimate_wait()))
             if self.queue_count == 1:
                 # 1枚だけの時はシンプルに
-                msg_text = "プレイヤーを記録します... 最大10秒後に完了します"
+                msg_text = f"プレイヤーを記録します... 最大{wait_time}秒後に完了します"
             else:
                 # 2枚以上の時は詳細を表示
-                wait_time = 10 * self.queue_count
                 msg_text = (
                     "プレイヤーを記録します...\n"
                     f"現在{self.queue_count}枚の画像が処理実行待機中です。すべて完了するまで最大{wait_time}秒かかります。"
@@ -478,56 +544,64 @@ class BrawlStarsCog(commands.Cog):
     # ====== 名前オートコンプリート ======
     async def name_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
         config = self.bot.config
-        choices = [
-            app_commands.Choice(name=name, value=name)
-            for name in config.player_names.keys() if current.lower() in name.lower()
-        ]
-        return choices[:25]
+        # 前方一致 → 部分一致の順に、登録回数の多い名前を上位25件まで
+        names = config.player_search_index.search(current, config.player_register_count)
+        return [app_commands.Choice(name=name, value=name) for name in names]
 
-    async def check_and_update_rate_limit(self, user_id: int) -> tuple[bool, Optional[str], Optional[str]]:
+    async def check_and_update_rate_limit(self, user_id: int) -> tuple[bool, Optional[str], Optional[str], Optional[Reservation]]:
         """
-        レート制限をチェックし、最初に使用を試みる推奨エンジンを返す。
+        レート制限をチェックし、最初に使用を試みる推奨エンジンの回数枠を1件予約して返す。
+        予約は解析に成功すれば確定し、失敗・別のエンジンへのフォールバック時は返却される (hybrid_extract_all_info)。
         実際のフォールバック（429エラー時など）は解析実行時に行う。
-        戻り値: (いずれかのモデルが実行可能か, エラーメッセージ, 推奨エンジン 'flash' | 'lite' | 'vision')
+        戻り値: (いずれかのモデルが実行可能か, エラーメッセージ, 推奨エンジン 'flash' | 'lite' | 'vision', 予約)
         """
         async with self.lock:
             config = self.bot.config
+            limiter = config.rate_limiter
             now = datetime.now(JST).timestamp()
-            GLOBAL_KEY = 0
-            
-            # 履歴の読み込みとクリーンアップ
-            history_data = self.scan_history.get(GLOBAL_KEY, {"flash": [], "lite": [], "vision": []})
-            if not isinstance(history_data, dict) or "flash" not in history_data: # データ移行用
-                history_data = {"flash": [], "lite": [], "vision": []}
-
-            flash_hist = [ts for ts in history_data.get("flash", []) if now - ts < 86400]
-            lite_hist = [ts for ts in history_data.get("lite", []) if now - ts < 86400]
-            vision_hist = [ts for ts in history_data.get("vision", []) if now - ts < 86400]
-            
-            # 1. Flash チェック
-            flash_1h = [ts for ts in flash_hist if now - ts < 3600]
-            if len(flash_1h) < config.RATELIMIT_FLASH_1H and len(flash_hist) < config.RATELIMIT_FLASH_24H:
-                # ここではカウントを増やさず、実際に成功したタイミングまたは試行するエンジンとして返す
-                # 解析ループ内でカウントを管理する
-                return True, None, "flash"
-            
-            # 2. Lite チェック
-            lite_1h = [ts for ts in lite_hist if now - ts < 3600]
-            if len(lite_1h) < config.RATELIMIT_LITE_1H and len(lite_hist) < config.RATELIMIT_LITE_24H:
-                return True, None, "lite"
-            
-            # 3. Vision チェック
-            vision_1h = [ts for ts in vision_hist if now - ts < 3600]
-            if len(vision_1h) < config.RATELIMIT_VISION_1H and len(vision_hist) < config.RATELIMIT_VISION_24H:
-                return True, None, "vision"
-            
+
+            # 1. ユーザーごとの制限 (設定が 0 の場合は無効)
+            user_limits = config.user_limits()
+            if user_limits and not limiter.allows(user_id, user_limits, now):
+                limit_24h = user_limits.get(86400)
+                if limit_24h and limiter.count(user_id, 86400, now) >= limit_24h:
+                    wait_sec = limiter.counter(user_id).wait_time(86400, limit_24h, now)
+                    hours = int(wait_sec // 3600)
+                    minutes = int((wait_sec % 3600) // 60)
+                    return False, (
+                        "✖エラーが発生しました：エラーコード006\n"
+                        "短期間に大量のリクエストを検知しました。\n"
+                        f"このbotは過去24時間で{limit_24h}件まで画像を処理することができます。\n"
+                        f"{hours}時間{minutes}分後に再度お試しください。"
+                    ), None, None
+                minutes = max(1, int(limiter.retry_after(user_id, user_limits, now) // 60))
+                lines = [
+                    "✖エラーが発生しました：エラーコード005",
+                    "短期間に大量のリクエストを検知しました。",
+                    f"このbotは過去1時間で{user_limits[3600]}件まで画像を処理することができます。",
+                ]
+                if limit_24h:
+                    lines.append(f"また、過去24時間で{limit_24h}件まで画像を処理することができます。")
+                lines.append(f"{minutes}分後に再度お試しください。")
+                return False, "\n".join(lines), None, None
+
+            # 2. エンジンの選択 (Flash -> Lite -> Vision)
+            # 受付済みで解析待ち・解析中の画像の予約も数えるため、同時に届いた画像が同じ残り枠を取り合わない
+            for engine in config.ENGINES:
+                reservation = self.reservations.reserve(limiter, engine, config.engine_limits(engine), now)
+                if reservation is not None:
+                    # エンジンのカウントは実際に解析に成功したタイミングで増やす (それまでは予約として数える)
+                    if user_limits:
+                        config.record_user_scan(user_id, now)
+                    return True, None, engine, reservation
+
             # 全て制限
-            if (len(flash_hist) >= config.RATELIMIT_FLASH_24H and 
-                len(lite_hist) >= config.RATELIMIT_LITE_24H and 
-                len(vision_hist) >= config.RATELIMIT_VISION_24H):
-                return False, "✖エラーが発生しました：エラーコード006\n現在アクセスが集中しています。明日またお試しください。", None
-            
-            return False, "✖エラーが発生しました：エラーコード005\n現在アクセスが集中しています。しばらく待ってから再度お試しください。", None
+            if all(limiter.count(e, 86400, now) >= config.engine_limits(e)[86400] for e in config.ENGINES):
+                return False, "✖エラーが発生しました：エラーコード006\n現在アクセスが集中しています。明日またお試しください。", None, None
+
+            wait_sec = min(self.reservations.retry_after(limiter, e, config.engine_limits(e), now) for e in config.ENGINES)
+            minutes = max(1, int(wait_sec // 60))
+            return False, f"✖エラーが発生しました：エラーコード005\n現在アクセスが集中しています。{minutes}分後に再度お試しください。", None, None
 
     # ====== 画像スキャン Listener ======
     @commands.Cog.listener()
@@ -548,12 +622,12 @@ class BrawlStarsCog(commands.Cog):
 
             # 枚数分をカウントに追加
             self.queue_count += len(valid_images)
-            await self.update_queue_status(message.channel)
 
+            jobs = []
             try:
                 for attachment in valid_images:
                     # === レートリミットチェック (Step 0) ===
-                    is_allowed, error_message, engine = await self.check_and_update_rate_limit(message.author.id)
+                    is_allowed, error_message, engine, reservation = await self.check_and_update_rate_limit(message.author.id)
                     
                     if not is_allowed:
                         await self.cleanup_user_errors(message.author.id)
@@ -567,137 +641,202 @@ class BrawlStarsCog(commands.Cog):
                         await self.update_queue_status(message.channel)
                         break
 
-                    async with self.queue_semaphore:
-                        print(f"🚀 画像解析開始: {attachment.filename} (Queue: {self.queue_count})")
-                        
-                        try:
-                            async with message.channel.typing():
-                                # === 画像解析実行 ===
-                                result = await self.hybrid_extract_all_info(attachment.url, engine)
-
-                            if not result or not result.get('name'):
-                                await self.cleanup_user_errors(message.author.id)
-                                try: await message.delete()
-                                except: pass
+                    print(f"🎟️ 受付: {attachment.filename} → {engine.upper()} (完了の目安 {self.estimate_wait():.0f}秒)")
+                    # === 解析はワーカープールで並行して行い、結果の反映はチャンネルごとに投稿順 ===
+                    jobs.append(self.scheduler.submit(
+                        message.channel.id,
+                        functools.partial(self._analyze_attachment, message.channel, attachment, engine, reservation),
+                        functools.partial(self._commit_scan, message, attachment, is_report_channel, is_check_channel),
+                        priority="live",
+                    ))
+
+                if jobs:
+                    # 受付した画像の予約を含めた完了の目安で通知する
+                    await self.update_queue_status(message.channel)
+                await asyncio.gather(*jobs)
+            except Exception as e:
+                print(f"❌ on_messageループエラー: {e}")
+
+    async def _analyze_attachment(self, channel: discord.abc.Messageable, attachment: discord.Attachment, engine: str, reservation: Optional[Reservation] = None):
+        """ワーカーで実行: 画像をダウンロードして解析する"""
+        print(f"🚀 画像解析開始: {attachment.filename} (Queue: {self.queue_count})")
+        try:
+            async with channel.typing():
+                image_buffer = await self.fetcher.fetch_attachment(attachment)
+                result = await self.hybrid_extract_all_info(image_buffer, engine, reservation=reservation) if image_buffer else None
+        finally:
+            # ダウンロードできなかった場合などに残った予約を返却する (解析で確定・返却済みなら何もしない)
+            if reservation is not None:
+                self.reservations.release(reservation)
+        return image_buffer, result
+
+    async def _commit_scan(self, message: discord.Message, attachment: discord.Attachment, is_report_channel: bool, is_check_channel: bool, outcome, error: Optional[BaseException]):
+        """チャンネルごとに投稿順で実行: 解析結果を記録・返信し、画像を保存する"""
+        config = self.bot.config
+        image_buffer, result = outcome if outcome else (None, None)
+        player_name = result.get('name') if result else None
+        try:
+            if error is not None:
+                raise error
+            await self._apply_scan_result(message, is_report_channel, is_check_channel, result)
+        except Exception as e:
+            print(f"❌ 画像認識エラー: {e}")
+            await send_error_to_owner(self.bot, config, "BrawlStars Scan Error", e, f"User: {message.author.name}")
+        finally:
+            # 画像保存（認識結果に関わらず保存）
+            save_dir = config.REPORT_IMAGES_DIR if is_report_channel else config.CHECK_IMAGES_DIR
+            await self.save_image(attachment, save_dir, message.author.id, player_name or "Unknown", message.created_at, image_buffer)
+            self.fetcher.count_image()
+            del image_buffer
+
+            # 1枚終わるごとにカウントを減らして通知を更新
+            self.queue_count -= 1
+            await self.update_queue_status(message.channel)
+            print(f"🏁 画像解析終了: {attachment.filename} (Remaining: {self.queue_count})")
+
+    async def _log_fuzzy_review(self, user, player_name: str, player_id, source: str):
+        """表記ゆれの候補はあるが一致とはみなせない名前を、管理者ログに要確認として送る (削除・ブロックはしない)"""
+        config = self.bot.config
+        candidates = fuzzy_matches(config, player_name, player_id)
+        print(f"🔎 表記ゆれの要確認: {player_name} ≒ {', '.join(candidates)}")
+        try:
+            log_channel = self.bot.get_channel(self.LOG_CHANNEL_ID) or await self.bot.fetch_channel(self.LOG_CHANNEL_ID)
+            if log_channel:
+                embed = discord.Embed(
+                    title=f"🔎 表記ゆれの要確認 ({source})",
+                    description=(
+                        f"プレイヤー: **{player_name}** (ID: {player_id})\n実行者: {user.mention} ({user.id})\n"
+                        f"近い登録名: {', '.join(candidates[:10])}\n"
+                        "※名前が短い・候補が複数あるため自動では判定していません。"
+                    ),
+                    color=discord.Color.orange()
+                )
+                embed.set_footer(text=f"判定時刻: {datetime.now(JST).strftime('%Y/%m/%d %H:%M:%S')}")
+                await log_channel.send(embed=embed)
+        except Exception as e:
+            print(f"❌ 要確認ログの送信に失敗: {e}")
+
+    async def _apply_scan_result(self, message: discord.Message, is_report_channel: bool, is_check_channel: bool, result: Optional[dict]):
+        """解析結果に応じてお荷物判定・記録・返信を行う"""
+        config = self.bot.config
+        if not result or not result.get('name'):
+            await self.cleanup_user_errors(message.author.id)
+            try: await message.delete()
+            except: pass
                                 
-                                err_msg_text = (
-                                    "✖エラーが発生しました：エラーコード004\n"
-                                    "ブロスタの名前を正しく認識できませんでした。\n"
-                                    "画像が加工されていない、直撮りでないことを確認し、もう一度プロフィール画像を送信してください。"
-                                )
-                                err_msg = await message.channel.send(f"{message.author.mention} {err_msg_text}", delete_after=180)
-                                self.pending_error_messages[message.author.id] = err_msg
-                                continue
+            err_msg_text = (
+                "✖エラーが発生しました：エラーコード004\n"
+                "ブロスタの名前を正しく認識できませんでした。\n"
+                "画像が加工されていない、直撮りでないことを確認し、もう一度プロフィール画像を送信してください。"
+            )
+            err_msg = await message.channel.send(f"{message.author.mention} {err_msg_text}", delete_after=180)
+            self.pending_error_messages[message.author.id] = err_msg
+            return
 
-                            player_name = result['name']
-                            player_id = result.get('player_id', 'Unknown')
-                            sc_id = result.get('sc_id', 'Unknown')
-
-                            # チェック用チャンネルの挙動: プレイヤー名のみ表示、他は破棄
-                            if is_check_channel:
-                                # お荷物リスト判定
-                                is_hazard = player_name in config.player_names
-                                if is_hazard:
-                                    # ユーザーへのエラーメッセージ
-                                    err_msg_text = (
-                                        "✖エラーが発生しました：エラーコード001\n"
-                                        "確認が必要なプレイヤーです。\n"
-                                        "<@1163117069173272576> にプロフィール画像とこのエラーコードをお伝えください。\n"
-                                        "※よくある名前を使用していると意図せずこのメッセージが表示されることがあります。"
-                                    )
-                                    err_msg = await message.channel.send(f"{message.author.mention} {err_msg_text}", delete_after=180)
-                                    self.pending_error_messages[message.author.id] = err_msg
+        player_name = result['name']
+        player_id = result.get('player_id', 'Unknown')
+        sc_id = result.get('sc_id', 'Unknown')
+
+        # チェック用チャンネルの挙動: プレイヤー名のみ表示、他は破棄
+        if is_check_channel:
+            # お荷物リスト判定 (プレイヤーID → Supercell ID → 名前の順に照合)
+            hazard_name, matched_key = find_hazard(config, player_name, player_id, sc_id)
+            if hazard_name:
+                # ユーザーへのエラーメッセージ
+                err_msg_text = (
+                    "✖エラーが発生しました：エラーコード001\n"
+                    "確認が必要なプレイヤーです。\n"
+                    "<@1163117069173272576> にプロフィール画像とこのエラーコードをお伝えください。\n"
+                    "※よくある名前を使用していると意図せずこのメッセージが表示されることがあります。"
+                )
+                err_msg = await message.channel.send(f"{message.author.mention} {err_msg_text}", delete_after=180)
+                self.pending_error_messages[message.author.id] = err_msg
                                     
-                                    try: await message.delete()
-                                    except: pass
-
-                                    # 管理者へのログと意思決定ボタン
-                                    log_channel = self.bot.get_channel(self.LOG_CHANNEL_ID) or await self.bot.fetch_channel(self.LOG_CHANNEL_ID)
-                                    if log_channel:
-                                        embed = discord.Embed(
-                                            title="⚠️ 要注意人物の来訪 (画像送信)",
-                                            description=f"プレイヤー: **{player_name}**\n実行者: {message.author.mention} ({message.author.id})",
-                                            color=discord.Color.red()
-                                        )
-                                        embed.set_footer(text=f"判定時刻: {datetime.now(JST).strftime('%Y/%m/%d %H:%M:%S')}")
-                                        view = self.HazardDecisionView(self.bot, message.author, player_name, player_id, sc_id, message.id, message.channel.id, self)
-                                        await log_channel.send(embed=embed, view=view)
-                                    continue
+                try: await message.delete()
+                except: pass
+
+                # 管理者へのログと意思決定ボタン
+                log_channel = self.bot.get_channel(self.LOG_CHANNEL_ID) or await self.bot.fetch_channel(self.LOG_CHANNEL_ID)
+                if log_channel:
+                    embed = discord.Embed(
+                        title="⚠️ 要注意人物の来訪 (画像送信)",
+                        description=(
+                            f"プレイヤー: **{player_name}**\n実行者: {message.author.mention} ({message.author.id})\n"
+                            f"一致: {MATCH_LABELS[matched_key]} (登録名: {hazard_name})"
+                        ),
+                        color=discord.Color.red()
+                    )
+                    embed.set_footer(text=f"判定時刻: {datetime.now(JST).strftime('%Y/%m/%d %H:%M:%S')}")
+                    view = self.HazardDecisionView(self.bot, message.author, player_name, player_id, sc_id, message.id, message.channel.id, self, hazard_name)
+                    await log_channel.send(embed=embed, view=view)
+                return
+            if matched_key == "fuzzy_review":
+                await self._log_fuzzy_review(message.author, player_name, player_id, "画像送信")
                                 
-                                # 重複チェック (エラーコード 003)
-                                if player_name in config.check_player_names:
-                                    if config.check_player_names[player_name].get('user_id') != message.author.id:
-                                        try: await message.delete()
-                                        except: pass
-                                        err_msg = await message.channel.send(f"{message.author.mention} ✖エラーが発生しました；エラーコード003\n既に同じ名前が登録されています。", delete_after=180)
-                                        self.pending_error_messages[message.author.id] = err_msg
-                                        continue
-
-                                # OK判定
-                                emoji = self.bot.get_emoji(1342392510764286012)
-                                await message.add_reaction(emoji or "✅")
+            # 重複チェック (エラーコード 003)
+            if player_name in config.check_player_names:
+                if config.check_player_names[player_name].get('user_id') != message.author.id:
+                    try: await message.delete()
+                    except: pass
+                    err_msg = await message.channel.send(f"{message.author.mention} ✖エラーが発生しました；エラーコード003\n既に同じ名前が登録されています。", delete_after=180)
+                    self.pending_error_messages[message.author.id] = err_msg
+                    return
+
+            # OK判定
+            emoji = self.bot.get_emoji(1342392510764286012)
+            await message.add_reaction(emoji or "✅")
                                 
-                                config.check_player_names[player_name] = {
-                                    'name': player_name,
-                                    'checked_at': datetime.now(JST).isoformat(),
-                                    'user_id': message.author.id,
-                                    'message_id': message.id
-                                }
-                                config.save_check_player_names()
+            config.check_player_names[player_name] = {
+                'name': player_name,
+                'checked_at': datetime.now(JST).isoformat(),
+                'user_id': message.author.id,
+                'message_id': message.id
+            }
+            config.save_check_player(player_name)
                                 
-                                # ロール付与
-                                role = message.guild.get_role(self.SAFE_ROLE_ID)
-                                if role:
-                                    await message.author.add_roles(role)
-                                    try: await message.author.send(f"✨ {role.name} ロールを付与しました！")
-                                    except: pass
+            # ロール付与
+            role = message.guild.get_role(self.SAFE_ROLE_ID)
+            if role:
+                await message.author.add_roles(role)
+                try: await message.author.send(f"✨ {role.name} ロールを付与しました！")
+                except: pass
                             
-                            elif is_report_channel:
-                                # 報告用チャンネルの挙動: 全情報を記録
-                                formatted_info = f"プレイヤー名: {player_name}\nSupercell ID: {sc_id}\nプレイヤーID: {player_id}"
+        elif is_report_channel:
+            # 報告用チャンネルの挙動: 全情報を記録
+            formatted_info = f"プレイヤー名: {player_name}\nSupercell ID: {sc_id}\nプレイヤーID: {player_id}"
                                 
-                                if player_name in config.player_names:
-                                    config.player_register_count[player_name] = config.player_register_count.get(player_name, 0) + 1
-                                    count = config.player_register_count[player_name]
-                                    config.player_names[player_name].update({
-                                        'last_updated': datetime.now(JST).isoformat(),
-                                        'player_id': player_id,
-                                        'sc_id': sc_id
-                                    })
-                                    msg_text = f"{formatted_info}\n『{player_name}』はすでに追加されているよ！通算{count}回目だね"
-                                else:
-                                    config.player_names[player_name] = {
-                                        'name': player_name,
-                                        'player_id': player_id,
-                                        'sc_id': sc_id,
-                                        'registered_at': datetime.now(JST).isoformat(),
-                                        'last_updated': datetime.now(JST).isoformat()
-                                    }
-                                    config.player_register_count[player_name] = 1
-                                    msg_text = f"{formatted_info}\nお荷物プレイヤー『{player_name}』を新しく記録したよ！"
+            # 同じプレイヤーIDが別の名前で記録されていれば改名とみなして統合 (Supercell ID だけの一致では統合しない)
+            known_name, known_key = find_hazard(config, player_name, player_id, sc_id, fuzzy=False)
+            if known_key == "player_id" and known_name != player_name and merge_identity(config, known_name, player_name):
+                formatted_info += f"\n(旧名『{known_name}』の記録を統合しました)"
                                 
-                                config.save_player_names()
-                                await self.update_latest_list()
-                                await message.channel.send(msg_text)
-
-                        except Exception as e:
-                            print(f"❌ 画像認識エラー: {e}")
-                            await send_error_to_owner(self.bot, config, "BrawlStars Scan Error", e, f"User: {message.author.name}")
-                        finally:
-                            # 画像保存（認識結果に関わらず保存）
-                            player_name_clean = player_name if 'player_name' in locals() and player_name else "Unknown"
-                            save_dir = config.REPORT_IMAGES_DIR if is_report_channel else config.CHECK_IMAGES_DIR
-                            await self.save_image(attachment, save_dir, message.author.id, player_name_clean, message.created_at)
-
-                            # 1枚終わるごとにカウントを減らして通知を更新
-                            self.queue_count -= 1
-                            await self.update_queue_status(message.channel)
-                            print(f"🏁 画像解析終了: {attachment.filename} (Remaining: {self.queue_count})")
-            except Exception as e:
-                print(f"❌ on_messageループエラー: {e}")
+            if player_name in config.player_names:
+                config.player_register_count[player_name] = config.player_register_count.get(player_name, 0) + 1
+                count = config.player_register_count[player_name]
+                config.player_names[player_name].update({
+                    'last_updated': datetime.now(JST).isoformat(),
+                    'player_id': player_id,
+                    'sc_id': sc_id
+                })
+                msg_text = f"{formatted_info}\n『{player_name}』はすでに追加されているよ！通算{count}回目だね"
+            else:
+                config.player_names[player_name] = {
+                    'name': player_name,
+                    'player_id': player_id,
+                    'sc_id': sc_id,
+                    'registered_at': datetime.now(JST).isoformat(),
+                    'last_updated': datetime.now(JST).isoformat()
+                }
+                config.player_register_count[player_name] = 1
+                msg_text = f"{formatted_info}\nお荷物プレイヤー『{player_name}』を新しく記録したよ！"
+                                
+            config.save_player(player_name)
+            await self.update_latest_list()
+            await message.channel.send(msg_text)
+
 
-    async def save_image(self, attachment: discord.Attachment, save_dir: str, user_id: int, player_name: str, created_at: datetime):
-        """画像をダウンロードし、圧縮して保存する"""
+    async def save_image(self, attachment: discord.Attachment, save_dir: str, user_id: int, player_name: str, created_at: datetime, image_buffer: Optional[AttachmentBuffer] = None):
+        """画像を圧縮して保存する（解析時にダウンロード済みのバッファがあればそれを使う）"""
         try:
             # 禁則文字の置換
             safe_name = "".join(c for c in player_name if c.isalnum() or c in (' ', '_', '-')).strip()
@@ -712,28 +851,18 @@ class BrawlStarsCog(commands.Cog):
             if os.path.exists(save_path):
                 return
 
-            async with self.bot.session.get(attachment.url) as resp:
-                if resp.status != 200: return
-                data = await resp.read()
+            if image_buffer is None:
+                image_buffer = await self.fetcher.fetch_attachment(attachment, "save")
+                if image_buffer is None: return
 
-            def process_and_save():
-                with Image.open(io.BytesIO(data)) as img:
-                    # RGBに変換
-                    img_rgb = img.convert("RGB")
-                    
-                    # リサイズ (長辺1280px限制)
-                    max_size = 1280
-                    w, h = img_rgb.size
-                    if max(w, h) > max_size:
-                        scale = max_size / max(w, h)
-                        img_rgb = img_rgb.resize((int(w * scale), int(h * scale)), Image.Resampling.LANCZOS)
-                    
-                    # 保存 (WebP, quality=75)
-                    img_rgb.save(save_path, "WEBP", quality=75)
-                    img_rgb.close()
-                return True
+            # 長辺1280px の WebP (quality=75) はプロセスプールで作成済み (Gemini 解析時に作られていれば再利用)
+            preprocessed = await self.preprocessor.process(image_buffer)
 
-            await asyncio.to_thread(process_and_save)
+            def write_file():
+                with open(save_path, "wb") as f:
+                    f.write(preprocessed.archive_webp)
+
+            await asyncio.to_thread(write_file)
             print(f"💾 画像を保存しました: {filename}")
         except Exception as e:
             print(f"❌ 画像保存エラー ({attachment.filename}): {e}")
@@ -779,9 +908,40 @@ class BrawlStarsCog(commands.Cog):
                             count += 1
                 print(f"✅ #{channel.name} から {count} 枚の画像を処理しました。")
 
-    async def hybrid_extract_all_info(self, image_url: str, recommended_engine: str) -> Optional[dict]:
-        """階層的なフォールバックロジック: Flash -> Lite -> Vision"""
+    async def hybrid_extract_all_info(self, image_buffer: AttachmentBuffer, recommended_engine: str, quota_reserve: int = 0,
+                                      reservation: Optional[Reservation] = None) -> Optional[dict]:
+        """階層的なフォールバックロジック: Flash -> Lite -> Vision (どのエンジンも同じダウンロード済みバッファを使う)
+
+        quota_reserve: 一括処理用。各ウィンドウの上限のうちこの件数を投稿・コマンドのために残す
+        reservation: 受付時に予約した推奨エンジンの回数枠。他のエンジンは呼び出す直前に予約し、
+                     終了時に使ったエンジンの分を確定・記録して、残りは返却する
+        """
+        held = {reservation.key: reservation} if reservation is not None else {}
+        used = set()
+        try:
+            return await self._hybrid_extract(image_buffer, recommended_engine, quota_reserve, held, used)
+        finally:
+            await self._settle_reservations(held, used)
+
+    async def _settle_reservations(self, held: dict, used: set):
+        """解析に使ったエンジンの予約を確定して記録し、使わなかったエンジンの予約を返却する"""
         config = self.bot.config
+        async with self.lock:
+            now = datetime.now(JST).timestamp()
+            for engine in used:
+                config.record_scan(engine, now)
+            self.reservations.settle(held, used)
+
+    async def _hybrid_extract(self, image_buffer: AttachmentBuffer, recommended_engine: str, quota_reserve: int,
+                              held: dict, used: set) -> Optional[dict]:
+        config = self.bot.config
+
+        # 同じ画像を解析済みならエンジンを呼ばずに結果を使う (回数枠を消費しない)
+        # キャッシュは SQLite への書き込み (最終使用時刻の更新) とハッシュ計算を伴うため、イベントループの外で実行する
+        cached = await asyncio.to_thread(config.ocr_cache.get, "all", image_buffer.attachment_id, image_buffer)
+        if cached is not None:
+            print("📦 画像解析: OCRキャッシュを使用")
+            return cached
         
         engines_to_try = []
         if recommended_engine == "flash":
@@ -791,117 +951,172 @@ class BrawlStarsCog(commands.Cog):
         else:
             engines_to_try = ["vision"]
 
-        for engine in engines_to_try:
-            # 各エンジンの実行前にカウント制限を再チェック（ループ内での動的切り替え用）
-            async with self.lock:
-                now = datetime.now(JST).timestamp()
-                hist_data = self.scan_history.get(0, {"flash": [], "lite": [], "vision": []})
-                
-                if engine == "flash":
-                    h = [ts for ts in hist_data.get("flash", []) if now - ts < 86400]
-                    h1 = [ts for ts in h if now - ts < 3600]
-                    if len(h1) >= config.RATELIMIT_FLASH_1H or len(h) >= config.RATELIMIT_FLASH_24H:
-                        continue
-                elif engine == "lite":
-                    h = [ts for ts in hist_data.get("lite", []) if now - ts < 86400]
-                    h1 = [ts for ts in h if now - ts < 3600]
-                    if len(h1) >= config.RATELIMIT_LITE_1H or len(h) >= config.RATELIMIT_LITE_24H:
-                        continue
-                elif engine == "vision":
-                    h = [ts for ts in hist_data.get("vision", []) if now - ts < 86400]
-                    h1 = [ts for ts in h if now - ts < 3600]
-                    if len(h1) >= config.RATELIMIT_VISION_1H or len(h) >= config.RATELIMIT_VISION_24H:
-                        continue
-
-            # 実行
-            result = None
-            try:
-                if engine == "flash":
-                    result = await self.extract_all_with_gemini(image_url, "flash")
-                elif engine == "lite":
-                    result = await self.extract_all_with_gemini(image_url, "lite")
-                elif engine == "vision":
-                    result = await self.extract_all_with_vision(image_url)
-                
-                if result:
-                    # 成功時にカウントを増やす
-                    async with self.lock:
-                        now = datetime.now(JST).timestamp()
-                        hist_data = self.scan_history.get(0, {"flash": [], "lite": [], "vision": []})
-                        hist_data[engine].append(now)
-                        self.scan_history[0] = hist_data
-                        self.save_scan_history()
-                    
-                    print(f"📊 画像解析成功: 使用モデル = {engine.upper()}")
-                    return result
+        hedging = self.hedge.use_hedge()
+        hedged = False
+        started = time.perf_counter()
+
+        # 逆順カスケード: 最後の手段だった Vision を先に試し、信頼度が閾値以上なら Flash / Lite を呼ばない
+        cheap = None
+        if self.cascade.enabled and len(engines_to_try) > 1:
+            engines_to_try = [engine for engine in engines_to_try if engine != "vision"]
+            cheap = await self._cascade_vision(image_buffer, quota_reserve, held)
+            if cheap is not None:
+                # Flash / Lite へ進む場合も Vision の回数枠は消費済み
+                used.add("vision")
+            if cheap is not None and self.cascade.accepts(cheap["score"]):
+                await asyncio.to_thread(config.ocr_cache.put, "all", image_buffer, cheap["result"], "vision", image_buffer.attachment_id)
+                self.cascade.record(["vision"], time.perf_counter() - started, cheap["score"], accepted=True)
+                self.hedge.record(hedging, time.perf_counter() - started)
+                print(f"📊 画像解析成功: 使用モデル = VISION (信頼度 {cheap['score']:.2f})")
+                return cheap["result"]
+        escalated_at = time.perf_counter()
+
+        # 失敗が続いて遮断中のエンジンを除き、応答時間の目標を満たすエンジンを先に試す (それぞれの中ではこの順)
+        order = iter(self.router.order(engines_to_try))
+        for engine in order:
+            if not await self._admit_engine(engine, quota_reserve, held):
+                continue
+
+            # 実行 (エンジンごとの同時実行数の上限・応答待ちの上限はアダプター側で適用)
+            if hedging:
+                launched = [engine]
+
+                async def launch_backup():
+                    # 次に試す予定のエンジンを予備として並行して呼び出す (回数枠・遮断の確認は通常どおり)
+                    for backup in order:
+                        if await self._admit_engine(backup, quota_reserve, held):
+                            launched.append(backup)
+                            return functools.partial(self._extract_with_engine, image_buffer, backup)
+                    return None
 
-            except Exception as e:
-                # 429エラーを検知
-                error_str = str(e).lower()
-                if "429" in error_str or "too many requests" in error_str:
-                    print(f"⚠️ {engine.upper()} 429制限検知: 次のモデルへフォールバックします")
-                    continue
-                else:
-                    # それ以外の深刻なエラーは即座に停止せずに次を試すか判断
-                    print(f"❌ {engine.upper()} エラー: {e}")
-                    if engine != "vision":
-                        continue
-        
+                delay = self.hedge.delay(self.router.latency_p90(engine), config.ocr_engine_timeouts()[engine])
+                outcome = await run_hedged(
+                    functools.partial(self._extract_with_engine, image_buffer, engine), launch_backup, delay
+                )
+                for index, error in outcome.errors.items():
+                    self._report_engine_error(launched[index], error)
+                result = outcome.value
+                winner = launched[outcome.winner] if outcome.winner is not None else None
+                if outcome.hedged:
+                    hedged = True
+                    print(
+                        f"🔀 ヘッジ: {engine.upper()} が {delay:.1f}秒以内に応答しないため {launched[1].upper()} も実行 "
+                        f"→ {winner.upper() if winner else '両方失敗'}"
+                    )
+            else:
+                try:
+                    result = await self._extract_with_engine(image_buffer, engine)
+                except Exception as e:
+                    self._report_engine_error(engine, e)
+                    result = None
+                winner = engine
+
+            if result:
+                # 成功したエンジンの予約を確定してカウントを増やす (ヘッジで取り消した側の予約は返却する)
+                used.add(winner)
+                await asyncio.to_thread(config.ocr_cache.put, "all", image_buffer, result, winner, image_buffer.attachment_id)
+                self.hedge.record(hedging, time.perf_counter() - started, hedged, winner != engine)
+                if cheap is not None:
+                    self._finish_cascade(image_buffer, cheap, winner, result, started, escalated_at)
+
+                print(f"📊 画像解析成功: 使用モデル = {winner.upper()}")
+                return result
+
+        self.hedge.record(hedging, time.perf_counter() - started, hedged)
+        if cheap is not None:
+            # Flash / Lite がどれも使えなかった場合は、信頼度が低くても Vision の結果を使う (従来の最後の手段と同じ)
+            self.cascade.record(["vision"], time.perf_counter() - started, cheap["score"], accepted=False, escalation_failed=True)
+            await asyncio.to_thread(config.ocr_cache.put, "all", image_buffer, cheap["result"], "vision", image_buffer.attachment_id)
+            print(f"📊 画像解析成功: 使用モデル = VISION (信頼度 {cheap['score']:.2f}、他のエンジンは失敗)")
+            return cheap["result"]
         return None
 
-    async def extract_all_with_gemini(self, image_url: str, model_type: str = "flash") -> Optional[dict]:
-        model = self.gemini_flash if model_type == "flash" else self.gemini_lite
-        if not model: return None
+    async def _cascade_vision(self, image_buffer: AttachmentBuffer, quota_reserve: int, held: dict) -> Optional[dict]:
+        """逆順カスケードの最初の段: Vision で解析し、結果と信頼度を返す (呼べない・失敗した場合は None)"""
+        if not await self._admit_engine("vision", quota_reserve, held):
+            return None
+        signals = {}
+        started = time.perf_counter()
+        try:
+            result = await self.extract_all_with_vision(image_buffer, signals)
+        except Exception as e:
+            self._report_engine_error("vision", e)
+            return None
+        if not result:
+            return None
+        score, parts = confidence(signals, result)
+        print(f"🔎 カスケード: Vision の信頼度 {score:.2f} ({', '.join(f'{k} {v:.1f}' for k, v in parts.items())})")
+        return {"result": result, "signals": signals, "score": score, "ms": (time.perf_counter() - started) * 1000}
+
+    def _finish_cascade(self, image_buffer: AttachmentBuffer, cheap: dict, winner: str, result: dict, started: float, escalated_at: float):
+        """Flash / Lite へ進んだ解析の統計を記録し、record モードなら Vision と両方の結果を fixture に残す"""
+        self.cascade.record(["vision", winner], time.perf_counter() - started, cheap["score"], accepted=False)
+        if self.cascade.mode == "record":
+            self.cascade.record_fixture(
+                image_buffer.attachment_id, cheap["result"], cheap["signals"], cheap["ms"],
+                winner, result, (time.perf_counter() - escalated_at) * 1000
+            )
+
+    async def _admit_engine(self, engine: str, quota_reserve: int, held: dict) -> bool:
+        """エンジンを呼び出す直前の確認: 回数枠を予約済みか予約でき、遮断されていないか (予約は held に入れる)"""
+        config = self.bot.config
+        async with self.lock:
+            now = datetime.now(JST).timestamp()
+            # 受付時に予約したエンジンはそのまま使い、フォールバック先はここで予約する (他の画像の予約も数える)
+            if not self.reservations.holds(held.get(engine), now):
+                limits = {window: max(0, limit - quota_reserve) for window, limit in config.engine_limits(engine).items()}
+                reservation = self.reservations.reserve(config.rate_limiter, engine, limits, now)
+                if reservation is None:
+                    return False
+                held[engine] = reservation
+        # 他の画像の解析中に遮断された場合や、遮断後の試行が既に送られている場合は飛ばす (予約は返却)
+        if self.router.acquire(engine):
+            return True
+        self.reservations.release(held.pop(engine))
+        return False
+
+    async def _extract_with_engine(self, image_buffer: AttachmentBuffer, engine: str) -> Optional[dict]:
+        if engine == "vision":
+            return await self.extract_all_with_vision(image_buffer)
+        return await self.extract_all_with_gemini(image_buffer, engine)
+
+    def _report_engine_error(self, engine: str, error: BaseException):
+        if isinstance(error, EngineThrottled):
+            # 429エラーを検知
+            print(f"⚠️ {engine.upper()} 429制限検知: 次のモデルへフォールバックします")
+        else:
+            # それ以外のエラーも停止せずに次のエンジンを試す
+            print(f"❌ {engine.upper()} エラー: {error}")
+
+    async def extract_all_with_gemini(self, image_buffer: AttachmentBuffer, model_type: str = "flash") -> Optional[dict]:
+        engine = self.engines.get(model_type)
+        if not engine: return None
         
         try:
-            async with self.bot.session.get(image_url) as resp:
-                if resp.status != 200: return None
-                data = await resp.read()
-            
-            with Image.open(io.BytesIO(data)) as img:
-                # 念のため、メモリ消費を抑えるためにRGBに変換
-                with img.convert("RGB") as img_rgb:
-                    # --- 画像リサイズ (メモリ最適化) ---
-                    # 長辺を 1600px に制限
-                    max_size = 1600
-                    w, h = img_rgb.size
-                    if max(w, h) > max_size:
-                        scale = max_size / max(w, h)
-                        new_size = (int(w * scale), int(h * scale))
-                        # BICUBIC フィルタで高速にリサイズ
-                        img_final = img_rgb.resize(new_size, Image.Resampling.BICUBIC)
-                        print(f"🖼️ 画像リサイズ実行: {w}x{h} -> {new_size[0]}x{new_size[1]}")
-                    else:
-                        img_final = img_rgb
-
-                    prompt = (
-                        "まず、この画像がブロスタ（Brawl Stars）のプロフィール画面かどうかを厳格に判定してください。\n"
-                        "プロフィール画面ではない、あるいは確信が持てない場合は、他の情報を抽出せずに以下のJSONのみを返してください：\n"
-                        "{\"error\": \"not_brawl_stars\"}\n\n"
-                        "プロフィール画面である場合は、以下の3点を抽出してJSON形式で返してください。\n"
-                        "1. name: プレイヤー名。画面中央上部の最も大きく表示されている名前です。絵文字や記号も全て含めてください。全角の数字や記号は全て半角（NFKC規格）に変換してください。\n"
-                        "2. player_id: 左側のキャラアイコンの下にある#から始まる大文字英数字。'O'と'0'は全て'0'（ゼロ）に変換してください。\n"
-                        "3. sc_id: 名前のすぐ下にある、2〜3つの英単語を組み合わせたID（例: HeroicHungryNebula）。IDアイコンの隣にある文字列を正確に抽出してください。\n\n"
-                        "JSONフォーマット（プロフィール画面の場合）: {\"name\": \"...\", \"player_id\": \"...\", \"sc_id\": \"...\"}"
-                    )
-                    
-                    def run_gemini():
-                        return model.generate_content([prompt, img_final])
-                    
-                    response = await asyncio.to_thread(run_gemini)
-                    
-                    # リサイズされた画像オブジェクトがあれば解放
-                    if img_final != img_rgb:
-                        del img_final
-
-            # 重いRawデータを明示的に削除
-            del data
-            if 'img' in locals(): del img
-            if 'img_rgb' in locals(): del img_rgb
+            # デコード・リサイズはプロセスプールで実行 (結果は保存処理と共有)
+            preprocessed = await self.preprocessor.process(image_buffer, self.roi.ratio)
+            w, h = preprocessed.source_size
+            if max(w, h) > MODEL_MAX_SIZE:
+                print(f"🖼️ 画像リサイズ実行: {w}x{h} -> 長辺{MODEL_MAX_SIZE}px")
+            # 注目領域 (上端からの帯) だけを送る
+            cropped = self.roi.use_crop() and preprocessed.model_roi_png is not None
+            payload = preprocessed.model_roi_png if cropped else preprocessed.model_png
+
+            prompt = (
+                "まず、この画像がブロスタ（Brawl Stars）のプロフィール画面かどうかを厳格に判定してください。\n"
+                "プロフィール画面ではない、あるいは確信が持てない場合は、他の情報を抽出せずに以下のJSONのみを返してください：\n"
+                "{\"error\": \"not_brawl_stars\"}\n\n"
+                "プロフィール画面である場合は、以下の3点を抽出してJSON形式で返してください。\n"
+                "1. name: プレイヤー名。画面中央上部の最も大きく表示されている名前です。絵文字や記号も全て含めてください。全角の数字や記号は全て半角（NFKC規格）に変換してください。\n"
+                "2. player_id: 左側のキャラアイコンの下にある#から始まる大文字英数字。'O'と'0'は全て'0'（ゼロ）に変換してください。\n"
+                "3. sc_id: 名前のすぐ下にある、2〜3つの英単語を組み合わせたID（例: HeroicHungryNebula）。IDアイコンの隣にある文字列を正確に抽出してください。\n\n"
+                "JSONフォーマット（プロフィール画面の場合）: {\"name\": \"...\", \"player_id\": \"...\", \"sc_id\": \"...\"}"
+            )
+
+            text, elapsed_ms = await engine.generate([prompt, {"mime_type": "image/png", "data": payload}])
             
             import json as json_lib_local
             # JSON部分を抽出
-            text = response.text
             start = text.find('{')
             end = text.rfind('}') + 1
             if start != -1 and end != -1:
@@ -909,7 +1124,9 @@ class BrawlStarsCog(commands.Cog):
                 
                 # エラー返答チェック
                 if 'error' in result:
+                    self.roi.record(model_type, cropped, len(payload), elapsed_ms, False)
                     return None
+                self.roi.record(model_type, cropped, len(payload), elapsed_ms, bool(result.get('name')))
                 
                 # 正規化
                 if result.get('name'):
@@ -918,20 +1135,20 @@ class BrawlStarsCog(commands.Cog):
                 if result.get('player_id'):
                     result['player_id'] = result['player_id'].replace('O', '0').replace('o', '0')
                 
-                # 最後にガベージコレクションを実行
-                gc.collect()
                 return result
             
-            gc.collect()
+            self.roi.record(model_type, cropped, len(payload), elapsed_ms, False)
             return None
+        except EngineError:
+            # エンジンの失敗 (タイムアウト・429 など) は呼び出し元でフォールバックする
+            raise
         except Exception as e:
             print(f"❌ Gemini抽出エラー: {e}")
-            gc.collect()
             return None
 
-    async def extract_all_with_vision(self, image_url: str) -> Optional[dict]:
+    async def extract_all_with_vision(self, image_buffer: AttachmentBuffer, signals: Optional[dict] = None) -> Optional[dict]:
         # 既存の Vision ロジックを拡張
-        annotations = await self.extract_text_from_image(image_url)
+        annotations = await self.extract_text_from_image(image_buffer)
         if not annotations: return None
         
         full_text = annotations[0].description
@@ -941,7 +1158,8 @@ class BrawlStarsCog(commands.Cog):
         
         # プレイヤー名 (既存のロジックを流用)
         # 二重フェッチを避けるため annotations を直接渡す
-        name_res, _, _ = await self.extract_brawlstars_name_from_annotations(annotations)
+        # signals には逆順カスケードの信頼度の計算に使う手がかりが入る
+        name_res, _, _ = await self.extract_brawlstars_name_from_annotations(annotations, signals)
         if name_res:
              result['name'] = name_res['name']
         
@@ -951,20 +1169,13 @@ class BrawlStarsCog(commands.Cog):
         if player_id_match:
             result['player_id'] = player_id_match.group(0).replace('O', '0')
             
-        # Supercell ID: 通常、名前の下にある英単語の組み合わせ
-        # 特定のプレフィックスに依存せず、位置関係や複数の英単語の連続から推測（Visionでは限界があるが、可能な限り抽出）
-        sc_id_match = re.search(r'[A-Z][a-z]+[A-Z][a-z]+[A-Z][a-z]+', full_text) # CamelCaseパターン
-        if not sc_id_match:
-            sc_id_match = re.search(r'Hero[0-9A-Za-z]+', full_text) # プレフィックス Hero にフォールバック
-            
-        if sc_id_match:
-            result['sc_id'] = sc_id_match.group(0)
-        else:
-            # 緩和された正規表現: 大文字のみや2単語などもカバー
-            # 例: HungryNebula, HEROICNEBULA, BrawlStarsPlayer
-            sc_id_match = re.search(r'[A-Z0-9]{3,}', full_text)
-            if sc_id_match:
-                 result['sc_id'] = sc_id_match.group(0)
+        # Supercell ID: 通常、名前の下にある英単語の組み合わせ (CamelCase)
+        # 形式に合わない文字列 (見出し・タグの断片など) は本人の証拠にならないため採用せず Unknown のままにする
+        # 名前そのものが CamelCase の場合に取り違えないよう、名前と同じ文字列は飛ばす
+        for candidate in full_text.split():
+            if candidate != result['name'] and normalize_sc_id(candidate):
+                result['sc_id'] = candidate
+                break
             
         # プレイヤー名の正規化 (Vision フォールバック用)
         if result.get('name'):
@@ -972,46 +1183,87 @@ class BrawlStarsCog(commands.Cog):
             
         return result
 
-    async def extract_text_from_image(self, image_url: str) -> List[vision.EntityAnnotation]:
-        if not self.vision_client:
+    async def extract_text_from_image(self, image_buffer: AttachmentBuffer) -> List[vision.EntityAnnotation]:
+        engine = self.engines.get("vision")
+        if not engine:
             return []
         
         try:
-            async with self.bot.session.get(image_url) as response:
-                if response.status != 200:
-                    print(f"⚠️ 画像取得失敗: HTTP {response.status}")
-                    return []
-                content_length = response.headers.get('Content-Length')
-                MAX_SIZE = 16 * 1024 * 1024
-                if content_length and int(content_length) > MAX_SIZE:
-                    print(f"⚠️ 画像サイズ超過 (Header): {content_length}")
-                    return []
-                image_data = await response.read()
-                if len(image_data) > MAX_SIZE:
-                        print(f"⚠️ 画像サイズ超過 (Body): {len(image_data)}")
-                        return []
-            
-            image = vision.Image(content=image_data)
-            
-            def run_vision():
-                return self.vision_client.text_detection(image=image)
-            
-            response = await asyncio.to_thread(run_vision)
-            
-            texts = response.text_annotations
+            content = None
+            cropped = False
+            preprocessed = None
+            if self.roi.enabled:
+                # 注目領域 (上端からの帯、元の解像度のまま) だけを送る
+                preprocessed = await self.preprocessor.process(image_buffer, self.roi.ratio)
+                if self.roi.use_crop() and preprocessed.vision_roi is not None:
+                    content = preprocessed.vision_roi
+                    cropped = True
+            if content is None:
+                # ダウンロード済みの画像を送る (サイズ上限・形式は取得時に確認済み。Vision は bytes のみ受け付ける)
+                content = bytes(image_buffer.data)
+            texts, elapsed_ms = await engine.text_detection(content)
+            self.roi.record("vision", cropped, len(content), elapsed_ms, bool(texts))
+            if texts and image_buffer.scale != 1.0:
+                # プロキシで縮小した画像の座標を元の画像の座標に戻す (位置による判定は元の解像度が前提)
+                scale_annotations(texts, image_buffer.scale)
+            if texts and preprocessed is not None and not cropped:
+                # 全体画像の結果から、判定・抽出に必要な文字がどこまで下にあるかを学習
+                bottom = relevant_bottom(texts, self.ANCHOR_KEYWORDS)
+                if bottom is not None:
+                    height = (image_buffer.original_size or preprocessed.source_size)[1]
+                    self.roi.observe(bottom, height)
             return texts if texts else []
-        except aiohttp.ClientError as e:
-            print(f"❌ 画像ダウンロードエラー: {e}")
-            return []
+        except EngineError:
+            raise
         except Exception as e:
             print(f"❌ 画像認識エラー: {e}")
             return []
 
-    async def extract_brawlstars_name(self, image_url: str) -> tuple[Optional[dict], Optional[str], bool]:
-        annotations = await self.extract_text_from_image(image_url)
-        return await self.extract_brawlstars_name_from_annotations(annotations)
+    async def extract_brawlstars_name(self, attachment: discord.Attachment, quota_reserve: int = 0) -> tuple[Optional[dict], Optional[str], bool]:
+        """Vision だけでプレイヤー名を判定する (一括処理用)
 
-    async def extract_brawlstars_name_from_annotations(self, annotations: List[vision.EntityAnnotation]) -> tuple[Optional[dict], Optional[str], bool]:
+        Vision の呼び出しは hybrid_extract_all_info と同じく回数枠を予約してから行い、
+        成功した場合だけ確定・記録します。quota_reserve は投稿・コマンドのために残す件数です。
+        """
+        cache = self.bot.config.ocr_cache
+        attachment_id = attachment.id
+        # 再スキャン済みの添付ファイルならダウンロードも省略 (キャッシュの読み書きはイベントループの外で行う)
+        cached = await asyncio.to_thread(cache.get, "name", attachment_id, record_miss=False)
+        if cached is None:
+            image_buffer = await self.fetcher.fetch_attachment(attachment, "vision")
+            if image_buffer is None:
+                return None, None, False
+            self.fetcher.count_image()
+            cached = await asyncio.to_thread(cache.get, "name", attachment_id, image_buffer)
+            if cached is None:
+                held = {}
+                used = set()
+                try:
+                    if not await self._admit_engine("vision", quota_reserve, held):
+                        print("⚠️ Vision の回数枠が残っていない (または遮断中) ため、この画像を飛ばします")
+                        return None, None, False
+                    try:
+                        annotations = await self.extract_text_from_image(image_buffer)
+                    except EngineError as e:
+                        print(f"❌ 画像認識エラー: {e}")
+                        annotations = []
+                    if annotations:
+                        used.add("vision")
+                finally:
+                    await self._settle_reservations(held, used)
+                extracted = await self.extract_brawlstars_name_from_annotations(annotations)
+                # Vision が何も返さなかった (エラー) 場合は保存しない
+                if annotations:
+                    await asyncio.to_thread(cache.put, "name", image_buffer, list(extracted), "vision", attachment_id)
+                return extracted
+        result, text, is_err002 = cached
+        return result, text, is_err002
+
+    async def extract_brawlstars_name_from_annotations(self, annotations: List[vision.EntityAnnotation], signals: Optional[dict] = None) -> tuple[Optional[dict], Optional[str], bool]:
+        """Vision の文字検出結果からプレイヤー名を取り出す
+
+        signals を渡すと判定に使った手がかり (プロフィールの文字の数・ヘッダーの位置・名前の選び方と候補の高さ) を書き込みます。
+        """
         if not annotations:
             return None, None, False
         
@@ -1031,8 +1283,10 @@ class BrawlStarsCog(commands.Cog):
             pass
 
         # 基本的な検証
-        anchor_keywords = ["トロフィー", "ガチバトル", "勝利数", "ポイント", "最高", "現在", "プロフィール", "シーズン記録", "歴代記録"]
-        if len([kw for kw in anchor_keywords if kw in text]) < 2:
+        anchors = len([kw for kw in self.ANCHOR_KEYWORDS if kw in text])
+        if signals is not None:
+            signals["anchors"] = anchors
+        if anchors < 2:
             return None, text, is_err002
 
         if "報告" in text:
@@ -1078,6 +1332,7 @@ class BrawlStarsCog(commands.Cog):
 
         # 同一行の連結と候補作成
         candidates = []
+        ranked, picked_by = [], None
         if fragments:
             fragments.sort(key=lambda f: f['y'])
             grouped = []
@@ -1128,6 +1383,7 @@ class BrawlStarsCog(commands.Cog):
                 # 従来の高精度ソート（高さを優先し、ほぼ同じなら上を優先）
                 candidates.sort(key=lambda x: (-round(x['height'] / 5) * 5, x['y']))
                 result['name'] = candidates[0]['text']
+                ranked, picked_by = candidates, "height"
             else:
                 # 【適応モード】プロフィール欠損時（今回の特例）
                 # 背景やボタン等を避けるため、一定の高さがあるものから「最も上にあるもの」を選択
@@ -1136,17 +1392,22 @@ class BrawlStarsCog(commands.Cog):
                 if robust_candidates:
                     robust_candidates.sort(key=lambda x: x['y'])
                     result['name'] = robust_candidates[0]['text']
+                    ranked, picked_by = robust_candidates, "position"
                 else:
                     # それでも候補がない場合のフォールバック
                     candidates.sort(key=lambda x: (-round(x['height'] / 15) * 15, x['y']))
                     result['name'] = candidates[0]['text']
+                    ranked, picked_by = candidates, "coarse_height"
         
         # フォールバック
         if not result['name']:
             for i, line in enumerate(lines):
                 if line.startswith('#') and len(line) > 5:
                     if i > 0 and len(lines[i-1]) >= 2:
-                        result['name'] = lines[i-1]; break
+                        result['name'] = lines[i-1]; picked_by = "line"; break
+
+        if signals is not None:
+            signals.update(profile_y=profile_y, picked_by=picked_by, heights=[round(c['height'], 1) for c in ranked[:2]])
         
         return (result if result['name'] else None), text, is_err002
 
@@ -1187,58 +1448,14 @@ class BrawlStarsCog(commands.Cog):
     def create_player_list_embed(self, page=0):
         config = self.bot.config
         
-        # 1. 登録回数でグループ分け
-        priority_players = [] # 2回以上
-        normal_players = []   # 1回
-        
-        for name in config.player_names.keys():
-            count = config.player_register_count.get(name, 1)
-            if count >= 2:
-                priority_players.append((name, count))
-            else:
-                normal_players.append((name, count))
-        
-        # 2. ソート
-        priority_players.sort(key=lambda x: (-x[1], x[0])) # 2回以上は回数降順 -> 名前順
-        normal_players.sort(key=lambda x: x[0])           # 1回は名前順
-        
-        # 3. ページ分割ロジックの再定義
-        # Page 1 (index 0): 要注意プレイヤー
+        # Page 1 (index 0): 要注意プレイヤー (2回以上)
         # Page 2+ (index 1+): 一般プレイヤー (50人ずつ)
+        # 並び替えと本文は player_list_index が保持しており、変更のあったページだけ描画し直される
+        list_index = config.player_list_index
+        page, title, description = list_index.page(page)
+        max_pages = list_index.max_pages
         
-        page_size = 50
-        normal_pages = max(1, (len(normal_players) + page_size - 1) // page_size)
-        max_pages = 1 + normal_pages
-        
-        # 範囲チェック
-        page = max(0, min(page, max_pages - 1))
-        
-        embed = discord.Embed(color=discord.Color.red())
-        lines = []
-        
-        if page == 0:
-            # 要注意プレイヤーのページ
-            embed.title = "🔴 要注意プレイヤーリスト (2回以上報告)"
-            if priority_players:
-                for name, count in priority_players:
-                    lines.append(f"🔴 **{name}** — `{count}回報告`")
-            else:
-                lines.append("該当するプレイヤーはいません。")
-        else:
-            # 一般プレイヤーのページ
-            normal_page_idx = page - 1
-            start_idx = normal_page_idx * page_size
-            end_idx = start_idx + page_size
-            paged_normal = normal_players[start_idx:end_idx]
-            
-            embed.title = f"📋 一般プレイヤーリスト ({normal_page_idx + 1})"
-            if paged_normal:
-                for name, count in paged_normal:
-                    lines.append(f"• **{name}**")
-            else:
-                lines.append("登録者はまだいません。")
-            
-        embed.description = "\n".join(lines)
+        embed = discord.Embed(title=title, description=description, color=discord.Color.red())
         
         footer_text = f"合計: {len(config.player_names)}人 | ページ: {page + 1} / {max_pages}"
         footer_text += f" | 最終更新: {datetime.now(JST).strftime('%H:%M:%S')}"
@@ -1301,7 +1518,7 @@ class BrawlStarsCog(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         # === レートリミットチェック ===
-        is_allowed, error_message, engine = await self.check_and_update_rate_limit(interaction.user.id)
+        is_allowed, error_message, engine, reservation = await self.check_and_update_rate_limit(interaction.user.id)
         if not is_allowed:
              await interaction.followup.send(error_message, ephemeral=True)
              return
@@ -1309,8 +1526,15 @@ class BrawlStarsCog(commands.Cog):
         config = self.bot.config
 
         try:
-            # === 画像解析実行 ===
-            result = await self.hybrid_extract_all_info(image.url, engine)
+            # === 画像解析実行 (ワーカープール経由、返信はこのコマンド内で行うので順序の指定なし) ===
+            async def analyze():
+                try:
+                    image_buffer = await self.fetcher.fetch_attachment(image)
+                    return await self.hybrid_extract_all_info(image_buffer, engine, reservation=reservation) if image_buffer else None
+                finally:
+                    self.reservations.release(reservation)
+            result = await self.scheduler.submit(None, analyze, priority="interactive")
+            self.fetcher.count_image()
             
             if not result or not result.get('name'):
                 await interaction.followup.send("⚠️ プレイヤー名を認識できませんでした。文字が鮮明な画像でもう一度お試しください。", ephemeral=True)
@@ -1331,8 +1555,9 @@ class BrawlStarsCog(commands.Cog):
                 await interaction.followup.send(err_msg_text, ephemeral=True)
                 return
 
-            # 判定
-            if player_name in config.player_names:
+            # 判定 (プレイヤーID → Supercell ID → 名前の順に照合)
+            hazard_name, matched_key = find_hazard(config, player_name, player_id, sc_id)
+            if hazard_name:
                 # ユーザーへのエラーメッセージ
                 err_msg_text = (
                     "✖エラーが発生しました：エラーコード001\n"
@@ -1347,13 +1572,18 @@ class BrawlStarsCog(commands.Cog):
                 if log_channel:
                     embed = discord.Embed(
                         title="⚠️ 要注意人物の来訪 (コマンド経由)",
-                        description=f"プレイヤー: **{player_name}**\n実行者: {interaction.user.mention} ({interaction.user.id})",
+                        description=(
+                            f"プレイヤー: **{player_name}**\n実行者: {interaction.user.mention} ({interaction.user.id})\n"
+                            f"一致: {MATCH_LABELS[matched_key]} (登録名: {hazard_name})"
+                        ),
                         color=discord.Color.red()
                     )
                     embed.set_footer(text=f"判定時刻: {datetime.now(JST).strftime('%Y/%m/%d %H:%M:%S')}")
-                    view = self.HazardDecisionView(self.bot, interaction.user, player_name, player_id, sc_id, interaction.id, interaction.channel_id, self)
+                    view = self.HazardDecisionView(self.bot, interaction.user, player_name, player_id, sc_id, interaction.id, interaction.channel_id, self, hazard_name)
                     await log_channel.send(embed=embed, view=view)
             else:
+                if matched_key == "fuzzy_review":
+                    await self._log_fuzzy_review(interaction.user, player_name, player_id, "コマンド経由")
                 # OK判定: 記録とロール付与
                 # 1. 記録
                 config.check_player_names[player_name] = {
@@ -1363,7 +1593,7 @@ class BrawlStarsCog(commands.Cog):
                     'checked_at': datetime.now(JST).isoformat(),
                     'user_id': interaction.user.id
                 }
-                config.save_check_player_names()
+                config.save_check_player(player_name)
                 print(f"📝 確認ログ記録 (Slash OK): {player_name}")
 
                 # 2. ロール付与
@@ -1403,7 +1633,7 @@ class BrawlStarsCog(commands.Cog):
         old_count = config.player_register_count.pop(old_name, 1)
         config.player_register_count[new_name] = old_count
 
-        config.save_player_names()
+        config.save_player(old_name, new_name)
         await interaction.response.send_message(f"✅ 修正完了：`{old_name}` → `{new_name}`")
 
     @app_commands.command(name="player_delete", description="指定したプレイヤーのデータを削除します")
@@ -1424,7 +1654,7 @@ class BrawlStarsCog(commands.Cog):
         if name in config.player_register_count:
             del config.player_register_count[name]
 
-        config.save_player_names()
+        config.save_player(name)
         await interaction.response.send_message(f"🗑️ 「{name}」のデータを削除しました。")
 
     @app_commands.command(name="scanhistory", description="過去の画像を遡って一括登録")
@@ -1464,12 +1694,22 @@ class BrawlStarsCog(commands.Cog):
             success_count = 0 
             updated_count = 0
             failed_count = 0
+            touched_names = set()
             
             for msg, attachment in messages_with_images:
                 # 一括処理は Vision のみ使用 (Rate limit 考慮)
-                result = await self.hybrid_extract_all_info(attachment.url, "vision")
+                # 優先度 batch: 投稿・コマンドの解析が待っている間は順番を譲り、回数枠も一部を残す
+                async def analyze(attachment=attachment):
+                    image_buffer = await self.fetcher.fetch_attachment(attachment)
+                    return await self.hybrid_extract_all_info(image_buffer, "vision", config.BATCH_QUOTA_RESERVE) if image_buffer else None
+                result = await self.scheduler.submit(None, analyze, priority="batch")
+                self.fetcher.count_image()
                 if result and result.get('name'):
                     player_name = result['name']
+                    touched_names.add(player_name)
+                    known_name, known_key = find_hazard(config, player_name, result.get('player_id'), result.get('sc_id'), fuzzy=False)
+                    if known_key == "player_id" and known_name != player_name and merge_identity(config, known_name, player_name):
+                        touched_names.add(known_name)
                     if player_name in config.player_names:
                         config.player_register_count[player_name] = config.player_register_count.get(player_name, 1) + 1
                         updated_count += 1
@@ -1492,7 +1732,7 @@ class BrawlStarsCog(commands.Cog):
                 else:
                     failed_count += 1
             
-            config.save_player_names()
+            config.save_player(*touched_names)
             elapsed = int((datetime.now(JST) - start_time).total_seconds())
             
             result_embed = discord.Embed(title="📊 過去データ一括登録完了", color=discord.Color.green())
@@ -1531,7 +1771,9 @@ class BrawlStarsCog(commands.Cog):
                     if attachment.content_type and attachment.content_type.startswith('image/'):
                         processed_count += 1
                         # OCRで内容を確認
-                        result, full_text, is_err002 = await self.extract_brawlstars_name(attachment.url)
+                        result, full_text, is_err002 = await self.scheduler.submit(
+                            None, functools.partial(self.extract_brawlstars_name, attachment, config.BATCH_QUOTA_RESERVE), priority="batch"
+                        )
                         
                         # OK信号の条件:
                         # 1. 正常に名前が取れている 
@@ -1540,7 +1782,10 @@ class BrawlStarsCog(commands.Cog):
                         # 4. お荷物リスト（Error 001）にいない
                         if result and result['name'] and not is_err002:
                             player_name = result['name']
-                            is_hazard = player_name in config.player_names
+                            hazard_name, matched_key = find_hazard(config, player_name, result.get('player_id'), result.get('sc_id'))
+                            is_hazard = hazard_name is not None
+                            if matched_key == "fuzzy_review":
+                                await self._log_fuzzy_review(msg.author, player_name, result.get('player_id'), "一括処理")
                             
                             if not is_hazard:
                                 # すでにリアクションが付いていないか確認（簡易チェック）
@@ -1578,6 +1823,7 @@ class BrawlStarsCog(commands.Cog):
         success_count = 0
         role_count = 0
         failed_count = 0
+        touched_names = set()
         
         try:
             guild = target_channel.guild
@@ -1589,10 +1835,15 @@ class BrawlStarsCog(commands.Cog):
                 
                 for attachment in msg.attachments:
                     if attachment.content_type and attachment.content_type.startswith('image/'):
-                        result, _, _ = await self.extract_brawlstars_name(attachment.url)
+                        result, _, _ = await self.scheduler.submit(
+                            None, functools.partial(self.extract_brawlstars_name, attachment, config.BATCH_QUOTA_RESERVE), priority="batch"
+                        )
                         if result and result['name']:
                             player_name = result['name']
-                            is_hazard = player_name in config.player_names
+                            hazard_name, matched_key = find_hazard(config, player_name, result.get('player_id'), result.get('sc_id'))
+                            is_hazard = hazard_name is not None
+                            if matched_key == "fuzzy_review":
+                                await self._log_fuzzy_review(msg.author, player_name, result.get('player_id'), "一括処理")
                             
                             # 記録 (お荷物リストにいない場合のみ一貫性のため)
                             if not is_hazard:
@@ -1604,6 +1855,7 @@ class BrawlStarsCog(commands.Cog):
                                     'batch': True
                                 }
                                 config.check_player_register_count[player_name] = config.check_player_register_count.get(player_name, 0) + 1
+                                touched_names.add(player_name)
                                 success_count += 1
                             
                             # ロール付与 (お荷物でない場合)
@@ -1620,7 +1872,7 @@ class BrawlStarsCog(commands.Cog):
                             failed_count += 1
                         break # 1メッセージ1枚まで
             
-            config.save_check_player_names()
+            config.save_check_player(*touched_names)
             print(f"📊 Batch Check complete: {success_count} recorded, {role_count} roles granted, {failed_count} failed.")
         except Exception as e:
             print(f"❌ Batch Check error: {e}")
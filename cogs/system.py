@@ -140,7 +140,8 @@ class SystemCog(commands.Cog):
                 has_error = True
             
             # 3. 単体テスト
-            test_results = run_unit_tests()
+            # 非同期の部品のテストは専用のイベントループで動かすため、ワーカースレッドで実行
+            test_results = await asyncio.to_thread(run_unit_tests)
             results.extend(test_results)
             if any(r.startswith("❌") for r in test_results):
                 has_error = True
@@ -241,12 +242,10 @@ class SystemCog(commands.Cog):
             if not channel:
                 await interaction.response.send_message("❌ チャンネルを指定してください", ephemeral=True)
                 return
-            config.AUTO_PING_CHANNEL_ID = channel.id
-            config.save_config()
+            config.set_option("auto_ping_channel_id", channel.id)
             await interaction.response.send_message(f"✅ 自動pingを設定: {channel.mention}", ephemeral=True)
         elif action == "off":
-            config.AUTO_PING_CHANNEL_ID = 0
-            config.save_config()
+            config.set_option("auto_ping_channel_id", 0)
             await interaction.response.send_message("✅ 自動pingを無効化", ephemeral=True)
         elif action == "status":
             if config.AUTO_PING_CHANNEL_ID == 0:
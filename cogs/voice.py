@@ -109,14 +109,12 @@ class VoiceCog(commands.Cog):
 
         mode = mode.lower()
         if mode == "on":
-            config.vc_block_enabled = True
-            config.save_config()
+            config.set_option("vc_block_enabled", True)
             await interaction.response.send_message("✅ VC自動切断：ON", ephemeral=True)
             if interaction.user.id != config.OWNER_ID:
                 await log_to_owner(self.bot, config, "action", interaction.user, "/switch", "VC自動切断をONに変更")
         elif mode == "off":
-            config.vc_block_enabled = False
-            config.save_config()
+            config.set_option("vc_block_enabled", False)
             await interaction.response.send_message("⛔ VC自動切断：OFF", ephemeral=True)
             if interaction.user.id != config.OWNER_ID:
                 await log_to_owner(self.bot, config, "action", interaction.user, "/switch", "VC自動切断をOFFに変更")
@@ -142,8 +140,7 @@ class VoiceCog(commands.Cog):
             if user.id in config.BLOCKED_USERS:
                 await interaction.response.send_message(f"⚠️ {user.name} は既に対象ユーザーに追加されています", ephemeral=True)
             else:
-                config.BLOCKED_USERS.add(user.id)
-                config.save_config()
+                config.add_blocked_user(user.id)
                 await interaction.response.send_message(f"✅ {user.name} を対象ユーザーに追加", ephemeral=True)
                 if interaction.user.id != config.OWNER_ID:
                     await log_to_owner(self.bot, config, "action", interaction.user, "/blockuser", f"{user.name} を対象ユーザーに追加")
@@ -151,8 +148,7 @@ class VoiceCog(commands.Cog):
             if user.id not in config.BLOCKED_USERS:
                 await interaction.response.send_message(f"⚠️ {user.name} は対象ユーザーリストに含まれていません", ephemeral=True)
             else:
-                config.BLOCKED_USERS.discard(user.id)
-                config.save_config()
+                config.remove_blocked_user(user.id)
                 await interaction.response.send_message(f"✅ {user.name} を対象ユーザーから削除しました", ephemeral=True)
                 if interaction.user.id != config.OWNER_ID:
                     await log_to_owner(self.bot, config, "action", interaction.user, "/blockuser", f"{user.name} を対象ユーザーから削除")
@@ -184,8 +180,7 @@ class VoiceCog(commands.Cog):
             if vc_int in config.TARGET_VC_IDS:
                 await interaction.response.send_message(f"⚠️ VC {vc} は既に対象に追加されています", ephemeral=True)
             else:
-                config.TARGET_VC_IDS.add(vc_int)
-                config.save_config()
+                config.add_target_vc(vc_int)
                 await interaction.response.send_message(f"✅ VC {vc} を対象に追加", ephemeral=True)
                 if interaction.user.id != config.OWNER_ID:
                     await log_to_owner(self.bot, config, "action", interaction.user, "/blockvc", f"VC {vc} を対象に追加")
@@ -193,8 +188,7 @@ class VoiceCog(commands.Cog):
             if vc_int not in config.TARGET_VC_IDS:
                 await interaction.response.send_message(f"⚠️ VC {vc} は対象VCリストに含まれていません", ephemeral=True)
             else:
-                config.TARGET_VC_IDS.discard(vc_int)
-                config.save_config()
+                config.remove_target_vc(vc_int)
                 await interaction.response.send_message(f"✅ VC {vc} を対象から削除しました", ephemeral=True)
                 if interaction.user.id != config.OWNER_ID:
                     await log_to_owner(self.bot, config, "action", interaction.user, "/blockvc", f"VC {vc} を対象から削除")
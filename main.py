@@ -1,6 +1,8 @@
 import discord
 from discord.ext import commands
 import os
+import asyncio
+import time
 
 from utils.config import ConfigManager
 from utils.discord_helpers import send_error_to_owner
@@ -26,6 +28,9 @@ class MyBot(commands.Bot):
         # 共有のaiohttpセッションを作成
         self.session = aiohttp.ClientSession()
         
+        # 設定・プレイヤー記録のバックグラウンド書き込みを開始
+        self.config.start_flusher()
+        
         # 起動時のバリデーション
         # 起動時のバリデーション
         if self.config.OWNER_ID == 0:
@@ -114,26 +119,17 @@ class MyBot(commands.Bot):
                     else:
                         print("❌ エラー: BrawlStarsCog がロードされていません。")
                 elif command.startswith("ratelimit "):
-                    # ratelimit flash/lite/vision <1h_limit> <24h_limit>
+                    # ratelimit flash/lite/vision/user <1h_limit> <24h_limit>
                     parts = line.strip().split()
-                    if len(parts) != 4 or parts[1] not in ["flash", "lite", "vision"]:
-                        print("⚠️ 使用法: ratelimit flash/lite/vision <1時間あたりの制限> <24時間あたりの制限>")
+                    if len(parts) != 4 or parts[1] not in ["flash", "lite", "vision", "user"]:
+                        print("⚠️ 使用法: ratelimit flash/lite/vision/user <1時間あたりの制限> <24時間あたりの制限>")
                         continue
                     try:
                         target = parts[1]
                         h1 = int(parts[2])
                         h24 = int(parts[3])
-                        if target == "flash":
-                            self.config.RATELIMIT_FLASH_1H = h1
-                            self.config.RATELIMIT_FLASH_24H = h24
-                        elif target == "lite":
-                            self.config.RATELIMIT_LITE_1H = h1
-                            self.config.RATELIMIT_LITE_24H = h24
-                        else:
-                            self.config.RATELIMIT_VISION_1H = h1
-                            self.config.RATELIMIT_VISION_24H = h24
-                        
-                        self.config.save_config()
+                        self.config.set_option(f"ratelimit_{target}_1h", h1)
+                        self.config.set_option(f"ratelimit_{target}_24h", h24)
                         print(f"✅ {target.capitalize()} のレート制限を更新しました: 1時間={h1}, 24時間={h24}")
                     except ValueError:
                         print("❌ エラー: 制限値は整数である必要があります。")
@@ -254,6 +250,407 @@ class MyBot(commands.Bot):
                         self.loop.create_task(cog.batch_collect_images(target=target, limit=limit))
                     else:
                         print("❌ エラー: BrawlStarsCog がロードされていません。")
+                elif command == "persist":
+                    stats = self.config.get_write_stats()
+                    print(
+                        f"💾 書き込み統計: 変更要求 {stats['marks']}件 / 実際の書き込み {stats['writes']}回 "
+                        f"(プレイヤー記録 {stats['player_writes']}回・設定 {stats['state_writes']}回、フラッシュ {stats['flushes']}回) / まとめられた書き込み {stats['coalesced']}件 / 保留中 {stats['pending']}件 "
+                        f"/ 未畳み込みジャーナル {stats['journal_records']}件 / スキャン履歴の追記 {stats['scan_ring_appends']}件"
+                    )
+                elif command == "indexcheck":
+                    # 二次インデックス (user_id / player_id / sc_id) が記録と一致しているか検証
+                    for dataset, problems in self.config.check_indexes().items():
+                        if not problems:
+                            print(f"✅ {dataset}: インデックスは記録と一致しています")
+                            continue
+                        print(f"❌ {dataset}: {len(problems)}件の不整合")
+                        for problem in problems[:20]:
+                            print(f"  - {problem}")
+                    latency = self.config.player_search_index.latency_stats()
+                    print(
+                        f"🔎 オートコンプリート: {latency['searches']}回 / p50 {latency['p50']:.3f}ms "
+                        f"/ p95 {latency['p95']:.3f}ms / 最大 {latency['max']:.3f}ms"
+                    )
+                elif command == "downloads" or command.startswith("downloads "):
+                    # downloads [resize on/off]
+                    cog = self.get_cog("BrawlStarsCog")
+                    if not cog:
+                        print("❌ エラー: BrawlStarsCog がロードされていません。")
+                        continue
+                    parts = command.split()
+                    if len(parts) == 3 and parts[1] == "resize" and parts[2] in ("on", "off"):
+                        self.config.set_option("cdn_resize", parts[2] == "on")
+                        cog.fetcher.proxy_resize = self.config.CDN_RESIZE
+                        print(f"✅ メディアプロキシでの縮小取得を {'有効' if self.config.CDN_RESIZE else '無効'} にしました")
+                        continue
+                    if len(parts) != 1:
+                        print("⚠️ 使用法: downloads [resize on/off]")
+                        continue
+                    stats = cog.fetcher.get_stats()
+                    print(
+                        f"📥 添付画像のダウンロード: {stats['downloads']}回 / {stats['bytes'] / 1024 / 1024:.1f}MB / 処理した画像 {stats['images']}枚 "
+                        f"/ 1枚あたり {stats['downloads_per_image']:.2f}回・{stats['bytes_per_image'] / 1024:.0f}KB・{stats['download_ms_per_image']:.0f}ms "
+                        f"/ 失敗 {stats['failures']}回"
+                    )
+                    print(
+                        f"   縮小取得 ({'有効' if cog.fetcher.proxy_resize else '無効'}): {stats['proxy_downloads']}回 / {stats['proxy_bytes'] / 1024 / 1024:.1f}MB "
+                        f"/ 削減 {stats['original_bytes_avoided'] / 1024 / 1024:.1f}MB / 元画像へのフォールバック {stats['proxy_fallbacks']}回"
+                    )
+                    aborted = ", ".join(f"{reason} {count}回" for reason, count in stats['aborted'].items()) or "なし"
+                    print(f"   最大バッファ {stats['peak_buffer'] / 1024 / 1024:.1f}MB / 中断: {aborted}")
+                elif command == "workers" or command.startswith("workers "):
+                    # workers [<数>] / workers flash/lite/vision <数> / workers image <数> / workers timeout flash/lite/vision <秒>
+                    cog = self.get_cog("BrawlStarsCog")
+                    if not cog:
+                        print("❌ エラー: BrawlStarsCog がロードされていません。")
+                        continue
+                    parts = command.split()
+                    try:
+                        if len(parts) == 2:
+                            self.config.set_option("scan_workers", int(parts[1]))
+                            cog.scheduler.configure(workers=self.config.SCAN_WORKERS)
+                            print(f"✅ 画像解析のワーカー数を {self.config.SCAN_WORKERS} に更新しました")
+                            continue
+                        if len(parts) == 3 and parts[1] == "image":
+                            self.config.set_option("image_workers", int(parts[2]))
+                            cog.preprocessor.resize(self.config.IMAGE_WORKERS)
+                            print(f"✅ 画像前処理のプロセス数を {self.config.IMAGE_WORKERS} に更新しました")
+                            continue
+                        if len(parts) == 3 and parts[1] in self.config.ENGINES:
+                            self.config.set_option(f"scan_cap_{parts[1]}", int(parts[2]))
+                            cog.scheduler.configure(engine_caps=self.config.scan_engine_caps())
+                            print(f"✅ {parts[1].capitalize()} の同時呼び出し数を {parts[2]} に更新しました")
+                            continue
+                        if len(parts) == 4 and parts[1] == "timeout" and parts[2] in self.config.ENGINES:
+                            timeout = float(parts[3])
+                            if timeout <= 0:
+                                print("❌ エラー: 秒数は正の数である必要があります。")
+                                continue
+                            self.config.set_option(f"ocr_timeout_{parts[2]}", timeout)
+                            if parts[2] in cog.engines:
+                                cog.engines[parts[2]].timeout = timeout
+                            print(f"✅ {parts[2].capitalize()} の応答待ちの上限を {timeout:g}秒 に更新しました")
+                            continue
+                    except ValueError:
+                        print("❌ エラー: 数値の形式が正しくありません。")
+                        continue
+                    if len(parts) != 1:
+                        print("⚠️ 使用法: workers [<ワーカー数>] / workers flash/lite/vision <同時呼び出し数> / workers image <プロセス数> / workers timeout flash/lite/vision <秒>")
+                        continue
+                    stats = cog.scheduler.get_stats()
+                    caps = " / ".join(f"{e.upper()} {stats['engine_limits'][e]}/{stats['engine_caps'][e]}" for e in self.config.ENGINES)
+                    print(
+                        f"⚙️ ワーカープール: {stats['running']}/{stats['workers']} 実行中 / 待機 {stats['queued']}件 / 同時呼び出し上限 (現在/設定) {caps}"
+                    )
+                    print(
+                        f"  完了 {stats['completed']}件 (失敗 {stats['failed']}件) / 平均待ち時間 {stats['avg_wait']:.1f}秒 "
+                        f"/ 直近のスループット {stats['images_per_min']:.1f}枚/分"
+                    )
+                    image = cog.preprocessor.get_stats()
+                    print(
+                        f"  画像前処理: {image['workers']}プロセス / {image['images']}枚 (失敗 {image['failures']}枚) "
+                        f"/ 1枚あたり CPU {image['avg_cpu_ms']:.0f}ms・所要 {image['avg_wall_ms']:.0f}ms / ワーカーのピーク RSS {image['peak_rss_kb'] / 1024:.0f}MB"
+                    )
+                    labels = {"interactive": "コマンド", "live": "投稿", "batch": "一括処理"}
+                    for priority, waits in stats['waits'].items():
+                        print(
+                            f"  {labels[priority]:<4}: 待機 {stats['queued_by_class'][priority]}件 / 実行中 {stats['running_by_class'][priority]}件 "
+                            f"/ 待ち時間 p50 {waits['p50']:.1f}秒・p95 {waits['p95']:.1f}秒 ({waits['samples']}件)"
+                        )
+                    for name, engine in cog.engines.items():
+                        e = engine.get_stats()
+                        print(
+                            f"  {name.upper():<6}: 呼び出し {e['calls']}回 (エラー {e['errors']}回・タイムアウト {e['timeouts']}回) "
+                            f"/ 平均 {e['avg_ms']:.0f}ms / 同時実行 最大 {e['max_in_flight']} / 上限 {e['timeout']:g}秒"
+                        )
+                elif command == "roi" or command.startswith("roi "):
+                    # roi [off/on/ab] / roi ratio <0〜1 (0で自動)>
+                    cog = self.get_cog("BrawlStarsCog")
+                    if not cog:
+                        print("❌ エラー: BrawlStarsCog がロードされていません。")
+                        continue
+                    parts = command.split()
+                    if len(parts) == 2 and parts[1] in cog.roi.MODES:
+                        self.config.set_option("roi_mode", parts[1])
+                        cog.roi.mode = self.config.ROI_MODE
+                        print(f"✅ 注目領域の切り出しを '{cog.roi.mode}' に変更しました")
+                        continue
+                    if len(parts) == 3 and parts[1] == "ratio":
+                        try:
+                            ratio = float(parts[2])
+                        except ValueError:
+                            print("❌ エラー: 比率は数値である必要があります。")
+                            continue
+                        self.config.set_option("roi_ratio", ratio)
+                        cog.roi.fixed_ratio = self.config.ROI_RATIO
+                        print(f"✅ 切り出す高さを {'自動' if ratio <= 0 else f'{ratio:.0%}'} に変更しました")
+                        continue
+                    if len(parts) != 1:
+                        print("⚠️ 使用法: roi [off/on/ab] / roi ratio <0〜1 (0で自動)>")
+                        continue
+                    stats = cog.roi.get_stats()
+                    source = "固定" if stats['fixed'] else f"学習 {stats['learned']}件"
+                    print(f"✂️ 注目領域: モード {stats['mode']} / 上端から {stats['ratio']:.0%} ({source})")
+                    labels = {"full": "全体", "cropped": "切り出し"}
+                    for engine, variants in stats['engines'].items():
+                        for variant, s in variants.items():
+                            print(
+                                f"  {engine.upper():<6} {labels[variant]}: {s['calls']}回 / 平均 {s['avg_bytes'] / 1024:.0f}KB "
+                                f"/ 平均 {s['avg_ms']:.0f}ms / 成功率 {s['success_rate']:.0%}"
+                            )
+                elif command == "router" or command.startswith("router "):
+                    # router / router reset [flash/lite/vision] / router target|cooldown <秒> / router failures <回数>
+                    cog = self.get_cog("BrawlStarsCog")
+                    if not cog:
+                        print("❌ エラー: BrawlStarsCog がロードされていません。")
+                        continue
+                    router = cog.router
+                    parts = command.split()
+                    if len(parts) in (2, 3) and parts[1] == "reset" and (len(parts) == 2 or parts[2] in self.config.ENGINES):
+                        router.reset(parts[2] if len(parts) == 3 else None)
+                        print(f"✅ {parts[2].upper() if len(parts) == 3 else '全エンジン'} の遮断と記録をリセットしました")
+                        continue
+                    if len(parts) == 3 and parts[1] in ("target", "cooldown", "failures"):
+                        try:
+                            value = int(parts[2]) if parts[1] == "failures" else float(parts[2])
+                        except ValueError:
+                            print("❌ エラー: 数値の形式が正しくありません。")
+                            continue
+                        if value <= 0:
+                            print("❌ エラー: 正の数を指定してください。")
+                            continue
+                        if parts[1] == "target":
+                            self.config.set_option("router_latency_target", value)
+                            router.latency_target_ms = self.config.ROUTER_LATENCY_TARGET * 1000
+                            print(f"✅ 応答時間の目標 (p90) を {value:g}秒 に変更しました")
+                        elif parts[1] == "cooldown":
+                            self.config.set_option("router_cooldown", value)
+                            router.cooldown = self.config.ROUTER_COOLDOWN
+                            print(f"✅ 遮断してから再び試すまでを {value:g}秒 に変更しました")
+                        else:
+                            self.config.set_option("router_failures", value)
+                            router.failure_threshold = self.config.ROUTER_FAILURES
+                            print(f"✅ {value}回連続で失敗したら遮断するように変更しました")
+                        continue
+                    if len(parts) != 1:
+                        print("⚠️ 使用法: router / router reset [flash/lite/vision] / router target <秒> / router cooldown <秒> / router failures <回数>")
+                        continue
+                    stats = router.get_stats()
+                    order = " → ".join(e.upper() for e in router.order(self.config.ENGINES)) or "なし"
+                    print(
+                        f"🧭 エンジンの選択: 現在の順番 {order} / 目標 p90 {router.latency_target_ms / 1000:g}秒 "
+                        f"/ {router.failure_threshold}回連続の失敗で {router.cooldown:g}秒遮断"
+                    )
+                    states = {"closed": "正常", "open": "遮断中", "half_open": "試行中"}
+                    for engine in self.config.ENGINES:
+                        s = stats.get(engine)
+                        if s is None:
+                            print(f"  {engine.upper():<6}: 記録なし")
+                            continue
+                        p50 = f"{s['p50_ms'] / 1000:.1f}秒" if s['p50_ms'] is not None else "-"
+                        p90 = f"{s['p90_ms'] / 1000:.1f}秒" if s['p90_ms'] is not None else "-"
+                        retry = f" (あと{s['retry_in']:.0f}秒)" if s['state'] == "open" else ""
+                        print(
+                            f"  {engine.upper():<6}: {states[s['state']]}{retry} / 直近 {s['calls']}回 "
+                            f"(失敗率 {s['error_rate']:.0%}・エラー {s['error']}・タイムアウト {s['timeout']}・429 {s['throttled']}・ヘッジで取消 {s['cancelled']}) "
+                            f"/ p50 {p50}・p90 {p90} / 遮断 {s['opens']}回"
+                        )
+                elif command == "hedge" or command.startswith("hedge "):
+                    # hedge [off/on/ab] / hedge delay <秒>
+                    cog = self.get_cog("BrawlStarsCog")
+                    if not cog:
+                        print("❌ エラー: BrawlStarsCog がロードされていません。")
+                        continue
+                    parts = command.split()
+                    if len(parts) == 2 and parts[1] in cog.hedge.MODES:
+                        self.config.set_option("hedge_mode", parts[1])
+                        cog.hedge.mode = self.config.HEDGE_MODE
+                        print(f"✅ ヘッジを '{cog.hedge.mode}' に変更しました")
+                        continue
+                    if len(parts) == 3 and parts[1] == "delay":
+                        try:
+                            delay = float(parts[2])
+                        except ValueError:
+                            print("❌ エラー: 秒数は数値である必要があります。")
+                            continue
+                        self.config.set_option("hedge_min_delay", max(0.0, delay))
+                        cog.hedge.min_delay = self.config.HEDGE_MIN_DELAY
+                        print(f"✅ 予備を開始するまでの最短の待ち時間を {cog.hedge.min_delay:g}秒 に変更しました")
+                        continue
+                    if len(parts) != 1:
+                        print("⚠️ 使用法: hedge [off/on/ab] / hedge delay <秒>")
+                        continue
+                    stats = cog.hedge.get_stats()
+                    print(
+                        f"🔀 ヘッジ: モード {stats['mode']} / 最短 {stats['min_delay']:g}秒 (最初のエンジンの p90 を過ぎたら予備を開始) "
+                        f"/ ヘッジ率 {stats['hedge_rate']:.0%} ({stats['hedged']}/{stats['scans']}件) / 予備の勝ち {stats['backup_wins']}件"
+                    )
+                    for variant, label in (("hedge", "ヘッジあり"), ("plain", "ヘッジなし")):
+                        v = stats[variant]
+                        if not v['samples']:
+                            print(f"  {label}: 記録なし")
+                            continue
+                        print(f"  {label}: {v['samples']}件 / p50 {v['p50']:.1f}秒 / p99 {v['p99']:.1f}秒")
+                    if stats['hedge']['samples'] and stats['plain']['samples']:
+                        print(f"  p99 の短縮: {stats['plain']['p99'] - stats['hedge']['p99']:.1f}秒")
+                elif command == "quota":
+                    # quota: エンジンごとの回数枠の使用数・予約中の数と、次に予約できるまでの時間
+                    cog = self.get_cog("BrawlStarsCog")
+                    if not cog:
+                        print("❌ エラー: BrawlStarsCog がロードされていません。")
+                        continue
+                    now = time.time()
+                    limiter = self.config.rate_limiter
+                    reservations = cog.reservations
+                    for engine in self.config.ENGINES:
+                        limits = self.config.engine_limits(engine)
+                        wait = reservations.retry_after(limiter, engine, limits, now)
+                        print(
+                            f"🎟️ {engine.upper():<6}: 1時間 {limiter.count(engine, 3600, now)}/{limits[3600]} "
+                            f"・24時間 {limiter.count(engine, 86400, now)}/{limits[86400]} / 予約中 {reservations.active(engine, now)}件 "
+                            f"/ 次の予約 {'可能' if wait == 0 else f'{wait / 60:.0f}分後'}"
+                        )
+                    stats = reservations.get_stats(now)
+                    print(
+                        f"  予約 {stats['reserved']}件: 確定 {stats['committed']} / 返却 {stats['released']} / 失効 {stats['expired']} "
+                        f"(期限 {stats['ttl']:g}秒) / 枠不足で予約できず {stats['rejected']}回 / 待機中の画像が終わるまでの目安 {cog.estimate_wait():.0f}秒"
+                    )
+                elif command == "aimd" or command.startswith("aimd "):
+                    # aimd [on/off] / aimd reset [flash/lite/vision] / aimd max flash/lite/vision <同時呼び出し数>
+                    cog = self.get_cog("BrawlStarsCog")
+                    if not cog:
+                        print("❌ エラー: BrawlStarsCog がロードされていません。")
+                        continue
+                    parts = command.split()
+                    if len(parts) == 2 and parts[1] in ("on", "off"):
+                        self.config.set_option("adaptive_concurrency", parts[1] == "on")
+                        cog.concurrency.enabled = self.config.ADAPTIVE_CONCURRENCY
+                        cog.concurrency.reset()
+                        cog.scheduler.configure(engine_caps={})
+                        print(f"✅ 同時呼び出し数の自動調整を {'有効' if cog.concurrency.enabled else '無効'} にしました")
+                        continue
+                    if len(parts) in (2, 3) and parts[1] == "reset" and (len(parts) == 2 or parts[2] in self.config.ENGINES):
+                        cog.concurrency.reset(parts[2] if len(parts) == 3 else None)
+                        cog.scheduler.configure(engine_caps={})
+                        print("✅ 同時呼び出し数の上限を設定の同時呼び出し数に戻しました")
+                        continue
+                    if len(parts) == 4 and parts[1] == "max" and parts[2] in self.config.ENGINES:
+                        try:
+                            ceiling = int(parts[3])
+                        except ValueError:
+                            print("❌ エラー: 数値の形式が正しくありません。")
+                            continue
+                        if ceiling < 1:
+                            print("❌ エラー: 同時呼び出し数は1以上である必要があります。")
+                            continue
+                        self.config.set_option(f"aimd_max_{parts[2]}", ceiling)
+                        cog.concurrency.ceilings.update(self.config.aimd_engine_ceilings())
+                        cog.scheduler.configure(engine_caps={})
+                        print(f"✅ {parts[2].capitalize()} の自動調整の上限を {ceiling} に更新しました")
+                        continue
+                    if len(parts) != 1:
+                        print("⚠️ 使用法: aimd [on/off] / aimd reset [flash/lite/vision] / aimd max flash/lite/vision <同時呼び出し数>")
+                        continue
+                    print(
+                        f"📈 同時呼び出し数の自動調整: {'有効' if cog.concurrency.enabled else '無効'} "
+                        f"(正常な応答で +1/上限・429/タイムアウトで ×{cog.concurrency.decrease:g}、書き出し先 {self.config.ENGINE_STATE_FILE})"
+                    )
+                    stats = cog.concurrency.get_stats()
+                    if not stats:
+                        print("  記録なし")
+                    for engine, e in stats.items():
+                        last_cut = f"{e['last_cut_ago']:.0f}秒前" if e['last_cut_ago'] is not None else "なし"
+                        print(
+                            f"  {engine.upper():<6}: 上限 {e['limit']} (計算値 {e['window']:g} / 開始 {e['initial']} / 最大 {e['ceiling']}) "
+                            f"/ 実行中 {cog.scheduler.engine_running.get(engine, 0)} / 増 {e['increases']}回・減 {e['decreases']}回 "
+                            f"(混雑 {e['congestion']}回) / 最後に下げたのは {last_cut}"
+                        )
+                elif command == "cascade" or command.startswith("cascade "):
+                    # cascade [off/on/record] / cascade threshold <0〜1> / cascade replay
+                    cog = self.get_cog("BrawlStarsCog")
+                    if not cog:
+                        print("❌ エラー: BrawlStarsCog がロードされていません。")
+                        continue
+                    parts = command.split()
+                    if len(parts) == 2 and parts[1] in cog.cascade.MODES:
+                        self.config.set_option("cascade_mode", parts[1])
+                        cog.cascade.mode = self.config.CASCADE_MODE
+                        print(f"✅ 逆順カスケードを '{cog.cascade.mode}' に変更しました")
+                        continue
+                    if len(parts) == 3 and parts[1] == "threshold":
+                        try:
+                            threshold = float(parts[2])
+                        except ValueError:
+                            print("❌ エラー: 閾値は数値である必要があります。")
+                            continue
+                        self.config.set_option("cascade_threshold", min(1.0, max(0.0, threshold)))
+                        cog.cascade.threshold = self.config.CASCADE_THRESHOLD
+                        print(f"✅ Vision の結果を確定する信頼度の閾値を {cog.cascade.threshold:.2f} に変更しました")
+                        continue
+                    if parts[1:] == ["replay"]:
+                        from utils.cascade import load_fixtures, quota_costs, replay
+                        fixtures = load_fixtures(cog.cascade.fixtures_path)
+                        costs = quota_costs({engine: self.config.engine_limits(engine)[86400] for engine in self.config.ENGINES})
+                        print(f"🔎 記録した {len(fixtures)}件の fixture で再現 (コストは Flash 1回 = 1、1日の回数枠の比で換算)")
+                        for threshold in (None, 0.5, 0.6, 0.7, 0.75, 0.8, 0.9):
+                            r = replay(fixtures, threshold, costs)
+                            if not r['images']:
+                                print("  Flash の結果を含む fixture がありません (cascade record で記録してください)")
+                                break
+                            label = "Flash から" if threshold is None else f"閾値 {threshold:.2f}"
+                            print(
+                                f"  {label}: Vision で確定 {r['accept_rate']:.0%} / コスト {r['cost_per_image']:.2f} "
+                                f"/ 平均 {r['avg_ms']:.0f}ms・p90 {r['p90_ms']:.0f}ms / Flash との一致率 名前 {r['agreement']:.1%}・ID {r['id_agreement']:.1%}"
+                            )
+                        continue
+                    if len(parts) != 1:
+                        print("⚠️ 使用法: cascade [off/on/record] / cascade threshold <0〜1> / cascade replay")
+                        continue
+                    stats = cog.cascade.get_stats()
+                    avg_score = f"{stats['avg_score']:.2f}" if stats['avg_score'] is not None else "-"
+                    print(
+                        f"🔎 逆順カスケード: モード {stats['mode']} / 閾値 {stats['threshold']:.2f} / 平均信頼度 {avg_score} "
+                        f"/ Vision で確定 {stats['accept_rate']:.0%} ({stats['accepted']}/{stats['scans']}件) "
+                        f"/ Flash・Lite へ {stats['escalated']}件 (失敗 {stats['escalation_failed']}件) / fixture 記録 {stats['recorded']}件"
+                    )
+                    if stats['scans']:
+                        calls = ", ".join(f"{engine.upper()} {count}回" for engine, count in stats['engine_calls'].items())
+                        print(
+                            f"  呼び出し: {calls} (1枚あたり {stats['calls_per_image']:.2f}回) "
+                            f"/ p50 {stats['p50']:.1f}秒・p90 {stats['p90']:.1f}秒"
+                        )
+                elif command == "ocrcache" or command.startswith("ocrcache "):
+                    # ocrcache [clear]
+                    parts = command.split()
+                    if parts[1:] == ["clear"]:
+                        self.config.ocr_cache.clear()
+                        print("🧹 OCRキャッシュを削除しました")
+                        continue
+                    if len(parts) != 1:
+                        print("⚠️ 使用法: ocrcache [clear]")
+                        continue
+                    stats = self.config.ocr_cache.get_stats()
+                    quota = " / ".join(f"{engine.upper()} {n}回" for engine, n in stats['quota_saved'].items()) or "なし"
+                    print(
+                        f"📦 OCRキャッシュ: {stats['entries']}件 ({stats['total_bytes'] / 1024:.0f}KB / 上限 {stats['max_bytes'] / 1024:.0f}KB) "
+                        f"/ ヒット率 {stats['hit_rate']:.1%} (添付ID {stats['attachment_hits']}回・ハッシュ {stats['hash_hits']}回 / ミス {stats['misses']}回) "
+                        f"/ 削除 {stats['evictions']}件"
+                    )
+                    print(f"  節約: 画像 {stats['bytes_saved'] / 1024 / 1024:.1f}MB 分の解析 / 回数枠 {quota}")
+                elif command == "compact":
+                    self.config.save_config()
+                    print("🗜️ ジャーナルをスナップショットへ畳み込みます...")
+                elif command.startswith("bench"):
+                    # bench <名前> (重い処理なのでスレッドで実行)
+                    from utils.benchmarks import BENCHMARKS
+                    parts = command.split()
+                    if len(parts) != 2 or parts[1] not in BENCHMARKS:
+                        print(f"⚠️ 使用法: bench <{'/'.join(BENCHMARKS)}>")
+                        continue
+                    print(f"⏱️ ベンチマーク '{parts[1]}' を実行中...")
+                    results = await asyncio.to_thread(BENCHMARKS[parts[1]])
+                    for r in results:
+                        print(r)
                 elif command == "help":
                     print("\n" + "="*40)
                     print("📋 フィーロ コンソールコマンド一覧")
@@ -265,10 +662,29 @@ class MyBot(commands.Bot):
                     print("  ratelimit flash <1h> <24h>  - Flashの回数制限を更新")
                     print("  ratelimit lite <1h> <24h>   - Flash-Liteの回数制限を更新")
                     print("  ratelimit vision <1h> <24h> - Visionの回数制限を更新")
+                    print("  ratelimit user <1h> <24h>   - ユーザーごとの回数制限を更新 (0で無効)")
+                    print("  quota               - エンジンごとの回数枠の使用数・予約中の数・次に予約できるまでの時間を表示")
                     print("  testgemini          - Gemini API接続テスト（診断用）")
                     print("  testgroq            - Groq API接続テスト＆モデル確認")
                     print("  collect reports [n] - 報告チャンネルの画像を一括取得")
                     print("  collect checks [n]  - チェックチャンネルの画像を一括取得")
+                    print("  persist             - 書き込み遅延（まとめ書き）の統計を表示")
+                    print("  compact             - 設定ジャーナルをスナップショットへ畳み込む")
+                    print("  downloads [resize on/off] - 添付画像のダウンロード量・時間 (画像1枚あたり)・最大バッファを表示 / プロキシでの縮小取得を切替")
+                    print("  ocrcache [clear]    - OCR結果キャッシュの統計を表示 (clear で全削除)")
+                    print("  workers [n]         - 画像解析のワーカー数を表示・変更")
+                    print("  workers flash <n>   - エンジンごとの同時呼び出し数を変更 (lite/vision も同様)")
+                    print("  workers image <n>   - 画像前処理のプロセス数を変更")
+                    print("  workers timeout flash <秒> - エンジンごとの応答待ちの上限を変更 (lite/vision も同様)")
+                    print("  aimd [on/off]       - 429・タイムアウトに応じた同時呼び出し数の自動調整を表示・切替 / aimd reset [flash] / aimd max flash <数>")
+                    print("  roi [off/on/ab]     - OCRに送る画像の切り出しを表示・変更 (ab で全体と比較)")
+                    print("  roi ratio <r>       - 切り出す高さの比率を固定 (0で自動学習)")
+                    print("  router              - エンジンの健全性・応答時間・遮断状態と選択順を表示")
+                    print("  router reset [flash] - 遮断と記録をリセット / router target|cooldown <秒> / router failures <回数>")
+                    print("  hedge [off/on/ab]   - 遅いエンジンへの予備の並行呼び出しを表示・変更 (ab で比較) / hedge delay <秒>")
+                    print("  cascade [off/on/record] - Vision を先に試し、信頼度が低いときだけ Flash/Lite へ進む / cascade threshold <0〜1> / cascade replay")
+                    print("  indexcheck          - プレイヤー記録の索引を検証し、オートコンプリートの応答時間を表示")
+                    print("  bench <名前>        - ベンチマークを実行 (store/ratelimit/fuzzy/autocomplete/playerlist/burst/priority/preprocess/decode/roi/cdn/engines/router/hedge/cascade/aimd/reserve)")
                     print("  help                - このヘルプを表示")
                     print("="*40 + "\n")
                 elif command == "":
@@ -295,6 +711,8 @@ class MyBot(commands.Bot):
     async def close(self):
         if self.session:
             await self.session.close()
+        # 保留中の書き込みをすべてディスクへ反映
+        await self.config.close()
         await super().close()
 
 bot = MyBot()
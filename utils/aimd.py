@@ -0,0 +1,117 @@
+import json
+import math
+import os
+import time
+from typing import Dict, Optional
+
+# エンジンごとの同時呼び出し数の上限を AIMD (加算増・乗算減) で調整します。
+# 応答が正常な間は少しずつ上限を上げ、429 (回数制限) やタイムアウトが返ったら上限を大きく下げて、
+# 上流がその時点で受け付けられる同時実行数に追従します。
+# 設定の同時呼び出し数 (SCAN_CAP_*) から始めて、自動調整用の上限 (AIMD_MAX_*) まで上げます。
+# 1日・1時間の回数枠 (RATELIMIT_*) はこれまでどおり別に判定し、そちらが超えてはならない上限です。
+
+# 上限を下げる呼び出し結果 (OCR エンジンのアダプターの結果のうち、上流の混雑を示すもの)
+CONGESTION = ("throttled", "timeout")
+
+class EngineWindow:
+    """エンジン1つ分の現在の上限と調整の記録"""
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.last_cut = 0.0   # 最後に上限を下げた時刻
+        self.increases = 0
+        self.decreases = 0
+        self.congestion = 0   # 混雑を示す結果の数 (同じ混雑で下げなかった分も含む)
+
+class AimdController:
+    """エンジンごとの同時呼び出し数の上限 (ScanScheduler.engine_slot が使う)
+
+    ceilings は自動調整で上げられる上限 (エンジン名 -> 上限、設定の AIMD_MAX_*)、
+    initial は最初の上限と無効な場合の上限で、ScanScheduler.engine_caps (設定の SCAN_CAP_*) をそのまま渡します。
+    成功するたびに上限を increase / 現在の上限 だけ上げ (上限いっぱいまで使っていれば、応答1巡ごとにおよそ increase)、
+    429・タイムアウトでは decrease 倍に下げます。下げた後に送った呼び出しの結果が来るまでは、
+    それより前に送っていた呼び出しが失敗しても重ねて下げません (同じ混雑で何度も半分にしないため)。
+    """
+
+    def __init__(self, ceilings: Dict[str, int], initial: Optional[Dict[str, int]] = None, enabled: bool = True,
+                 min_limit: float = 1.0, increase: float = 1.0, decrease: float = 0.5):
+        self.ceilings = ceilings
+        self.initial = initial if initial is not None else ceilings
+        self.enabled = enabled
+        self.min_limit = min_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.windows: Dict[str, EngineWindow] = {}
+
+    def _window(self, engine: str) -> EngineWindow:
+        window = self.windows.get(engine)
+        if window is None:
+            # 最初は設定の同時呼び出し数から始め、正常なら上げ、混雑したら下げる
+            window = self.windows[engine] = EngineWindow(float(self._initial(engine)))
+        return window
+
+    def _ceiling(self, engine: str) -> int:
+        return max(1, self.ceilings.get(engine, 1))
+
+    def _initial(self, engine: str) -> int:
+        return max(1, min(self._ceiling(engine), self.initial.get(engine, self._ceiling(engine))))
+
+    def limit(self, engine: str) -> int:
+        """現在の同時呼び出し数の上限 (無効な場合は設定の同時呼び出し数)"""
+        if not self.enabled:
+            return self._initial(engine)
+        window = self._window(engine)
+        return max(1, min(self._ceiling(engine), math.floor(window.limit)))
+
+    def record(self, engine: str, outcome: str, elapsed_ms: Optional[float], now: Optional[float] = None):
+        """アダプターから呼ばれる: 呼び出し1回分の結果で上限を調整する (取り消しは上限に影響しない)"""
+        if not self.enabled or outcome not in ("ok", *CONGESTION):
+            return
+        now = time.monotonic() if now is None else now
+        window = self._window(engine)
+        ceiling = self._ceiling(engine)
+        # 自動調整の上限が下げられた場合はそれに合わせる
+        window.limit = min(window.limit, float(ceiling))
+        if outcome == "ok":
+            if window.limit < ceiling:
+                window.limit = min(float(ceiling), window.limit + self.increase / window.limit)
+                window.increases += 1
+        elif outcome in CONGESTION:
+            window.congestion += 1
+            started = now - elapsed_ms / 1000
+            if started >= window.last_cut:
+                before = window.limit
+                window.limit = max(self.min_limit, window.limit * self.decrease)
+                window.last_cut = now
+                window.decreases += 1
+                if math.floor(before) != math.floor(window.limit):
+                    print(f"📉 {engine.upper()} の同時呼び出し数を {math.floor(before)} → {math.floor(window.limit)} に下げました ({outcome})")
+
+    def reset(self, engine: Optional[str] = None):
+        """上限を設定の同時呼び出し数に戻し、記録を消す (engine を省略した場合は全エンジン)"""
+        for name in ([engine] if engine else list(self.windows)):
+            self.windows.pop(name, None)
+
+    # ====== 統計 ======
+    def get_stats(self) -> Dict[str, Dict]:
+        stats = {}
+        for engine, window in self.windows.items():
+            stats[engine] = {
+                "limit": self.limit(engine),
+                "window": round(window.limit, 2),
+                "initial": self._initial(engine),
+                "ceiling": self._ceiling(engine),
+                "increases": window.increases,
+                "decreases": window.decreases,
+                "congestion": window.congestion,
+                "last_cut_ago": time.monotonic() - window.last_cut if window.last_cut else None,
+            }
+        return stats
+
+    def export(self, path: str, extra: Optional[Dict] = None):
+        """現在の状態を JSON ファイルに書き出す (ダッシュボード用。書き込み途中のファイルを読まれないよう置き換える)"""
+        state = {"updated_at": time.time(), "enabled": self.enabled, "engines": self.get_stats(), **(extra or {})}
+        temp_file = f"{path}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, path)
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import io
+import time
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+from PIL import Image
+
+from utils.image_pipeline import MODEL_MAX_SIZE
+
+# 受け付ける画像形式の先頭バイト (デコード前に確認する)
+IMAGE_SIGNATURES = (
+    (0, b"\x89PNG\r\n\x1a\n"),
+    (0, b"\xff\xd8\xff"),       # JPEG
+    (0, b"GIF87a"),
+    (0, b"GIF89a"),
+    (8, b"WEBP"),                 # RIFF....WEBP
+)
+SIGNATURE_BYTES = 12
+
+def is_image(head) -> bool:
+    """先頭のバイト列が対応している画像形式か"""
+    return any(bytes(head[offset:offset + len(magic)]) == magic for offset, magic in IMAGE_SIGNATURES)
+
+def image_size(view: memoryview) -> Optional[Tuple[int, int]]:
+    """画像の幅と高さ (ヘッダーだけを読み、画素はデコードしない。読めなければ None)"""
+    try:
+        with Image.open(MemoryReader(view)) as img:
+            return img.size
+    except Exception:
+        return None
+
+class MemoryReader(io.RawIOBase):
+    """memoryview をコピーせずに読み出すファイルオブジェクト (PIL の Image.open などに渡す)"""
+
+    def __init__(self, view: memoryview):
+        super().__init__()
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), len(self._view) - self._pos)
+        if size <= 0:
+            return 0
+        buffer[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._view) + offset
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+class AttachmentBuffer:
+    """1回だけダウンロードした添付画像。解析エンジンと保存処理で同じバッファを共有する"""
+
+    def __init__(self, url: str, data: bytearray, attachment_id: Optional[int] = None,
+                 original_size: Optional[Tuple[int, int]] = None, downloaded_size: Optional[Tuple[int, int]] = None):
+        self.url = url
+        self.attachment_id = attachment_id
+        self.data = data              # ダウンロードしたバッファそのもの (bytes が必要な相手には bytes() で渡す)
+        self.view = memoryview(data)
+        self._sha256: Optional[str] = None
+        self.preprocessed = {}        # roi_ratio -> ImagePreprocessor.process の結果 (解析と保存で共有)
+        # メディアプロキシで縮小した版を取得した場合の元の大きさと、取得した画像の実際の大きさ (縮小していなければ None)
+        self.original_size = original_size
+        self.downloaded_size = downloaded_size
+
+    def __len__(self) -> int:
+        return len(self.view)
+
+    @property
+    def scale(self) -> float:
+        """取得した画像の座標を元の画像の座標に戻す倍率 (縮小していなければ 1.0)"""
+        if not self.original_size or not self.downloaded_size:
+            return 1.0
+        return self.original_size[1] / self.downloaded_size[1]
+
+    @property
+    def sha256(self) -> str:
+        """画像の内容のハッシュ (OCR キャッシュのキー、初回のみ計算)"""
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.view).hexdigest()
+        return self._sha256
+
+    def open(self) -> MemoryReader:
+        """先頭から読み出すファイルオブジェクトを返す（呼び出しごとに独立した読み出し位置）"""
+        return MemoryReader(self.view)
+
+class AttachmentFetcher:
+    """添付画像のダウンロードを担当し、処理した画像あたりのダウンロード量・時間を記録する
+
+    元画像の長辺が PROXY_MAX_SIZE を超える場合は、Discord のメディアプロキシ (proxy_url) に
+    width / height / format を指定してサーバー側で縮小した版を取得します。
+    プロキシからの取得に失敗した場合は元の URL から取得し直します。
+
+    本文は CHUNK_SIZE ずつ読み、事前に確保した bytearray に書き込みます (全体を一度に読み込まない)。
+    用途ごとの上限 (LIMITS) を超えた時点・TIMEOUT 秒を過ぎた時点・先頭が画像形式でないと分かった時点で中断します。
+    """
+
+    # 用途ごとのサイズ上限: 解析 (Gemini / Vision) / Vision のみ (リクエストの上限に合わせる) / 保存
+    LIMITS = {"scan": 16 * 1024 * 1024, "vision": 10 * 1024 * 1024, "save": 16 * 1024 * 1024}
+    CHUNK_SIZE = 64 * 1024
+    # Content-Length がない場合に最初に確保する大きさ (足りなければ倍々で上限まで増やす)
+    INITIAL_BUFFER = 1024 * 1024
+    TIMEOUT = 30
+    # これより大きい画像はプロキシで縮小して取得する (Gemini に渡す大きさに合わせる)
+    PROXY_MAX_SIZE = MODEL_MAX_SIZE
+    # 文字認識に使うため可逆圧縮の WebP を指定する
+    PROXY_PARAMS = {"format": "webp", "quality": "lossless"}
+
+    def __init__(self, bot, proxy_resize: bool = True):
+        self.bot = bot
+        self.proxy_resize = proxy_resize
+        self.stats = {"downloads": 0, "bytes": 0, "images": 0, "failures": 0, "download_ms": 0.0,
+                      "proxy_downloads": 0, "proxy_bytes": 0, "proxy_fallbacks": 0, "original_bytes_avoided": 0,
+                      "aborted": {}, "peak_buffer": 0}
+
+    @classmethod
+    def proxy_variant(cls, proxy_url: str, size: Tuple[int, int]) -> Tuple[str, Tuple[int, int]]:
+        """縮小版の URL と大きさ (縦横比を保って長辺を PROXY_MAX_SIZE にする)"""
+        w, h = size
+        scale = cls.PROXY_MAX_SIZE / max(w, h)
+        target = (max(1, round(w * scale)), max(1, round(h * scale)))
+        parts = urlsplit(proxy_url)
+        # 署名などの既存のクエリはそのまま残す
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                 if k not in ("width", "height", *cls.PROXY_PARAMS)]
+        query += [("width", str(target[0])), ("height", str(target[1])), *cls.PROXY_PARAMS.items()]
+        return urlunsplit(parts._replace(query=urlencode(query))), target
+
+    def _abort(self, reason: str, message: str) -> None:
+        print(f"⚠️ 画像取得中断 ({reason}): {message}")
+        aborted = self.stats["aborted"]
+        aborted[reason] = aborted.get(reason, 0) + 1
+
+    async def _download(self, url: str, purpose: str = "scan") -> Optional[bytearray]:
+        """URL をストリーミングでダウンロードする。失敗・上限超過・タイムアウト・画像以外の場合は None"""
+        limit = self.LIMITS[purpose]
+        start = time.perf_counter()
+        try:
+            async with self.bot.session.get(url, timeout=aiohttp.ClientTimeout(total=self.TIMEOUT)) as response:
+                if response.status != 200:
+                    print(f"⚠️ 画像取得失敗: HTTP {response.status}")
+                    return None
+                content_length = response.content_length
+                if content_length is not None and content_length > limit:
+                    self._abort("too_large", f"Header {content_length} > {limit}")
+                    return None
+                buffer = bytearray(content_length if content_length is not None else min(self.INITIAL_BUFFER, limit))
+                self.stats["peak_buffer"] = max(self.stats["peak_buffer"], len(buffer))
+                size = 0
+                async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                    end = size + len(chunk)
+                    if end > limit:
+                        self._abort("too_large", f"Body > {limit}")
+                        return None
+                    if end > len(buffer):
+                        if content_length is not None:
+                            self._abort("length_mismatch", f"Body > Content-Length {content_length}")
+                            return None
+                        new_size = min(limit, max(len(buffer) * 2, end))
+                        buffer.extend(bytes(new_size - len(buffer)))
+                        self.stats["peak_buffer"] = max(self.stats["peak_buffer"], len(buffer))
+                    buffer[size:end] = chunk
+                    if size < SIGNATURE_BYTES <= end and not is_image(buffer[:SIGNATURE_BYTES]):
+                        self._abort("not_image", url.split("?")[0])
+                        return None
+                    size = end
+        except asyncio.TimeoutError:
+            self._abort("timeout", f"{self.TIMEOUT}秒")
+            return None
+        except aiohttp.ClientError as e:
+            print(f"❌ 画像ダウンロードエラー: {e}")
+            return None
+        self.stats["downloads"] += 1
+        self.stats["bytes"] += size
+        self.stats["download_ms"] += (time.perf_counter() - start) * 1000
+        if size < SIGNATURE_BYTES and not is_image(buffer[:size]):
+            self._abort("not_image", url.split("?")[0])
+            return None
+        # 短かった分を切り詰める (末尾の削除はコピーなし)
+        del buffer[size:]
+        return buffer
+
+    async def fetch(self, url: str, attachment_id: Optional[int] = None, purpose: str = "scan") -> Optional[AttachmentBuffer]:
+        """URL をダウンロードする。失敗・サイズ超過の場合は None"""
+        data = await self._download(url, purpose)
+        if data is None:
+            self.stats["failures"] += 1
+            return None
+        return AttachmentBuffer(url, data, attachment_id)
+
+    async def fetch_attachment(self, attachment, purpose: str = "scan") -> Optional[AttachmentBuffer]:
+        """添付ファイルをダウンロードする (大きい画像はプロキシで縮小した版、失敗したら元の画像)"""
+        width, height = attachment.width, attachment.height
+        if (self.proxy_resize and attachment.proxy_url and width and height
+                and max(width, height) > self.PROXY_MAX_SIZE):
+            url, _ = self.proxy_variant(attachment.proxy_url, (width, height))
+            data = await self._download(url, purpose)
+            if data is not None:
+                self.stats["proxy_downloads"] += 1
+                self.stats["proxy_bytes"] += len(data)
+                if attachment.size:
+                    self.stats["original_bytes_avoided"] += max(0, attachment.size - len(data))
+                # プロキシが指定どおりの大きさで返すとは限らないため、座標の換算には画像のヘッダーの大きさを使う
+                # (読めなければ換算しない)
+                downloaded = image_size(memoryview(data))
+                return AttachmentBuffer(attachment.url, data, attachment.id, (width, height) if downloaded else None, downloaded)
+            self.stats["proxy_fallbacks"] += 1
+            print(f"↩️ 縮小版の取得に失敗したため元の画像を取得します: {attachment.filename}")
+        return await self.fetch(attachment.url, attachment.id, purpose)
+
+    def count_image(self):
+        """画像1枚の処理 (解析 + 保存) が終わったことを記録する"""
+        self.stats["images"] += 1
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["aborted"] = dict(self.stats["aborted"])
+        images = stats["images"]
+        stats["bytes_per_image"] = stats["bytes"] / images if images else 0.0
+        stats["downloads_per_image"] = stats["downloads"] / images if images else 0.0
+        stats["download_ms_per_image"] = stats["download_ms"] / images if images else 0.0
+        stats["avg_download_ms"] = stats["download_ms"] / stats["downloads"] if stats["downloads"] else 0.0
+        return stats
@@ -0,0 +1,896 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from utils.fuzzy_index import FuzzyNameIndex, bounded_levenshtein, fuzzy_key
+from utils.name_search import NameSearchIndex
+from utils.player_list import PlayerListIndex
+from utils.player_store import PlayerStore
+from utils.ratelimit import RateLimiter
+from utils.scan_scheduler import ScanScheduler
+
+# コンソールの `bench <名前>` から呼び出されるベンチマーク集
+# 各関数は run_unit_tests と同じく、表示用の結果行のリストを返します
+
+def _fake_player(i: int) -> dict:
+    return {
+        'name': f"player{i}",
+        'player_id': f"#{i:08X}",
+        'sc_id': f"HeroicHungryNebula{i}",
+        'registered_at': "2025-01-01T00:00:00+09:00",
+        'last_updated': "2025-01-01T00:00:00+09:00"
+    }
+
+def bench_player_store(sizes=(1_000, 10_000, 100_000), saves: int = 50) -> list[str]:
+    """旧JSON全体保存と SQLite 1行保存の保存レイテンシを比較"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            players = {f"player{i}": _fake_player(i) for i in range(size)}
+            counts = {name: 1 for name in players}
+
+            # 旧方式: 保存ごとに全体を indent=2 で書き出して fsync
+            json_path = os.path.join(tmp, f"players_{size}.json")
+            json_saves = max(1, min(saves, 200_000 // size))
+            start = time.perf_counter()
+            for _ in range(json_saves):
+                with open(json_path, "w", encoding="utf-8") as f:
+                    json.dump({'players': players, 'counts': counts}, f, indent=2, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+            json_ms = (time.perf_counter() - start) / json_saves * 1000
+
+            # 新方式: 変更された1行だけを upsert
+            store = PlayerStore(os.path.join(tmp, f"players_{size}.sqlite3"))
+            store.replace_all("players", players, counts)
+            start = time.perf_counter()
+            for i in range(saves):
+                name = f"player{(i * 7919) % size}"
+                counts[name] += 1
+                store.upsert("players", name, players[name], counts[name])
+            row_ms = (time.perf_counter() - start) / saves * 1000
+            store.close()
+
+            results.append(f"📊 {size:>7}人: JSON全体保存 {json_ms:8.2f}ms / SQLite 1行保存 {row_ms:6.3f}ms")
+    return results
+
+def bench_ratelimit(size: int = 10_000, checks: int = 1_000) -> list[str]:
+    """旧リスト内包表記によるレート制限判定とスライディングウィンドウカウンターを比較"""
+    now = time.time()
+    engines = ("flash", "lite", "vision")
+    rng = random.Random(0)
+    history = {e: sorted(now - rng.uniform(0, 86400) for _ in range(size)) for e in engines}
+    limits = {3600: size, 86400: size * 2}
+
+    # 旧方式: 判定ごとに24時間分・1時間分のリストを作り直す
+    start = time.perf_counter()
+    for i in range(checks):
+        t = now + i
+        for e in engines:
+            hist = [ts for ts in history[e] if t - ts < 86400]
+            hist_1h = [ts for ts in hist if t - ts < 3600]
+            if len(hist_1h) < limits[3600] and len(hist) < limits[86400]:
+                break
+    list_us = (time.perf_counter() - start) / checks * 1_000_000
+
+    # 新方式: バケット化したカウンター
+    limiter = RateLimiter()
+    for e in engines:
+        for ts in history[e]:
+            limiter.record(e, ts, now)
+    start = time.perf_counter()
+    for i in range(checks):
+        t = now + i
+        for e in engines:
+            if limiter.allows(e, limits, t):
+                break
+    limiter_us = (time.perf_counter() - start) / checks * 1_000_000
+
+    # 正確さの確認
+    t = now + checks
+    for e in engines:
+        expected = sum(1 for ts in history[e] if t - ts < 3600)
+        if limiter.count(e, 3600, t) != expected:
+            return [f"❌ {e}: 件数が一致しません ({limiter.count(e, 3600, t)} != {expected})"]
+
+    return [f"📊 履歴 {size}件/エンジン: リスト内包表記 {list_us:9.1f}µs / スライディングウィンドウ {limiter_us:6.1f}µs (1判定あたり)"]
+
+def _ocr_noise(name: str, rng: random.Random) -> str:
+    """1文字の置換・欠落・挿入を加える（OCR の読み違いの模擬）"""
+    i = rng.randrange(len(name))
+    op = rng.randrange(3)
+    if op == 0:
+        return name[:i] + rng.choice("abcxyzアイウ★") + name[i + 1:]
+    if op == 1 and len(name) > 1:
+        return name[:i] + name[i + 1:]
+    return name[:i] + rng.choice("abcxyzアイウ★") + name[i:]
+
+def bench_fuzzy(size: int = 50_000, queries: int = 500) -> list[str]:
+    """表記ゆれ検索: bigram 転置インデックスと全件比較の検索時間を比較"""
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789アイウエオカキクケコサシスセソ★ー_"
+    names = list({"".join(rng.choice(alphabet) for _ in range(rng.randint(3, 15))) for _ in range(size)})
+
+    start = time.perf_counter()
+    index = FuzzyNameIndex(max_distance=1)
+    index.rebuild(names)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    probes = [_ocr_noise(rng.choice(names), rng) for _ in range(queries)]
+    latencies = []
+    hits = 0
+    for probe in probes:
+        start = time.perf_counter()
+        if index.search(probe):
+            hits += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    avg_ms = sum(latencies) / len(latencies)
+    p99_ms = latencies[int(len(latencies) * 0.99) - 1]
+
+    # 全件比較 (少数の検索で計測)
+    keys = [fuzzy_key(name) for name in names]
+    linear_queries = probes[:20]
+    start = time.perf_counter()
+    for probe in linear_queries:
+        key = fuzzy_key(probe)
+        [k for k in keys if bounded_levenshtein(key, k, 1) is not None]
+    linear_ms = (time.perf_counter() - start) / len(linear_queries) * 1000
+
+    # 追加・削除の時間
+    start = time.perf_counter()
+    for name in names[:1000]:
+        index.remove(name)
+        index.add(name)
+    update_us = (time.perf_counter() - start) / 1000 * 1_000_000
+
+    return [
+        f"📊 {len(names)}件: 構築 {build_ms:.0f}ms / 削除+追加 {update_us:.1f}µs",
+        f"📊 検索 (距離1): 平均 {avg_ms:.3f}ms / p99 {p99_ms:.3f}ms / ヒット {hits}/{queries}",
+        f"📊 全件比較: {linear_ms:.1f}ms (1検索あたり)",
+    ]
+
+def bench_autocomplete(sizes=(1_000, 10_000, 100_000), queries: int = 300) -> list[str]:
+    """オートコンプリート: 全件の部分一致走査と検索インデックスを比較"""
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789アイウエオカキクケコ★_"
+    results = []
+    for size in sizes:
+        names = list({"".join(rng.choice(alphabet) for _ in range(rng.randint(3, 15))) for _ in range(size)})
+        counts = {name: rng.randint(1, 20) for name in names}
+        # 入力途中の文字列 (登録名の先頭 0〜3文字、または途中の2文字)
+        typed = []
+        for _ in range(queries):
+            name = rng.choice(names)
+            if rng.random() < 0.7:
+                typed.append(name[:rng.randint(0, 3)])
+            else:
+                i = rng.randrange(len(name) - 1)
+                typed.append(name[i:i + 2])
+
+        # 旧方式: 毎回すべての名前を小文字化して部分一致
+        start = time.perf_counter()
+        for current in typed:
+            [name for name in names if current.lower() in name.lower()][:25]
+        scan_ms = (time.perf_counter() - start) / queries * 1000
+
+        index = NameSearchIndex()
+        index.rebuild(names)
+        index.warm(counts)
+        for current in typed:
+            index.search(current, counts)
+        stats = index.latency_stats()
+        results.append(
+            f"📊 {len(names):>7}人: 全件走査 {scan_ms:7.2f}ms / インデックス p50 {stats['p50']:.3f}ms "
+            f"p95 {stats['p95']:.3f}ms 最大 {stats['max']:.3f}ms"
+        )
+    return results
+
+def _legacy_player_list_page(players: dict, counts: dict, page: int, page_size: int = 50) -> str:
+    """旧 create_player_list_embed と同じ処理 (毎回全員を振り分けて並び替える)"""
+    priority_players, normal_players = [], []
+    for name in players:
+        count = counts.get(name, 1)
+        (priority_players if count >= 2 else normal_players).append((name, count))
+    priority_players.sort(key=lambda x: (-x[1], x[0]))
+    normal_players.sort(key=lambda x: x[0])
+    if page == 0:
+        return "\n".join(f"🔴 **{name}** — `{count}回報告`" for name, count in priority_players)
+    start = (page - 1) * page_size
+    return "\n".join(f"• **{name}**" for name, _ in normal_players[start:start + page_size])
+
+def bench_playerlist(sizes=(1_000, 10_000, 100_000), clicks: int = 200) -> list[str]:
+    """/playerlist: ページ切り替えと登録1件ごとの更新を旧方式と比較"""
+    rng = random.Random(0)
+    results = []
+    for size in sizes:
+        players = {f"player{i}": None for i in range(size)}
+        counts = {name: (rng.randint(2, 9) if rng.random() < 0.002 else 1) for name in players}
+        pages = [rng.randint(1, size // 50) for _ in range(clicks)]
+
+        start = time.perf_counter()
+        for page in pages[:20]:
+            _legacy_player_list_page(players, counts, page)
+        legacy_ms = (time.perf_counter() - start) / 20 * 1000
+
+        index = PlayerListIndex()
+        index.rebuild(players, counts)
+        start = time.perf_counter()
+        for page in pages:
+            index.page(page)
+        flip_ms = (time.perf_counter() - start) / clicks * 1000
+
+        # 報告1件 (回数の増加) → 表示中のページを描画
+        start = time.perf_counter()
+        for page in pages:
+            name = f"player{rng.randrange(size)}"
+            counts[name] += 1
+            index.refresh(players, counts, [name])
+            index.page(page)
+        update_ms = (time.perf_counter() - start) / clicks * 1000
+
+        results.append(
+            f"📊 {size:>7}人: 旧方式 {legacy_ms:7.2f}ms / ページ切り替え {flip_ms:.3f}ms / 報告後の再描画 {update_ms:.3f}ms"
+        )
+    return results
+
+# 模擬エンジンの応答時間 (秒)
+SIMULATED_ENGINE_LATENCY = {"flash": (3.0, 6.0), "lite": (2.0, 4.0), "vision": (1.0, 2.0)}
+
+def bench_scan_burst(images: int = 30, channels: int = 3, workers=(1, 3, 5), scale: float = 0.01) -> list[str]:
+    """画像の一斉投稿: 旧 queue_semaphore(1) とワーカープールのスループットを比較
+
+    エンジンの応答時間を模擬した待ち時間で置き換え、scale 倍に縮めて実行します。
+    表示する時間・スループットは縮める前 (実際の所要時間相当) に換算した値です。
+    """
+    rng = random.Random(0)
+    burst = []
+    for i in range(images):
+        engine = ("flash", "lite", "vision")[min(2, i // 10)]
+        burst.append((i % channels, engine, rng.uniform(*SIMULATED_ENGINE_LATENCY[engine])))
+
+    async def run_legacy():
+        semaphore = asyncio.Semaphore(1)
+        async def handle(job):
+            async with semaphore:
+                await asyncio.sleep(job[2] * scale)
+        start = time.perf_counter()
+        await asyncio.gather(*(handle(job) for job in burst))
+        return (time.perf_counter() - start) / scale, True
+
+    async def run_pool(n):
+        scheduler = ScanScheduler(n, {"flash": 2, "lite": 2, "vision": 2})
+        committed = {channel: [] for channel in range(channels)}
+        def analyze(job):
+            async def run():
+                async with scheduler.engine_slot(job[1]):
+                    await asyncio.sleep(job[2] * scale)
+            return run
+        def commit(i, channel):
+            async def run(result, error):
+                committed[channel].append(i)
+            return run
+        start = time.perf_counter()
+        await asyncio.gather(*(scheduler.submit(job[0], analyze(job), commit(i, job[0])) for i, job in enumerate(burst)))
+        elapsed = (time.perf_counter() - start) / scale
+        in_order = all(ids == sorted(ids) for ids in committed.values())
+        return elapsed, in_order
+
+    results = []
+    elapsed, _ = asyncio.run(run_legacy())
+    results.append(f"📊 旧方式 (1枚ずつ): {images}枚 {elapsed:6.1f}秒 / {images * 60 / elapsed:5.1f}枚/分")
+    for n in workers:
+        elapsed, in_order = asyncio.run(run_pool(n))
+        order = "✅ 投稿順" if in_order else "❌ 順序違反"
+        results.append(f"📊 ワーカー{n}: {images}枚 {elapsed:6.1f}秒 / {images * 60 / elapsed:5.1f}枚/分 / 返信順 {order}")
+    return results
+
+def bench_scan_priority(batch: int = 300, live: int = 40, interactive: int = 15, workers: int = 3, scale: float = 0.005) -> list[str]:
+    """一括処理 (大量の /scanhistory) の実行中に投稿・コマンドが来た場合の待ち時間を比較
+
+    旧来の1本の待機列 (全員 FIFO) と優先度クラス付きの待機列で、クラスごとの待ち時間 p50 / p95 を表示します。
+    時間は scale 倍に縮めて実行し、表示は縮める前の秒数に換算します。
+    """
+    rng = random.Random(0)
+    # (到着時刻, クラス, 解析時間): 一括処理は最初にまとめて、投稿・コマンドはその後ぽつぽつ届く
+    arrivals = [(0.0, "batch", rng.uniform(1.0, 2.0)) for _ in range(batch)]
+    arrivals += [(i * 3.0 + rng.uniform(0, 3.0), "live", rng.uniform(3.0, 6.0)) for i in range(live)]
+    arrivals += [(i * 8.0 + rng.uniform(0, 8.0), "interactive", rng.uniform(3.0, 6.0)) for i in range(interactive)]
+    arrivals.sort(key=lambda a: a[0])
+
+    async def run(prioritized: bool):
+        scheduler = ScanScheduler(workers)
+        start = time.perf_counter()
+        tasks = []
+        for at, priority, duration in arrivals:
+            delay = at * scale - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async def analyze(duration=duration):
+                await asyncio.sleep(duration * scale)
+            tasks.append(scheduler.submit(None, analyze, priority=priority if prioritized else "live"))
+        await asyncio.gather(*tasks)
+        if prioritized:
+            return scheduler.wait_stats()
+        # FIFO では全件が live に入るので、到着順に元のクラスへ振り分け直す
+        waits = {"interactive": [], "live": [], "batch": []}
+        for (_, priority, _), wait in zip(arrivals, scheduler.waits["live"]):
+            waits[priority].append(wait)
+        stats = {}
+        for priority, samples in waits.items():
+            samples.sort()
+            stats[priority] = {
+                "samples": len(samples),
+                "p50": samples[len(samples) // 2],
+                "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            }
+        return stats
+
+    labels = {"interactive": "コマンド", "live": "投稿", "batch": "一括処理"}
+    results = []
+    for name, prioritized in (("旧方式 (FIFO)", False), ("優先度クラス", True)):
+        stats = asyncio.run(run(prioritized))
+        line = " / ".join(
+            f"{labels[p]} p50 {stats[p]['p50'] / scale:6.1f}秒・p95 {stats[p]['p95'] / scale:6.1f}秒" for p in ("interactive", "live", "batch")
+        )
+        results.append(f"📊 {name}: {line}")
+    return results
+
+def _fake_screenshots(count: int, size=(2400, 1080), jpeg_only: bool = False, noise: float = 0.0) -> list:
+    """プロフィール画面の代わりに、色の帯と文字のある画像を PNG / JPEG 半々で作る
+
+    noise > 0 の場合は標準偏差 noise のノイズを重ね、実際のスクリーンショットに近いファイルサイズにする
+    """
+    import io
+    from PIL import Image, ImageChops, ImageDraw
+
+    rng = random.Random(0)
+    images = []
+    for i in range(count):
+        img = Image.new("RGB", size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(60):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+            draw.rectangle((x, y, x + rng.randrange(20, 400), y + rng.randrange(20, 200)), fill=color)
+            draw.text((x, y), f"player{rng.randrange(10**6)}", fill=(255, 255, 255))
+        if noise:
+            img = ImageChops.add(img, Image.effect_noise(size, noise).convert("RGB"), offset=-128)
+        out = io.BytesIO()
+        if i % 2 or jpeg_only:
+            img.save(out, "JPEG", quality=92)
+        else:
+            img.save(out, "PNG")
+        images.append(out.getvalue())
+    return images
+
+def bench_preprocess(images: int = 24, workers=(1, 2, 4)) -> list[str]:
+    """画像の前処理 (デコード → Gemini 用 PNG + 保存用 WebP): スレッドプールとプロセスプールの処理速度を比較"""
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    from utils.image_pipeline import preprocess_image
+
+    data = _fake_screenshots(images)
+    results = []
+    pools = [("スレッド", n, ThreadPoolExecutor) for n in (4,)] + [("プロセス", n, ProcessPoolExecutor) for n in workers]
+    for label, n, pool_cls in pools:
+        with pool_cls(max_workers=n) as pool:
+            list(pool.map(preprocess_image, data[:n]))  # プロセスの起動・import を計測から除く
+            start = time.perf_counter()
+            outputs = list(pool.map(preprocess_image, data))
+            elapsed = time.perf_counter() - start
+        cpu_ms = sum(o.cpu_ms for o in outputs) / len(outputs)
+        results.append(f"📊 {label}{n}: {len(data) / elapsed:5.1f}枚/秒 (1枚あたり CPU {cpu_ms:.0f}ms)")
+    return results
+
+def _legacy_preprocess(data: bytes):
+    """旧方式: Gemini 用 (1600px BICUBIC) と保存用 (1280px LANCZOS) で別々にデコードする"""
+    import io
+    from PIL import Image
+    from utils.image_pipeline import PreprocessedImage, peak_rss_kb
+
+    start = time.thread_time()
+    with Image.open(io.BytesIO(data)) as img:
+        with img.convert("RGB") as img_rgb:
+            w, h = img_rgb.size
+            img_final = img_rgb
+            if max(w, h) > 1600:
+                scale = 1600 / max(w, h)
+                img_final = img_rgb.resize((int(w * scale), int(h * scale)), Image.Resampling.BICUBIC)
+            out = io.BytesIO()
+            img_final.save(out, "PNG", compress_level=1)
+            model_png = out.getvalue()
+    with Image.open(io.BytesIO(data)) as img:
+        img_rgb = img.convert("RGB")
+        w, h = img_rgb.size
+        if max(w, h) > 1280:
+            scale = 1280 / max(w, h)
+            img_rgb = img_rgb.resize((int(w * scale), int(h * scale)), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        img_rgb.save(out, "WEBP", quality=75)
+        img_rgb.close()
+    return PreprocessedImage(model_png, out.getvalue(), (w, h), (time.thread_time() - start) * 1000, peak_rss_kb())
+
+def _measure_preprocess(func_name: str, data: list) -> tuple:
+    """ワーカープロセス内で実行: (1枚あたり CPU ms, 処理中に増えたピーク RSS KB)"""
+    from utils import image_pipeline
+    from utils.image_pipeline import peak_rss_kb
+
+    func = _legacy_preprocess if func_name == "legacy" else image_pipeline.preprocess_image
+    baseline = peak_rss_kb()
+    outputs = [func(d) for d in data]
+    return sum(o.cpu_ms for o in outputs) / len(outputs), max(o.peak_rss_kb for o in outputs) - baseline
+
+def bench_decode(images: int = 8) -> list[str]:
+    """デコード1回化: 旧方式 (2回デコード) と draft() + 1回デコードの CPU 時間・ピーク RSS を比較
+
+    スクリーンショット (2400x1080) と、直撮り写真相当の大きい JPEG (4000x3000) で計測します。
+    ピーク RSS はプロセスごとの最大値なので、方式ごとに新しいプロセスで計測します。
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    results = []
+    for label, data in (
+        ("スクリーンショット 2400x1080", _fake_screenshots(images)),
+        ("写真 JPEG 4000x3000", _fake_screenshots(max(2, images // 2), size=(4000, 3000), jpeg_only=True)),
+    ):
+        measured = {}
+        for name in ("legacy", "unified"):
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                measured[name] = pool.submit(_measure_preprocess, name, data).result()
+        (old_cpu, old_rss), (new_cpu, new_rss) = measured["legacy"], measured["unified"]
+        results.append(
+            f"📊 {label}: CPU {old_cpu:.0f}ms → {new_cpu:.0f}ms / ピーク RSS 増加 {old_rss / 1024:.1f}MB → {new_rss / 1024:.1f}MB"
+        )
+    return results
+
+def bench_roi(images: int = 8, ratios=(1.0, 0.7, 0.55)) -> list[str]:
+    """注目領域の切り出し: OCR エンジンへ送るサイズを全体画像と比較 (レイテンシは `roi ab` で実測)"""
+    from utils.image_pipeline import preprocess_image
+
+    data = _fake_screenshots(images)
+    original = sum(len(d) for d in data) / len(data)
+    results = [f"📊 元画像 (Vision に送っていたサイズ): 平均 {original / 1024:.0f}KB"]
+    for ratio in ratios:
+        outputs = [preprocess_image(d, ratio) for d in data]
+        gemini = sum(len(o.model_roi_png or o.model_png) for o in outputs) / len(outputs)
+        vision = sum(len(o.vision_roi or d) for o, d in zip(outputs, data)) / len(outputs)
+        cpu_ms = sum(o.cpu_ms for o in outputs) / len(outputs)
+        results.append(
+            f"📊 上端から {ratio:.0%}: Gemini {gemini / 1024:.0f}KB / Vision {vision / 1024:.0f}KB / 前処理 CPU {cpu_ms:.0f}ms"
+        )
+    return results
+
+def bench_cdn(images: int = 8, bandwidth_mb: float = 4.0) -> list[str]:
+    """添付画像の取得: 元画像と、メディアプロキシで縮小した版 (ローカルの代替サーバー) の転送量・時間を比較"""
+    import types
+    import aiohttp
+    from utils.attachments import AttachmentFetcher
+    from utils.fake_cdn import FakeDiscordCDN
+
+    data = _fake_screenshots(images, noise=8)
+
+    async def run(proxy_resize: bool, fail_proxy: bool = False) -> dict:
+        cdn = FakeDiscordCDN(bandwidth=bandwidth_mb * 1024 * 1024)
+        await cdn.start()
+        cdn.fail_proxy = fail_proxy
+        attachments = [cdn.add(f"screenshot{i}.{'jpg' if i % 2 else 'png'}", d) for i, d in enumerate(data)]
+        async with aiohttp.ClientSession() as session:
+            if proxy_resize and not fail_proxy:
+                # 縮小版の作成はプロキシ側のキャッシュに載った状態で計測する (転送量・時間だけを比較)
+                for attachment in attachments:
+                    url, _ = AttachmentFetcher.proxy_variant(attachment.proxy_url, (attachment.width, attachment.height))
+                    async with session.get(url) as response:
+                        await response.read()
+            fetcher = AttachmentFetcher(types.SimpleNamespace(session=session), proxy_resize)
+            for attachment in attachments:
+                if await fetcher.fetch_attachment(attachment) is None:
+                    raise RuntimeError(f"取得に失敗: {attachment.filename}")
+                fetcher.count_image()
+        await cdn.close()
+        return fetcher.get_stats()
+
+    results = []
+    for label, proxy_resize, fail_proxy in (("元画像", False, False), ("縮小取得", True, False), ("縮小取得 (プロキシ障害)", True, True)):
+        stats = asyncio.run(run(proxy_resize, fail_proxy))
+        results.append(
+            f"📊 {label}: 1枚あたり {stats['bytes_per_image'] / 1024:.0f}KB・{stats['download_ms_per_image']:.0f}ms "
+            f"(回線 {bandwidth_mb:.0f}MB/s 相当) / 縮小取得 {stats['proxy_downloads']}回 / フォールバック {stats['proxy_fallbacks']}回"
+        )
+    return results
+
+def bench_engines(calls: int = 24, latency: float = 0.5) -> list[str]:
+    """OCR エンジン呼び出し: asyncio.to_thread + 同期クライアントと、非同期アダプターを比較 (ローカルの代替クライアント)
+
+    同時に calls 件 (応答 latency 秒) を呼び出し、その間に既定スレッドプールで行う軽い処理
+    (ファイル書き込みなどの代わり) がどれだけ待たされるかも測ります。
+    """
+    from utils.fake_engines import FakeGeminiModel
+    from utils.ocr_engines import EngineTimeout, GeminiEngine
+
+    async def probe_latencies(done: asyncio.Event) -> list:
+        samples = []
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.to_thread(lambda: None)
+            samples.append(time.perf_counter() - started)
+            await asyncio.sleep(0.02)
+        return samples
+
+    async def run(call) -> tuple:
+        done = asyncio.Event()
+        probe = asyncio.create_task(probe_latencies(done))
+        started = time.perf_counter()
+        await asyncio.gather(*(call() for _ in range(calls)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        return elapsed, max(await probe)
+
+    async def legacy():
+        model = FakeGeminiModel(latency)
+        return await run(lambda: asyncio.to_thread(model.generate_content, ["prompt"]))
+
+    async def adapter():
+        engine = GeminiEngine("flash", FakeGeminiModel(latency), timeout=latency * 4)
+        return await run(lambda: engine.generate(["prompt"]))
+
+    async def timeouts():
+        engine = GeminiEngine("flash", FakeGeminiModel(latency * 10), timeout=latency)
+        results = await asyncio.gather(*(engine.generate(["prompt"]) for _ in range(4)), return_exceptions=True)
+        return sum(isinstance(r, EngineTimeout) for r in results), engine.get_stats()
+
+    results = []
+    for label, scenario in (("to_thread + 同期クライアント", legacy), ("非同期アダプター", adapter)):
+        elapsed, probe_max = asyncio.run(scenario())
+        results.append(
+            f"📊 {label}: {calls}件 (応答 {latency:g}秒) の完了まで {elapsed:.2f}秒 / 既定スレッドプールの処理の最大待ち {probe_max * 1000:.0f}ms"
+        )
+    timed_out, stats = asyncio.run(timeouts())
+    results.append(f"📊 タイムアウト ({latency:g}秒): 応答 {latency * 10:g}秒のエンジンで {timed_out}/4件を打ち切り (平均 {stats['avg_ms']:.0f}ms)")
+    return results
+
+def bench_router(images: int = 300, interval: float = 2.0) -> list[str]:
+    """エンジンの選択: 固定順 (Flash → Lite → Vision) とルーターを、障害・遅延を含む模擬的な時系列で比較
+
+    100〜400秒は Flash が 429 を返し (1秒で失敗)、200〜500秒は Lite の応答が 20秒に遅くなる想定です。
+    応答時間・失敗は模擬した値で、時刻も模擬した時計で進めます (実際には待ちません)。
+    """
+    import contextlib
+    import io
+    from utils.engine_router import EngineRouter
+
+    def call(engine: str, t: float, rng: random.Random) -> tuple:
+        if engine == "flash" and 100 <= t < 400:
+            return "throttled", 1.0
+        if engine == "lite" and 200 <= t < 500:
+            return "ok", 20.0
+        return "ok", rng.uniform(*SIMULATED_ENGINE_LATENCY[engine])
+
+    def simulate(router) -> dict:
+        rng = random.Random(0)
+        stats = {"failed_calls": 0, "seconds": 0.0, "over_target": 0, "used": {}}
+        for i in range(images):
+            t = i * interval
+            elapsed = 0.0
+            engines = router.order(("flash", "lite", "vision"), now=t) if router else ("flash", "lite", "vision")
+            for engine in engines:
+                if router and not router.acquire(engine, now=t):
+                    continue
+                outcome, seconds = call(engine, t, rng)
+                elapsed += seconds
+                if router:
+                    router.record(engine, outcome, seconds * 1000, now=t + elapsed)
+                if outcome == "ok":
+                    stats["used"][engine] = stats["used"].get(engine, 0) + 1
+                    break
+                stats["failed_calls"] += 1
+            stats["seconds"] += elapsed
+            stats["over_target"] += elapsed > 15
+        return stats
+
+    results = []
+    for label, router in (("固定順", None), ("ルーター", EngineRouter(latency_target_ms=15000, cooldown=60))):
+        with contextlib.redirect_stdout(io.StringIO()):  # 遮断・回復の通知は表示しない
+            stats = simulate(router)
+        used = " / ".join(f"{e.upper()} {n}" for e, n in stats["used"].items())
+        results.append(
+            f"📊 {label}: 失敗した呼び出し {stats['failed_calls']}回 / 1枚あたり {stats['seconds'] / images:.1f}秒 "
+            f"/ 15秒超 {stats['over_target']}枚 / 使用 {used}"
+        )
+    return results
+
+def bench_hedge(scans: int = 200, concurrency: int = 10, scale: float = 0.01) -> list[str]:
+    """ヘッジ: Flash の応答が時々大きく遅れる場合の応答時間 (p50 / p99) を、ヘッジなしと比較
+
+    Flash は 90% が 3〜6秒・10% が 20〜40秒、予備の Lite は 2〜4秒の想定です (ローカルの代替クライアント)。
+    待ち時間は scale 倍に縮めて実行し、表示は縮める前の秒数に換算しています。
+    """
+    import functools
+    from utils.engine_router import EngineRouter
+    from utils.fake_engines import FakeGeminiModel
+    from utils.hedging import HedgeTracker, run_hedged
+    from utils.ocr_engines import GeminiEngine
+
+    def flash_latency(rng=random.Random(1)) -> float:
+        return (rng.uniform(20, 40) if rng.random() < 0.1 else rng.uniform(3, 6)) * scale
+
+    def lite_latency(rng=random.Random(2)) -> float:
+        return rng.uniform(2, 4) * scale
+
+    async def run(hedging: bool) -> dict:
+        router = EngineRouter()
+        flash = GeminiEngine("flash", FakeGeminiModel(flash_latency), 60 * scale, monitor=router)
+        lite = GeminiEngine("lite", FakeGeminiModel(lite_latency), 60 * scale, monitor=router)
+        tracker = HedgeTracker("on" if hedging else "off", min_delay=3 * scale)
+        charged = {"flash": 0, "lite": 0}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def scan():
+            async with semaphore:
+                started = time.perf_counter()
+                if not hedging:
+                    await flash.generate(["prompt"])
+                    charged["flash"] += 1
+                    tracker.record(False, (time.perf_counter() - started) / scale)
+                    return
+
+                async def launch_backup():
+                    return functools.partial(lite.generate, ["prompt"])
+
+                delay = tracker.delay(router.latency_p90("flash"), flash.timeout)
+                outcome = await run_hedged(functools.partial(flash.generate, ["prompt"]), launch_backup, delay)
+                charged[("flash", "lite")[outcome.winner]] += 1
+                tracker.record(True, (time.perf_counter() - started) / scale, outcome.hedged, outcome.winner == 1)
+
+        await asyncio.gather(*(scan() for _ in range(scans)))
+        stats = tracker.get_stats()
+        stats["charged"] = charged
+        stats["lite_calls"] = lite.stats["calls"]
+        return stats
+
+    plain = asyncio.run(run(False))["plain"]
+    hedge = asyncio.run(run(True))
+    results = [
+        f"📊 ヘッジなし: p50 {plain['p50']:.1f}秒 / p99 {plain['p99']:.1f}秒",
+        f"📊 ヘッジあり: p50 {hedge['hedge']['p50']:.1f}秒 / p99 {hedge['hedge']['p99']:.1f}秒 "
+        f"(p99 が {plain['p99'] - hedge['hedge']['p99']:.1f}秒短縮)",
+        f"📊 ヘッジ率 {hedge['hedge_rate']:.0%} / 予備の勝ち {hedge['backup_wins']}件 / Lite の呼び出し {hedge['lite_calls']}回 "
+        f"/ 消費した回数枠 Flash {hedge['charged']['flash']}・Lite {hedge['charged']['lite']} (計 {scans})",
+    ]
+    return results
+
+def bench_aimd(phases=(6, 2, 5), phase_seconds: float = 60.0, clients: int = 12, cap: int = 2, ceiling: int = 8,
+               latency: float = 1.0, scale: float = 0.01) -> list[str]:
+    """同時呼び出し数の自動調整: 上流が受け付ける同時実行数 (phases の順に変化) に対する追従を、固定の上限と比較
+
+    cap・ceiling は出荷時の設定 (SCAN_CAP_FLASH・AIMD_MAX_FLASH) と同じ値で、自動調整は cap から始めて ceiling まで上げます。
+    Flash の代わりに、同時に受け付ける数を超えた要求へ 429 を返すローカルの代替クライアントを使います。
+    clients 件の解析が絶えず呼び出し続け、429 を受けたら少し待って再び送ります。
+    待ち時間は scale 倍に縮めて実行し、表示は縮める前の秒数に換算しています。
+    """
+    import contextlib
+    import io
+    from utils.aimd import AimdController
+    from utils.fake_engines import FakeThrottlingModel
+    from utils.ocr_engines import EngineThrottled, GeminiEngine
+
+    async def run(cap: int, adaptive: bool) -> dict:
+        started = time.perf_counter()
+        duration = phase_seconds * len(phases) * scale
+
+        def phase() -> int:
+            return min(len(phases) - 1, int((time.perf_counter() - started) / (phase_seconds * scale)))
+
+        scheduler = ScanScheduler(clients, {"flash": cap})
+        controller = AimdController({"flash": ceiling}, scheduler.engine_caps) if adaptive else None
+        scheduler.adaptive = controller
+        model = FakeThrottlingModel(lambda: phases[phase()], latency * scale, throttle_latency=0.1 * scale)
+        flash = GeminiEngine("flash", model, 30 * scale, scheduler.engine_slot, controller)
+        done = [0] * len(phases)
+        throttled = [0] * len(phases)
+        limits = [[] for _ in phases]
+
+        async def client():
+            while time.perf_counter() - started < duration:
+                try:
+                    await flash.generate(["prompt"])
+                    done[phase()] += 1
+                except EngineThrottled:
+                    throttled[phase()] += 1
+                    await asyncio.sleep(0.2 * scale)
+
+        async def sample():
+            while time.perf_counter() - started < duration:
+                limits[phase()].append(scheduler.engine_cap("flash"))
+                await asyncio.sleep(scale)
+
+        await asyncio.gather(sample(), *(client() for _ in range(clients)))
+        return {"done": done, "throttled": throttled, "limits": limits}
+
+    variants = [(f"固定 {ceiling}", ceiling, False), (f"固定 {cap}", cap, False), (f"自動調整 (開始 {cap}・最大 {ceiling})", cap, True)]
+    results = [f"📊 上流が受け付ける同時実行数: {' → '.join(map(str, phases))} (各 {phase_seconds:g}秒) / 応答 {latency:g}秒 / 解析 {clients}件が並行"]
+    for label, cap, adaptive in variants:
+        with contextlib.redirect_stdout(io.StringIO()):  # 上限を下げたときの通知は表示しない
+            r = asyncio.run(run(cap, adaptive))
+        per_phase = []
+        for i, capacity in enumerate(phases):
+            samples = r["limits"][i]
+            tail = samples[len(samples) // 2:] or samples
+            per_phase.append(
+                f"{capacity}: {r['done'][i] / phase_seconds:.1f}件/秒・429 {r['throttled'][i]}回・上限 {sum(tail) / len(tail):.1f}"
+            )
+        results.append(
+            f"📊 {label}: 成功 {sum(r['done'])}件 / 429 {sum(r['throttled'])}回 | " + " | ".join(per_phase)
+        )
+    results.append(f"📊 (理想は各区間で 受け付ける数 ÷ {latency:g}秒 件/秒、上限は各区間の後半の平均)")
+    return results
+
+def bench_reservations(images: int = 20, limits=None, workers: int = 3, cap: int = 2, scale: float = 0.01) -> list[str]:
+    """回数枠の予約: 同時に届いた画像の受付を、残り枠の確認だけの方式と予約する方式で比較
+
+    エンジンの1時間の枠は limits (既定: Flash 10・Lite 5・Vision 15) で、応答時間は SIMULATED_ENGINE_LATENCY に従います。
+    確認だけの方式は、受付では全件が Flash になり、解析中に枠が尽きて他のエンジンへ回る (同時に確認した分だけ上限も超える) 想定です。
+    完了の目安は、確認だけの方式は従来の通知 (10秒 × 待ち件数 / ワーカー数)、予約する方式は estimate_drain で計算します。
+    待ち時間は scale 倍に縮めて実行し、表示は縮める前の秒数に換算しています。
+    """
+    import functools
+    from utils.ratelimit import QuotaReservations
+    from utils.scan_scheduler import estimate_drain
+
+    limits = limits or {"flash": 10, "lite": 5, "vision": 15}
+    engines = list(limits)
+    p90 = {engine: SIMULATED_ENGINE_LATENCY[engine][1] for engine in engines}
+
+    async def run(reserve: bool) -> dict:
+        rng = random.Random(3)
+        limiter = RateLimiter()
+        reservations = QuotaReservations()
+        scheduler = ScanScheduler(workers, {engine: cap for engine in engines})
+        quota = {engine: {3600: limit} for engine, limit in limits.items()}
+        stats = {"used": {e: 0 for e in engines}, "fallbacks": 0, "assigned_ok": 0, "rejected": 0, "estimate_errors": []}
+        started = time.perf_counter()
+        lock = asyncio.Lock()
+
+        async def analyze(assigned: str, reservation, estimate: float):
+            held = {assigned: reservation} if reservation else {}
+            for engine in engines[engines.index(assigned):]:
+                async with lock:
+                    now = time.time()
+                    if reserve:
+                        if not reservations.holds(held.get(engine), now):
+                            held[engine] = reservations.reserve(limiter, engine, quota[engine], now)
+                        admitted = held[engine] is not None
+                    else:
+                        admitted = limiter.allows(engine, quota[engine], now)
+                if not admitted:
+                    stats["fallbacks"] += 1
+                    continue
+                async with scheduler.engine_slot(engine):
+                    await asyncio.sleep(rng.uniform(*SIMULATED_ENGINE_LATENCY[engine]) * scale)
+                async with lock:
+                    limiter.record(engine, time.time())
+                    for name, held_reservation in held.items():
+                        (reservations.commit if name == engine else reservations.release)(held_reservation)
+                stats["used"][engine] += 1
+                stats["assigned_ok"] += int(engine == assigned)
+                break
+            stats["estimate_errors"].append(abs((time.perf_counter() - started) / scale - estimate))
+
+        jobs = []
+        for i in range(images):
+            now = time.time()
+            if reserve:
+                reservation = next(
+                    (r for r in (reservations.reserve(limiter, e, quota[e], now) for e in engines) if r is not None), None
+                )
+                if reservation is None:
+                    stats["rejected"] += 1
+                    continue
+                assigned = reservation.key
+                pending = {e: reservations.active(e, now) for e in engines}
+                estimate = estimate_drain(pending, scheduler.engine_caps, workers, p90)
+            else:
+                assigned = next((e for e in engines if limiter.allows(e, quota[e], now)), None)
+                reservation = None
+                estimate = 10 * -(-(i + 1) // workers)
+            jobs.append(scheduler.submit(None, functools.partial(analyze, assigned, reservation, estimate)))
+        await asyncio.gather(*jobs)
+        stats["seconds"] = (time.perf_counter() - started) / scale
+        return stats
+
+    results = [f"📊 {images}枚を同時に受付 / 1時間の枠 " + "・".join(f"{e.upper()} {n}" for e, n in limits.items()) + f" / ワーカー{workers}"]
+    for label, reserve in (("確認のみ", False), ("予約", True)):
+        r = asyncio.run(run(reserve))
+        over = sum(max(0, r["used"][e] - limits[e]) for e in engines)
+        done = sum(r["used"].values())
+        used = " / ".join(f"{e.upper()} {n}" for e, n in r["used"].items())
+        results.append(
+            f"📊 {label}: 使用 {used} (枠超過 {over}回) / 解析中のフォールバック {r['fallbacks']}回 "
+            f"/ 受付時のエンジンのまま {r['assigned_ok']}/{done}枚 / 受付で断った {r['rejected']}枚 "
+            f"/ 完了の目安の誤差 平均 {sum(r['estimate_errors']) / len(r['estimate_errors']):.1f}秒 / 全体 {r['seconds']:.1f}秒"
+        )
+    return results
+
+def _synthetic_cascade_fixtures(images: int, clean_ratio: float, rng: random.Random) -> list:
+    """cascade record の fixture と同じ形の模擬データ
+
+    きれいなスクリーンショット (clean_ratio) はヘッダー・IDが読め、名前の文字が他の行より十分大きく、
+    Vision の名前もほぼ Flash と一致します。それ以外 (ヘッダー欠け・小さい画像など) は手がかりが欠け、
+    半分以上で名前を読み違える想定です。所要時間は SIMULATED_ENGINE_LATENCY から取ります。
+    """
+    tag_chars = "0289PYLQGRJCUV"
+    fixtures = []
+    for i in range(images):
+        name = f"ぷれいやー{i}★"
+        player_id = "#" + "".join(rng.choice(tag_chars) for _ in range(9))
+        reference = {"name": name, "player_id": player_id, "sc_id": "HeroicHungryNebula"}
+        if rng.random() < clean_ratio:
+            signals = {"anchors": rng.randint(4, 7), "profile_y": rng.uniform(60, 120), "picked_by": "height",
+                       "heights": [rng.uniform(55, 70), rng.uniform(28, 40)]}
+            vision = dict(reference, name=_ocr_noise(name, rng) if rng.random() < 0.02 else name)
+        else:
+            header = rng.random() < 0.4
+            signals = {"anchors": rng.randint(2, 4), "profile_y": rng.uniform(60, 120) if header else None,
+                       "picked_by": "height" if header else "position", "heights": [rng.uniform(36, 44), rng.uniform(34, 42)]}
+            vision = dict(reference, name=_ocr_noise(name, rng) if rng.random() < 0.6 else name)
+            if rng.random() < 0.5:
+                vision["player_id"] = player_id.replace("0", "O", 1) if "0" in player_id else player_id + "X"
+        fixtures.append({
+            "attachment_id": i, "vision": vision, "signals": signals,
+            "vision_ms": rng.uniform(*SIMULATED_ENGINE_LATENCY["vision"]) * 1000,
+            "reference_engine": "flash", "reference": reference,
+            "reference_ms": rng.uniform(*SIMULATED_ENGINE_LATENCY["flash"]) * 1000,
+        })
+    return fixtures
+
+def bench_cascade(path: str = "cascade_fixtures.jsonl", images: int = 1000, clean_ratio: float = 0.8,
+                  thresholds=(0.5, 0.6, 0.7, 0.75, 0.8, 0.9)) -> list[str]:
+    """逆順カスケード: 閾値ごとの1枚あたりのコスト・所要時間・Flash の結果との一致率を、Flash から試す方式と比較
+
+    cascade record で記録した fixture (path) があればそれを使い、なければ模擬データを使います。
+    コストは1日の回数枠 (既定値 Flash 20・Lite 20・Vision 50) の比で、Flash 1回 = 1 に換算しています。
+    """
+    from utils.cascade import load_fixtures, quota_costs, replay
+
+    fixtures = load_fixtures(path)
+    source = f"記録した fixture {len(fixtures)}件 ({path})"
+    if not any(f.get("reference_engine") == "flash" for f in fixtures):
+        fixtures = _synthetic_cascade_fixtures(images, clean_ratio, random.Random(7))
+        source = f"模擬データ {images}件 (きれいな画像 {clean_ratio:.0%})"
+    costs = quota_costs({"flash": 20, "lite": 20, "vision": 50})
+
+    results = [f"📊 {source}"]
+    baseline = replay(fixtures, None, costs)
+    results.append(
+        f"📊 Flash から: コスト {baseline['cost_per_image']:.2f} / 平均 {baseline['avg_ms']:.0f}ms・p90 {baseline['p90_ms']:.0f}ms"
+    )
+    for threshold in thresholds:
+        r = replay(fixtures, threshold, costs)
+        results.append(
+            f"📊 閾値 {threshold:.2f}: Vision で確定 {r['accept_rate']:4.0%} / コスト {r['cost_per_image']:.2f} "
+            f"({r['cost_per_image'] / baseline['cost_per_image']:.0%}) / 平均 {r['avg_ms']:.0f}ms・p90 {r['p90_ms']:.0f}ms "
+            f"/ Flash との一致率 名前 {r['agreement']:.1%}・ID {r['id_agreement']:.1%}"
+        )
+    return results
+
+BENCHMARKS = {
+    "store": bench_player_store,
+    "ratelimit": bench_ratelimit,
+    "fuzzy": bench_fuzzy,
+    "autocomplete": bench_autocomplete,
+    "playerlist": bench_playerlist,
+    "burst": bench_scan_burst,
+    "priority": bench_scan_priority,
+    "preprocess": bench_preprocess,
+    "decode": bench_decode,
+    "roi": bench_roi,
+    "cdn": bench_cdn,
+    "engines": bench_engines,
+    "router": bench_router,
+    "hedge": bench_hedge,
+    "cascade": bench_cascade,
+    "aimd": bench_aimd,
+    "reserve": bench_reservations,
+}
@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 逆順カスケード: 安い Vision を先に試し、その結果の信頼度が閾値未満のときだけ Flash / Lite へ進む
+# 信頼度は Vision の名前判定 (extract_brawlstars_name_from_annotations) が集めた手がかりから計算します。
+#   anchors    ... プロフィール画面の文字 (トロフィー・勝利数 など) がいくつ見つかったか
+#   header     ... 画面上部の「プロフィール」ヘッダーを検出できたか (できなければ位置だけで名前を選ぶ適応モード)
+#   player_id  ... プレイヤーIDがタグとして正しい文字だけでできているか
+#   margin     ... 名前として選んだ行が2番目の候補よりどれだけ大きいか (文字の高さの差の比率)
+
+# Brawl Stars のプレイヤータグに使われる文字 (Supercell のタグは 0289PYLQGRJCUV の14文字のみ)
+PLAYER_TAG = re.compile(r"#[0289PYLQGRJCUV]{3,12}")
+
+# 各手がかりの重み (合計 1.0)
+WEIGHTS = {"anchors": 0.2, "header": 0.3, "player_id": 0.2, "margin": 0.3}
+# この数以上のプロフィールの文字が見つかれば anchors を満点とする
+ANCHOR_SATURATION = 4
+# 名前の行が2番目の候補よりこの比率以上大きければ margin を満点とする
+MARGIN_SATURATION = 0.3
+
+def confidence(signals: Dict, result: Optional[Dict]) -> Tuple[float, Dict[str, float]]:
+    """Vision の結果の信頼度 (0〜1) と、手がかりごとの点数 (0〜1) を返す。名前が取れていなければ 0"""
+    if not result or not result.get("name"):
+        return 0.0, {key: 0.0 for key in WEIGHTS}
+    parts = {
+        "anchors": min(1.0, signals.get("anchors", 0) / ANCHOR_SATURATION),
+        "header": 1.0 if signals.get("profile_y") is not None else 0.0,
+        "player_id": 1.0 if PLAYER_TAG.fullmatch(result.get("player_id") or "") else 0.0,
+        "margin": _margin(signals),
+    }
+    return sum(WEIGHTS[key] * value for key, value in parts.items()), parts
+
+def _margin(signals: Dict) -> float:
+    # 大きさで選んだ場合だけ差を見る (位置や行の並びで選んだ場合は大きさの裏付けがない)
+    if signals.get("picked_by") != "height":
+        return 0.0
+    heights = signals.get("heights") or []
+    if len(heights) < 2:
+        return 1.0
+    first, second = heights[0], heights[1]
+    if first <= 0:
+        return 0.0
+    return max(0.0, min(1.0, (first - second) / first / MARGIN_SATURATION))
+
+def _normalize(value: Optional[str]) -> str:
+    return unicodedata.normalize("NFKC", value or "").strip().casefold()
+
+def agrees(result: Optional[Dict], reference: Optional[Dict], field: str = "name") -> bool:
+    """2つの結果の field が一致するか (NFKC・大文字小文字・前後の空白を無視)"""
+    if not result or not reference:
+        return False
+    return bool(_normalize(reference.get(field))) and _normalize(result.get(field)) == _normalize(reference.get(field))
+
+def quota_costs(daily_limits: Dict[str, int]) -> Dict[str, float]:
+    """1回の呼び出しのコスト: 1日の回数枠の逆数を Flash = 1 にそろえたもの (枠が少ないエンジンほど高い)"""
+    base = daily_limits.get("flash") or 1
+    return {engine: base / limit if limit else 0.0 for engine, limit in daily_limits.items()}
+
+def load_fixtures(path: str) -> List[Dict]:
+    """record モードで記録した fixture (1行1件の JSON) を読み込む。壊れた行は飛ばす"""
+    fixtures = []
+    if not os.path.exists(path):
+        return fixtures
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                fixtures.append(json.loads(line))
+            except ValueError:
+                continue
+    return fixtures
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else None
+
+def replay(fixtures: Iterable[Dict], threshold: Optional[float], costs: Dict[str, float]) -> Dict:
+    """記録した fixture で、閾値 threshold の逆順カスケードを再現する (None なら Flash から始める従来の方式)
+
+    1件あたりのコスト・所要時間 (ms)・Flash の結果との一致率を返します。
+    Vision で確定した場合は Vision の時間だけ、Flash へ進んだ場合は両方の時間がかかったものとして数えます。
+    """
+    fixtures = [f for f in fixtures if f.get("reference_engine") == "flash" and f.get("reference")]
+    cost, latencies, accepted, agree, id_agree = 0.0, [], 0, 0, 0
+    for fixture in fixtures:
+        reference = fixture["reference"]
+        if threshold is None:
+            result, ms, spent = reference, fixture["reference_ms"], costs["flash"]
+        else:
+            score, _ = confidence(fixture["signals"], fixture["vision"])
+            if score >= threshold:
+                accepted += 1
+                result, ms, spent = fixture["vision"], fixture["vision_ms"], costs["vision"]
+            else:
+                result = reference
+                ms = fixture["vision_ms"] + fixture["reference_ms"]
+                spent = costs["vision"] + costs["flash"]
+        cost += spent
+        latencies.append(ms)
+        agree += int(agrees(result, reference))
+        id_agree += int(agrees(result, reference, "player_id"))
+    count = len(fixtures)
+    return {
+        "images": count,
+        "accept_rate": accepted / count if count else 0.0,
+        "cost_per_image": cost / count if count else 0.0,
+        "avg_ms": sum(latencies) / count if count else 0.0,
+        "p50_ms": _percentile(latencies, 0.5),
+        "p90_ms": _percentile(latencies, 0.9),
+        "agreement": agree / count if count else 0.0,
+        "id_agreement": id_agree / count if count else 0.0,
+    }
+
+class CascadeTracker:
+    """逆順カスケードの設定と統計、fixture の記録
+
+    mode: 'off' = 使わない (Flash から試す) / 'on' = Vision の信頼度が threshold 以上なら確定 /
+          'record' = Vision の後に必ず Flash / Lite も呼び、両方の結果を fixtures_path に記録する (閾値の調整用)
+    """
+
+    MODES = ("off", "on", "record")
+
+    def __init__(self, mode: str = "off", threshold: float = 0.75, fixtures_path: str = "cascade_fixtures.jsonl", samples: int = 500):
+        self.mode = mode
+        self.threshold = threshold
+        self.fixtures_path = fixtures_path
+        self.scores: deque = deque(maxlen=samples)
+        self.latencies: deque = deque(maxlen=samples)
+        self.stats = {"scans": 0, "accepted": 0, "escalated": 0, "escalation_failed": 0, "recorded": 0}
+        self.engine_calls: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def accepts(self, score: float) -> bool:
+        """Vision の結果をそのまま確定するか (record モードでは常に Flash / Lite へ進む)"""
+        return self.mode == "on" and score >= self.threshold
+
+    def record(self, engines: List[str], seconds: float, score: float, accepted: bool, escalation_failed: bool = False):
+        """カスケードで解析した1件分 (呼び出したエンジン・所要時間・Vision の信頼度) を記録する"""
+        self.stats["scans"] += 1
+        self.stats["accepted" if accepted else "escalated"] += 1
+        self.stats["escalation_failed"] += int(escalation_failed)
+        for engine in engines:
+            self.engine_calls[engine] = self.engine_calls.get(engine, 0) + 1
+        self.scores.append(score)
+        self.latencies.append(seconds)
+
+    def record_fixture(self, attachment_id: Optional[int], vision_result: Dict, signals: Dict, vision_ms: float,
+                       reference_engine: str, reference: Dict, reference_ms: float):
+        """Vision と Flash / Lite の両方の結果を1行の JSON として追記する"""
+        fixture = {
+            "attachment_id": attachment_id,
+            "vision": vision_result,
+            "signals": signals,
+            "vision_ms": round(vision_ms, 1),
+            "reference_engine": reference_engine,
+            "reference": reference,
+            "reference_ms": round(reference_ms, 1),
+        }
+        try:
+            with open(self.fixtures_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(fixture, ensure_ascii=False) + "\n")
+            self.stats["recorded"] += 1
+        except OSError as e:
+            print(f"❌ カスケードの fixture を保存できませんでした: {e}")
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats["mode"] = self.mode
+        stats["threshold"] = self.threshold
+        stats["accept_rate"] = stats["accepted"] / stats["scans"] if stats["scans"] else 0.0
+        stats["engine_calls"] = dict(self.engine_calls)
+        stats["calls_per_image"] = sum(self.engine_calls.values()) / stats["scans"] if stats["scans"] else 0.0
+        stats["avg_score"] = sum(self.scores) / len(self.scores) if self.scores else None
+        stats["p50"] = _percentile(list(self.latencies), 0.5)
+        stats["p90"] = _percentile(list(self.latencies), 0.9)
+        return stats
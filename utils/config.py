@@ -1,259 +1,800 @@
-import json
-import os
-import shutil
-from typing import Set, Dict, List
-from datetime import datetime, timezone, timedelta
-
-# 日本時間のタイムゾーン
-JST = timezone(timedelta(hours=9))
-
-class ConfigManager:
-    def __init__(self):
-        # Constants
-        self.CONFIG_FILE = "vcblock_config.json"
-        self.PLAYER_NAMES_FILE = "player_names.json"
-        self.CHECK_PLAYER_NAMES_FILE = "check_player_names.json"
-        
-        # 画像保存設定
-        self.IMAGE_BASE_DIR = "images"
-        self.REPORT_IMAGES_DIR = os.path.join(self.IMAGE_BASE_DIR, "reports")
-        self.CHECK_IMAGES_DIR = os.path.join(self.IMAGE_BASE_DIR, "checks")
-        self._ensure_dirs()
-        
-        # 管理者モードの設定
-        self.ADMIN_MODE_TIMEOUT = 120  # 2分（秒）
-        
-        # 状態
-        self.OWNER_ID = int(os.environ.get("OWNER_ID", "0"))
-        self.ADMIN_IDS: Set[int] = set()
-        self.BLOCKED_USERS: Set[int] = set()
-        self.TARGET_VC_IDS: Set[int] = set()
-        self.vc_block_enabled: bool = True
-        self.AUTO_PING_CHANNEL_ID: int = int(os.environ.get("AUTO_PING_CHANNEL_ID", "0"))
-        
-        # レート制限設定 (ブロスタ)
-        # Gemini Flash: 1時間10件、1日20件
-        self.RATELIMIT_FLASH_1H = 10
-        self.RATELIMIT_FLASH_24H = 20
-        # Gemini Lite: 1時間10件、1日20件
-        self.RATELIMIT_LITE_1H = 10
-        self.RATELIMIT_LITE_24H = 20
-        # Vision: 1時間15件、1日50件 (バックアップ用)
-        self.RATELIMIT_VISION_1H = 15
-        self.RATELIMIT_VISION_24H = 50
-        
-        # ブロスタデータ
-        self.player_names = {}
-        self.player_register_count: Dict = {}
-        
-        # チェック結果データ
-        self.check_player_names = {}
-        self.check_player_register_count: Dict = {}
-        
-        # 管理者モードの状態 {user_id: timestamp}
-        self.admin_mode_users: Dict = {}
-        
-        # Initial Load
-        self.load_config()
-        self.load_player_names()
-        self.load_check_player_names()
-        self.load_env_initials()
-        
-        # Validation
-        self.validate_settings()
-
-    def load_env_initials(self):
-        """環境変数が設定されている場合、初期値をロードします"""
-        # 初期対象ユーザー（カンマ区切りで複数指定可能）
-        blocked_str = os.environ.get("INITIAL_BLOCKED_USERS", "")
-        if blocked_str and not self.BLOCKED_USERS: # only if empty
-            try:
-                self.BLOCKED_USERS = set(int(x.strip()) for x in blocked_str.split(",") if x.strip())
-                print(f"📋 環境変数から初期ブロックユーザー読み込み: {len(self.BLOCKED_USERS)}人")
-            except ValueError:
-                pass
-
-        # 初期対象VC（カンマ区切りで複数指定可能）
-        vc_str = os.environ.get("INITIAL_TARGET_VCS", "")
-        if vc_str and not self.TARGET_VC_IDS:
-             try:
-                self.TARGET_VC_IDS = set(int(x.strip()) for x in vc_str.split(",") if x.strip())
-                print(f"📋 環境変数から初期対象VC読み込み: {len(self.TARGET_VC_IDS)}個")
-             except ValueError:
-                pass
-
-
-    def save_config(self):
-        """設定をJSONファイルに保存"""
-        config = {
-            "admin_ids": list(self.ADMIN_IDS),
-            "blocked_users": list(self.BLOCKED_USERS),
-            "target_vc_ids": list(self.TARGET_VC_IDS),
-            "vc_block_enabled": self.vc_block_enabled,
-            "auto_ping_channel_id": self.AUTO_PING_CHANNEL_ID,
-            "ratelimit_flash_1h": self.RATELIMIT_FLASH_1H,
-            "ratelimit_flash_24h": self.RATELIMIT_FLASH_24H,
-            "ratelimit_lite_1h": self.RATELIMIT_LITE_1H,
-            "ratelimit_lite_24h": self.RATELIMIT_LITE_24H,
-            "ratelimit_vision_1h": self.RATELIMIT_VISION_1H,
-            "ratelimit_vision_24h": self.RATELIMIT_VISION_24H
-        }
-        try:
-            temp_file = f"{self.CONFIG_FILE}.tmp"
-            with open(temp_file, "w", encoding="utf-8") as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
-                f.flush()
-                os.fsync(f.fileno())
-            os.replace(temp_file, self.CONFIG_FILE)
-            print(f"💾 設定を保存しました")
-        except Exception as e:
-            print(f"❌ 設定保存エラー: {e}")
-
-    def load_config(self):
-        """JSONファイルから設定を読み込む"""
-        try:
-            if os.path.exists(self.CONFIG_FILE):
-                with open(self.CONFIG_FILE, "r", encoding="utf-8") as f:
-                    config = json.load(f)
-                self.ADMIN_IDS = set(config.get("admin_ids", []))
-                self.BLOCKED_USERS = set(config.get("blocked_users", []))
-                self.TARGET_VC_IDS = set(config.get("target_vc_ids", []))
-                self.vc_block_enabled = config.get("vc_block_enabled", True)
-                self.AUTO_PING_CHANNEL_ID = config.get("auto_ping_channel_id", 0)
-                self.RATELIMIT_FLASH_1H = config.get("ratelimit_flash_1h", 10)
-                self.RATELIMIT_FLASH_24H = config.get("ratelimit_flash_24h", 20)
-                self.RATELIMIT_LITE_1H = config.get("ratelimit_lite_1h", 10)
-                self.RATELIMIT_LITE_24H = config.get("ratelimit_lite_24h", 20)
-                self.RATELIMIT_VISION_1H = config.get("ratelimit_vision_1h", 15)
-                self.RATELIMIT_VISION_24H = config.get("ratelimit_vision_24h", 50)
-                print(f"📂 設定を読み込みました")
-            else:
-                print(f"⚠️ 設定ファイルが見つかりません。初期値を使用します")
-                self.save_config()
-        except json.JSONDecodeError as e:
-            print(f"❌ 設定ファイルが破損しています: {e}")
-            if os.path.exists(self.CONFIG_FILE):
-                shutil.copy(self.CONFIG_FILE, f"{self.CONFIG_FILE}.backup")
-            self.save_config()
-        except Exception as e:
-            print(f"❌ 設定の読み込みに失敗しました: {e}")
-
-    def save_player_names(self):
-        """プレイヤー名をJSONに保存"""
-        try:
-            data = {
-                'players': self.player_names,
-                'counts': self.player_register_count
-            }
-            temp_file = f"{self.PLAYER_NAMES_FILE}.tmp"
-            with open(temp_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-                f.flush()
-                os.fsync(f.fileno())
-            os.replace(temp_file, self.PLAYER_NAMES_FILE)
-            print(f"💾 プレイヤー名を保存しました")
-        except Exception as e:
-            print(f"❌ プレイヤー名保存エラー: {e}")
-
-    def load_player_names(self):
-        """プレイヤー名をJSONから読み込み"""
-        try:
-            if os.path.exists(self.PLAYER_NAMES_FILE):
-                with open(self.PLAYER_NAMES_FILE, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                
-                if isinstance(data, dict) and 'players' in data:
-                    self.player_names = data.get('players', {})
-                    self.player_register_count = data.get('counts', {})
-                else:
-                    self.player_names = data
-                    self.player_register_count = {}
-                
-                print(f"📂 プレイヤー名を読み込みました: {len(self.player_names)}人")
-            else:
-                self.player_names = {}
-                self.player_register_count = {}
-        except Exception as e:
-            print(f"❌ プレイヤー名読み込みエラー: {e}")
-            self.player_names = {}
-            self.player_register_count = {}
-
-    def save_check_player_names(self):
-        """確認用プレイヤー名をJSONに保存"""
-        try:
-            data = {
-                'players': self.check_player_names,
-                'counts': self.check_player_register_count
-            }
-            temp_file = f"{self.CHECK_PLAYER_NAMES_FILE}.tmp"
-            with open(temp_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-                f.flush()
-                os.fsync(f.fileno())
-            os.replace(temp_file, self.CHECK_PLAYER_NAMES_FILE)
-            print(f"💾 確認用プレイヤー名を保存しました")
-        except Exception as e:
-            print(f"❌ 確認用プレイヤー名保存エラー: {e}")
-
-    def load_check_player_names(self):
-        """確認用プレイヤー名をJSONから読み込み"""
-        try:
-            if os.path.exists(self.CHECK_PLAYER_NAMES_FILE):
-                with open(self.CHECK_PLAYER_NAMES_FILE, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                if isinstance(data, dict) and 'players' in data:
-                    self.check_player_names = data.get('players', {})
-                    self.check_player_register_count = data.get('counts', {})
-                else:
-                    self.check_player_names = data
-                    self.check_player_register_count = {}
-                print(f"📂 確認用プレイヤー名を読み込みました: {len(self.check_player_names)}人")
-            else:
-                self.check_player_names = {}
-                self.check_player_register_count = {}
-        except Exception as e:
-            print(f"❌ 確認用プレイヤー名読み込みエラー: {e}")
-            self.check_player_names = {}
-            self.check_player_register_count = {}
-
-    def validate_settings(self):
-        """設定項目の整合性チェック"""
-        if self.OWNER_ID == 0:
-            print("⚠️ 警告: OWNER_ID が設定されていません。環境変数を確認してください。")
-        if not self.CONFIG_FILE:
-             print("❌ エラー: CONFIG_FILE が定義されていません。")
-             
-    def is_authorized(self, user_id: int) -> bool:
-        """ユーザーがオーナーまたは管理者かチェック"""
-        return user_id == self.OWNER_ID or user_id in self.ADMIN_IDS
-
-    # ====== 管理者モード管理 ======
-    def is_in_admin_mode(self, user_id: int) -> bool:
-        """ユーザーが管理者モード中かチェック"""
-        if user_id not in self.admin_mode_users:
-            return False
-        last_activity = self.admin_mode_users[user_id]
-        if (datetime.now(JST) - last_activity).total_seconds() > self.ADMIN_MODE_TIMEOUT:
-            del self.admin_mode_users[user_id]
-            return False
-        return True
-
-    def enter_admin_mode(self, user_id: int):
-        """管理者モードに入る"""
-        self.admin_mode_users[user_id] = datetime.now(JST)
-
-    def update_admin_mode(self, user_id: int):
-        """管理者モードのタイムスタンプを更新"""
-        self.admin_mode_users[user_id] = datetime.now(JST)
-
-    def exit_admin_mode(self, user_id: int):
-        """管理者モードから抜ける"""
-        if user_id in self.admin_mode_users:
-            del self.admin_mode_users[user_id]
-
-    def _ensure_dirs(self):
-        """必要なディレクトリを作成"""
-        for d in [self.REPORT_IMAGES_DIR, self.CHECK_IMAGES_DIR]:
-            if not os.path.exists(d):
-                os.makedirs(d)
-                print(f"📁 ディレクトリを作成しました: {d}")
+import asyncio
+import json
+import os
+import shutil
+import time
+from typing import Set, Dict, List, Optional
+from datetime import datetime, timezone, timedelta
+
+from utils.journal import MutationJournal
+from utils.fuzzy_index import FuzzyNameIndex
+from utils.name_search import NameSearchIndex
+from utils.ocr_cache import OCRCache
+from utils.player_index import PlayerIndex
+from utils.player_list import PlayerListIndex
+from utils.player_store import PlayerStore
+from utils.ratelimit import RateLimiter
+from utils.timestamp_ring import TimestampRing
+
+# 日本時間のタイムゾーン
+JST = timezone(timedelta(hours=9))
+
+class ConfigManager:
+    # 設定キー -> 属性名 (スナップショットとジャーナルの "set" 操作で使用)
+    OPTION_ATTRS = {
+        "vc_block_enabled": "vc_block_enabled",
+        "auto_ping_channel_id": "AUTO_PING_CHANNEL_ID",
+        "ratelimit_flash_1h": "RATELIMIT_FLASH_1H",
+        "ratelimit_flash_24h": "RATELIMIT_FLASH_24H",
+        "ratelimit_lite_1h": "RATELIMIT_LITE_1H",
+        "ratelimit_lite_24h": "RATELIMIT_LITE_24H",
+        "ratelimit_vision_1h": "RATELIMIT_VISION_1H",
+        "ratelimit_vision_24h": "RATELIMIT_VISION_24H",
+        "ratelimit_user_1h": "RATELIMIT_USER_1H",
+        "ratelimit_user_24h": "RATELIMIT_USER_24H",
+        "quota_reservation_ttl": "QUOTA_RESERVATION_TTL",
+        "scan_workers": "SCAN_WORKERS",
+        "scan_cap_flash": "SCAN_CAP_FLASH",
+        "scan_cap_lite": "SCAN_CAP_LITE",
+        "scan_cap_vision": "SCAN_CAP_VISION",
+        "adaptive_concurrency": "ADAPTIVE_CONCURRENCY",
+        "aimd_max_flash": "AIMD_MAX_FLASH",
+        "aimd_max_lite": "AIMD_MAX_LITE",
+        "aimd_max_vision": "AIMD_MAX_VISION",
+        "ocr_timeout_flash": "OCR_TIMEOUT_FLASH",
+        "ocr_timeout_lite": "OCR_TIMEOUT_LITE",
+        "ocr_timeout_vision": "OCR_TIMEOUT_VISION",
+        "router_latency_target": "ROUTER_LATENCY_TARGET",
+        "router_cooldown": "ROUTER_COOLDOWN",
+        "router_failures": "ROUTER_FAILURES",
+        "hedge_mode": "HEDGE_MODE",
+        "hedge_min_delay": "HEDGE_MIN_DELAY",
+        "cascade_mode": "CASCADE_MODE",
+        "cascade_threshold": "CASCADE_THRESHOLD",
+        "image_workers": "IMAGE_WORKERS",
+        "roi_mode": "ROI_MODE",
+        "roi_ratio": "ROI_RATIO",
+        "cdn_resize": "CDN_RESIZE",
+    }
+    # エンジン名 (スキャン履歴のキー)
+    ENGINES = ("flash", "lite", "vision")
+    # スキャン履歴のうちエンジン別の辞書を保持するキー
+    GLOBAL_KEY = 0
+    # IDセットのキー -> 属性名 (ジャーナルの "id_add" / "id_remove" 操作で使用)
+    ID_SET_ATTRS = {
+        "admin_ids": "ADMIN_IDS",
+        "blocked_users": "BLOCKED_USERS",
+        "target_vc_ids": "TARGET_VC_IDS",
+    }
+
+    def __init__(self):
+        # Constants
+        # 旧形式の設定・履歴ファイル (初回起動時にスナップショットへ移行されます)
+        self.CONFIG_FILE = "vcblock_config.json"
+        self.PLAYER_NAMES_FILE = "player_names.json"
+        self.CHECK_PLAYER_NAMES_FILE = "check_player_names.json"
+        # プレイヤー記録の保存先 (JSONファイルは初回起動時にここへ移行されます)
+        self.PLAYER_DB_FILE = "players.sqlite3"
+        self.SCAN_HISTORY_FILE = "scan_history.json"
+        # 設定・スキャン履歴の保存先 (スナップショット + 追記専用ジャーナル)
+        self.STATE_SNAPSHOT_FILE = "state_snapshot.json"
+        self.STATE_JOURNAL_FILE = "state_journal.jsonl"
+        # スキャン履歴の保存先 (エンジンごと・ユーザーごとの mmap リングファイル)
+        self.SCAN_RING_DIR = "scan_rings"
+        # OCR 結果のキャッシュ (画像の SHA-256 -> 解析結果、合計サイズの上限を超えたら古いものから削除)
+        self.OCR_CACHE_FILE = "ocr_cache.sqlite3"
+        self.OCR_CACHE_MAX_BYTES = 8 * 1024 * 1024
+        # 逆順カスケードの調整用に記録する Vision と Flash の結果 (1行1件の JSON)
+        self.CASCADE_FIXTURES_FILE = "cascade_fixtures.jsonl"
+        # エンジンごとの同時呼び出し数の上限と調整の状態 (ダッシュボード用に定期的に書き出す)
+        self.ENGINE_STATE_FILE = "engine_concurrency.json"
+        
+        # 画像保存設定
+        self.IMAGE_BASE_DIR = "images"
+        self.REPORT_IMAGES_DIR = os.path.join(self.IMAGE_BASE_DIR, "reports")
+        self.CHECK_IMAGES_DIR = os.path.join(self.IMAGE_BASE_DIR, "checks")
+        self._ensure_dirs()
+        
+        # 管理者モードの設定
+        self.ADMIN_MODE_TIMEOUT = 120  # 2分（秒）
+        
+        # 状態
+        self.OWNER_ID = int(os.environ.get("OWNER_ID", "0"))
+        self.ADMIN_IDS: Set[int] = set()
+        self.BLOCKED_USERS: Set[int] = set()
+        self.TARGET_VC_IDS: Set[int] = set()
+        self.vc_block_enabled: bool = True
+        self.AUTO_PING_CHANNEL_ID: int = int(os.environ.get("AUTO_PING_CHANNEL_ID", "0"))
+        
+        # レート制限設定 (ブロスタ)
+        # Gemini Flash: 1時間10件、1日20件
+        self.RATELIMIT_FLASH_1H = 10
+        self.RATELIMIT_FLASH_24H = 20
+        # Gemini Lite: 1時間10件、1日20件
+        self.RATELIMIT_LITE_1H = 10
+        self.RATELIMIT_LITE_24H = 20
+        # Vision: 1時間15件、1日50件 (バックアップ用)
+        self.RATELIMIT_VISION_1H = 15
+        self.RATELIMIT_VISION_24H = 50
+        # ユーザーごと: 0 の場合は無効
+        self.RATELIMIT_USER_1H = 0
+        self.RATELIMIT_USER_24H = 0
+        # 受付時に確保したエンジンの回数枠の予約が、確定も返却もされずに失効するまでの秒数 (ジョブの異常終了対策)
+        self.QUOTA_RESERVATION_TTL = 600.0
+
+        # 画像解析のワーカープール: 同時に解析する画像数と、エンジンごとの同時呼び出し数
+        self.SCAN_WORKERS = 3
+        self.SCAN_CAP_FLASH = 2
+        self.SCAN_CAP_LITE = 2
+        self.SCAN_CAP_VISION = 2
+        # エンジンごとの同時呼び出し数を、429・タイムアウトで下げ正常な応答で少しずつ上げる
+        # (SCAN_CAP_* から始めて AIMD_MAX_* まで。無効な場合は SCAN_CAP_* のまま)
+        self.ADAPTIVE_CONCURRENCY = True
+        self.AIMD_MAX_FLASH = 8
+        self.AIMD_MAX_LITE = 8
+        self.AIMD_MAX_VISION = 8
+        # エンジン呼び出しの応答待ちの上限 (秒)。超えたら次のエンジンへフォールバック
+        self.OCR_TIMEOUT_FLASH = 30.0
+        self.OCR_TIMEOUT_LITE = 20.0
+        self.OCR_TIMEOUT_VISION = 15.0
+        # エンジンの選択: 直近の p90 応答時間の目標 (秒、超えたエンジンは後回し)・
+        # 連続でこの回数失敗したら遮断する回数・遮断してから再び試すまでの秒数
+        self.ROUTER_LATENCY_TARGET = 15.0
+        self.ROUTER_FAILURES = 3
+        self.ROUTER_COOLDOWN = 120.0
+        # ヘッジ (最初のエンジンが遅いときに次のエンジンも並行して呼び出す): 'off' / 'on' / 'ab' (使う・使わないを交互に比較)
+        # 予備を開始するのは最初のエンジンの直近の p90 を過ぎたとき (HEDGE_MIN_DELAY 秒未満にはしない)
+        self.HEDGE_MODE = "off"
+        self.HEDGE_MIN_DELAY = 3.0
+        # 逆順カスケード (安い Vision を先に試し、信頼度が CASCADE_THRESHOLD 未満のときだけ Flash / Lite へ進む):
+        # 'off' / 'on' / 'record' (常に Flash / Lite も呼び、両方の結果を CASCADE_FIXTURES_FILE に記録して閾値を調整する)
+        self.CASCADE_MODE = "off"
+        self.CASCADE_THRESHOLD = 0.75
+        # 画像の前処理 (デコード・リサイズ・エンコード) に使うプロセス数
+        self.IMAGE_WORKERS = 2
+        # OCR エンジンへ送る画像の切り出し: 'off' / 'on' / 'ab' (全体と切り出しを交互に送って比較)
+        # ROI_RATIO は上端から切り出す高さの比率 (0 の場合は Vision の結果から学習)
+        self.ROI_MODE = "on"
+        self.ROI_RATIO = 0.0
+        # 大きい添付画像を Discord のメディアプロキシで縮小してから取得する
+        self.CDN_RESIZE = True
+        # 一括処理 (/scanhistory など) が使わずに残す回数枠 (各ウィンドウの上限からこの件数を引いて判定)
+        self.BATCH_QUOTA_RESERVE = 3
+        
+        # ブロスタデータ
+        self.player_names = {}
+        self.player_register_count: Dict = {}
+        
+        # チェック結果データ
+        self.check_player_names = {}
+        self.check_player_register_count: Dict = {}
+        
+        # 二次インデックス (user_id / player_id / sc_id -> 名前)
+        # 記録を変更したら save_player で更新されます
+        self.player_index = PlayerIndex()
+        # お荷物リストの名前の表記ゆれ検索用 (編集距離 FUZZY_MAX_DISTANCE 以内)
+        self.FUZZY_MAX_DISTANCE = 1
+        self.player_fuzzy_index = FuzzyNameIndex(self.FUZZY_MAX_DISTANCE)
+        # /player_edit・/player_delete のオートコンプリート用
+        self.player_search_index = NameSearchIndex()
+        # /playerlist のページ表示用
+        self.player_list_index = PlayerListIndex()
+        
+        # レート制限 (キー: エンジン名 または ユーザーID)
+        self.rate_limiter = RateLimiter()
+        self.scan_rings: Dict[str, TimestampRing] = {}
+        self._scan_history_imported = False
+        
+        # 管理者モードの状態 {user_id: timestamp}
+        self.admin_mode_users: Dict = {}
+        
+        # 書き込み遅延 (write-behind) 設定
+        # 変更はデータセット単位で「dirty」として記録され、バックグラウンドでまとめて書き込まれます
+        self.FLUSH_WINDOW_SEC = 0.5   # 最初の変更からこの秒数だけ後続の変更を待ってまとめる
+        self.FLUSH_MAX_PENDING = 100  # この件数の変更が溜まったら待たずに書き込む
+        self._dirty: Dict[str, Optional[Set[str]]] = {}  # {データセット: 変更されたキー (None は全体)}
+        self._pending_marks = 0
+        self._flush_wakeup: Optional[asyncio.Event] = None
+        self._flush_now: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flusher_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.write_stats = {"marks": 0, "writes": 0, "flushes": 0}
+        # データセットごとの変更要求数と書き込み数 (まとめられた書き込みはデータセットごとに数える)
+        self.dataset_write_stats: Dict[str, Dict[str, int]] = {}
+        
+        # ジャーナル設定
+        self.COMPACT_EVERY_RECORDS = 500   # この件数のレコードが溜まったらスナップショットへ畳み込む
+        self.COMPACT_INTERVAL_SEC = 3600   # レコードがあれば少なくともこの間隔で畳み込む
+        self._journal_seq = 0
+        self._journal_pending: list = []   # 適用済み・未書き込みのレコード
+        self._last_compact = time.monotonic()
+        
+        # Initial Load
+        self.journal = MutationJournal(self.STATE_JOURNAL_FILE, self.STATE_SNAPSHOT_FILE)
+        self.player_store = PlayerStore(self.PLAYER_DB_FILE)
+        self.ocr_cache = OCRCache(self.OCR_CACHE_FILE, self.OCR_CACHE_MAX_BYTES)
+        self._open_scan_rings()
+        self.load_config()
+        self.load_player_names()
+        self.load_check_player_names()
+        self.load_env_initials()
+        
+        # Validation
+        self.validate_settings()
+
+    def load_env_initials(self):
+        """環境変数が設定されている場合、初期値をロードします"""
+        # 初期対象ユーザー（カンマ区切りで複数指定可能）
+        blocked_str = os.environ.get("INITIAL_BLOCKED_USERS", "")
+        if blocked_str and not self.BLOCKED_USERS: # only if empty
+            try:
+                self.BLOCKED_USERS = set(int(x.strip()) for x in blocked_str.split(",") if x.strip())
+                print(f"📋 環境変数から初期ブロックユーザー読み込み: {len(self.BLOCKED_USERS)}人")
+            except ValueError:
+                pass
+
+        # 初期対象VC（カンマ区切りで複数指定可能）
+        vc_str = os.environ.get("INITIAL_TARGET_VCS", "")
+        if vc_str and not self.TARGET_VC_IDS:
+             try:
+                self.TARGET_VC_IDS = set(int(x.strip()) for x in vc_str.split(",") if x.strip())
+                print(f"📋 環境変数から初期対象VC読み込み: {len(self.TARGET_VC_IDS)}個")
+             except ValueError:
+                pass
+
+
+    # ====== 設定の変更 (ジャーナル経由) ======
+    def add_admin(self, user_id: int):
+        self._record("id_add", field="admin_ids", value=user_id)
+
+    def remove_admin(self, user_id: int):
+        self._record("id_remove", field="admin_ids", value=user_id)
+
+    def add_blocked_user(self, user_id: int):
+        self._record("id_add", field="blocked_users", value=user_id)
+
+    def remove_blocked_user(self, user_id: int):
+        self._record("id_remove", field="blocked_users", value=user_id)
+
+    def add_target_vc(self, vc_id: int):
+        self._record("id_add", field="target_vc_ids", value=vc_id)
+
+    def remove_target_vc(self, vc_id: int):
+        self._record("id_remove", field="target_vc_ids", value=vc_id)
+
+    def set_option(self, key: str, value):
+        """設定値を変更する (key は OPTION_ATTRS のキー)"""
+        if key not in self.OPTION_ATTRS:
+            raise KeyError(f"不明な設定キー: {key}")
+        self._record("set", key=key, value=value)
+
+    def record_scan(self, engine: str, ts: float):
+        """画像解析に成功したエンジンのタイムスタンプを記録"""
+        self._append_scan(engine, ts)
+
+    def record_user_scan(self, user_id: int, ts: float):
+        """ユーザーごとのレート制限用にスキャン受付のタイムスタンプを記録"""
+        self._append_scan(user_id, ts)
+
+    def _open_scan_rings(self):
+        """スキャン履歴のリングファイルを開く（破損している場合はバックアップして作り直す）"""
+        os.makedirs(self.SCAN_RING_DIR, exist_ok=True)
+        for name in (*self.ENGINES, "users"):
+            path = os.path.join(self.SCAN_RING_DIR, f"{name}.ring")
+            try:
+                self.scan_rings[name] = TimestampRing(path, keyed=(name == "users"))
+            except Exception as e:
+                print(f"❌ {path} が破損しています: {e}")
+                os.replace(path, f"{path}.backup")
+                self.scan_rings[name] = TimestampRing(path, keyed=(name == "users"))
+
+    def _write_scan(self, key, ts: float, now: float):
+        """リングファイルへ8バイト (ユーザーは16バイト) 追記する"""
+        ring = self.scan_rings[key] if isinstance(key, str) else self.scan_rings["users"]
+        ring.expire(now - 86400)
+        if isinstance(key, str):
+            ring.append(ts)
+        else:
+            ring.append(ts, key)
+
+    def _append_scan(self, key, ts: float):
+        """スキャン履歴を追記し、レート制限に反映する（ページの書き出しはフラッシャーで行う）"""
+        now = datetime.now(JST).timestamp()
+        self._write_scan(key, ts, now)
+        self.rate_limiter.record(key, ts, now)
+        self.mark_dirty("scan_rings")
+
+    def _rebuild_rate_limiter(self):
+        """期限切れの記録を head を進めて捨て、残りからレート制限カウンターを組み立てる"""
+        now = datetime.now(JST).timestamp()
+        self.rate_limiter = RateLimiter()
+        for name, ring in self.scan_rings.items():
+            ring.expire(now - 86400)
+            if name == "users":
+                for ts, user_id in ring:
+                    self.rate_limiter.record(user_id, ts, now)
+            else:
+                for ts in ring:
+                    self.rate_limiter.record(name, ts, now)
+
+    def engine_limits(self, engine: str) -> Dict[int, int]:
+        """エンジンの制限を {ウィンドウ秒: 上限件数} で返す"""
+        prefix = f"RATELIMIT_{engine.upper()}"
+        return {3600: getattr(self, f"{prefix}_1H"), 86400: getattr(self, f"{prefix}_24H")}
+
+    def user_limits(self) -> Dict[int, int]:
+        """ユーザーごとの制限 (0 のものは除外)"""
+        limits = {3600: self.RATELIMIT_USER_1H, 86400: self.RATELIMIT_USER_24H}
+        return {window: limit for window, limit in limits.items() if limit > 0}
+
+    def scan_engine_caps(self) -> Dict[str, int]:
+        """エンジンごとの同時呼び出し数の上限"""
+        return {engine: getattr(self, f"SCAN_CAP_{engine.upper()}") for engine in self.ENGINES}
+
+    def aimd_engine_ceilings(self) -> Dict[str, int]:
+        """自動調整で上げられる同時呼び出し数の上限"""
+        return {engine: getattr(self, f"AIMD_MAX_{engine.upper()}") for engine in self.ENGINES}
+
+    def ocr_engine_timeouts(self) -> Dict[str, float]:
+        """エンジンごとの応答待ちの上限 (秒)"""
+        return {engine: getattr(self, f"OCR_TIMEOUT_{engine.upper()}") for engine in self.ENGINES}
+
+    def _record(self, op: str, **fields):
+        """変更をメモリに適用し、ジャーナルへの追記を予約する"""
+        self._journal_seq += 1
+        record = {"seq": self._journal_seq, "op": op, **fields}
+        self._apply_record(record)
+        self._journal_pending.append(record)
+        self.mark_dirty("journal")
+
+    def _apply_record(self, record: dict):
+        op = record.get("op")
+        if op == "id_add":
+            getattr(self, self.ID_SET_ATTRS[record["field"]]).add(record["value"])
+        elif op == "id_remove":
+            getattr(self, self.ID_SET_ATTRS[record["field"]]).discard(record["value"])
+        elif op == "set":
+            setattr(self, self.OPTION_ATTRS[record["key"]], record["value"])
+        elif op in ("scan", "user_scan"):
+            # 旧形式: スキャン履歴はリングファイルへ移ったため、ジャーナルに残っていれば取り込む
+            # (カウンターは読み込みの最後にリングファイルから組み立て直す)
+            key = record["engine"] if op == "scan" else record["user_id"]
+            self._write_scan(key, record["ts"], datetime.now(JST).timestamp())
+            self._scan_history_imported = True
+        else:
+            print(f"⚠️ 不明なジャーナル操作をスキップしました: {op}")
+
+    def save_config(self):
+        """現在の状態をスナップショットへ畳み込む（通常は変更ごとにジャーナルへ追記されるため不要）"""
+        self.mark_dirty("snapshot")
+
+    def _config_snapshot(self) -> dict:
+        config = {key: sorted(getattr(self, attr)) for key, attr in self.ID_SET_ATTRS.items()}
+        config.update({key: getattr(self, attr) for key, attr in self.OPTION_ATTRS.items()})
+        return config
+
+    def _state_snapshot(self) -> dict:
+        """スナップショットに書き出す状態（スキャン履歴はリングファイル側に保存される）"""
+        self.rate_limiter.prune(datetime.now(JST).timestamp())
+        return {"config": self._config_snapshot()}
+
+    def _apply_config(self, config: dict):
+        for key, attr in self.ID_SET_ATTRS.items():
+            setattr(self, attr, set(config.get(key, getattr(self, attr))))
+        for key, attr in self.OPTION_ATTRS.items():
+            setattr(self, attr, config.get(key, getattr(self, attr)))
+
+    def _apply_state(self, state: dict):
+        self._apply_config(state.get("config", {}))
+        if "scan_history" in state:
+            self._import_scan_history(state["scan_history"])
+
+    def _import_scan_history(self, data: dict):
+        """旧形式の scan_history ({0: {エンジン: [...]}, user_id: [...]}) をリングファイルへ取り込む"""
+        cutoff = datetime.now(JST).timestamp() - 86400
+        user_items = []
+        for key, value in data.items():
+            # keyをint型に戻す (GLOBAL_KEY=0 はエンジン別の辞書)
+            if int(key) == self.GLOBAL_KEY:
+                if isinstance(value, dict):
+                    for engine, hist in value.items():
+                        ring = self.scan_rings.get(engine)
+                        if ring is not None:
+                            ring.rewrite(list(ring) + [ts for ts in hist if ts > cutoff])
+            elif isinstance(value, list):
+                user_items.extend((ts, int(key)) for ts in value if ts > cutoff)
+        if user_items:
+            ring = self.scan_rings["users"]
+            ring.rewrite(list(ring) + user_items)
+        self._scan_history_imported = True
+
+    def _write_json_atomic(self, path: str, data, indent: Optional[int] = 2):
+        """一時ファイルに書き込んでから置き換える（書き込み途中のクラッシュでファイルを壊さない）"""
+        temp_file = f"{path}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+
+    def _import_legacy_state(self):
+        """旧形式の vcblock_config.json / scan_history.json をスナップショットへ移行する"""
+        imported = []
+        for path in (self.CONFIG_FILE, self.SCAN_HISTORY_FILE):
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if path == self.CONFIG_FILE:
+                    self._apply_config(data)
+                else:
+                    self._import_scan_history(data)
+                imported.append(path)
+            except json.JSONDecodeError as e:
+                print(f"❌ {path} が破損しています: {e}")
+                shutil.copy(path, f"{path}.backup")
+
+        if imported:
+            print(f"📦 旧形式のファイルをスナップショットへ移行します: {', '.join(imported)}")
+        else:
+            print(f"⚠️ 設定ファイルが見つかりません。初期値を使用します")
+        self.save_config()
+        for path in imported:
+            os.replace(path, f"{path}.migrated")
+
+    def load_config(self):
+        """最新のスナップショットを読み込み、ジャーナルの残りを再生して状態を復元する"""
+        try:
+            if not self.journal.exists():
+                self._import_legacy_state()
+                self._scan_history_imported = False
+                self._rebuild_rate_limiter()
+                return
+            state, records, last_seq = self.journal.load()
+            if state:
+                self._apply_state(state)
+            for record in records:
+                self._apply_record(record)
+            # まだ書き込まれていない変更を失わないよう再適用
+            for record in self._journal_pending:
+                self._apply_record(record)
+            self._journal_seq = max(self._journal_seq, last_seq)
+            self._rebuild_rate_limiter()
+            if self._scan_history_imported:
+                # 取り込んだ旧形式のスキャン履歴を二重に取り込まないよう、すぐにスナップショットへ畳み込む
+                print(f"📦 スキャン履歴をリングファイルへ移行しました")
+                self._scan_history_imported = False
+                self.mark_dirty("scan_rings")
+                self.save_config()
+            print(f"📂 設定を読み込みました (ジャーナル再生: {len(records)}件)")
+        except json.JSONDecodeError as e:
+            print(f"❌ スナップショットが破損しています: {e}")
+            if os.path.exists(self.STATE_SNAPSHOT_FILE):
+                shutil.copy(self.STATE_SNAPSHOT_FILE, f"{self.STATE_SNAPSHOT_FILE}.backup")
+        except Exception as e:
+            print(f"❌ 設定の読み込みに失敗しました: {e}")
+
+    def _load_legacy_player_file(self, path: str) -> tuple[Dict, Dict]:
+        """旧形式のプレイヤーJSONを (players, counts) として読み込む"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict) and 'players' in data:
+            return data.get('players', {}), data.get('counts', {})
+        return data, {}
+
+    def _migrate_legacy_players(self, table: str, path: str):
+        """DBのテーブルが空で旧JSONが残っている場合、一度だけDBへ移行する"""
+        if not os.path.exists(path) or not self.player_store.is_empty(table):
+            return
+        try:
+            players, counts = self._load_legacy_player_file(path)
+            self.player_store.replace_all(table, players, counts)
+            os.replace(path, f"{path}.migrated")
+            print(f"📦 {path} をデータベースへ移行しました: {len(players)}人")
+        except Exception as e:
+            print(f"❌ {path} の移行に失敗しました: {e}")
+
+    def save_player(self, *names: str):
+        """指定したプレイヤーの行の保存を予約（削除済みなら行を削除）"""
+        self.player_index.refresh(self.player_names, names)
+        self.player_fuzzy_index.refresh(self.player_names, names)
+        self.player_search_index.refresh(self.player_names, names)
+        self.player_list_index.refresh(self.player_names, self.player_register_count, names)
+        self.mark_dirty("player_names", *names)
+
+    def save_player_names(self):
+        """プレイヤー名全体の保存を予約（一括処理用。通常は save_player を使用）"""
+        self.player_index.rebuild(self.player_names)
+        self.player_fuzzy_index.rebuild(self.player_names)
+        self.player_search_index.rebuild(self.player_names)
+        self.player_search_index.warm(self.player_register_count)
+        self.player_list_index.rebuild(self.player_names, self.player_register_count)
+        self.mark_dirty("player_names")
+
+    def load_player_names(self):
+        """プレイヤー名をDBから読み込み"""
+        try:
+            self._migrate_legacy_players("players", self.PLAYER_NAMES_FILE)
+            self.player_names, self.player_register_count = self.player_store.load("players")
+            print(f"📂 プレイヤー名を読み込みました: {len(self.player_names)}人")
+        except Exception as e:
+            print(f"❌ プレイヤー名読み込みエラー: {e}")
+            self.player_names = {}
+            self.player_register_count = {}
+        self.player_index.rebuild(self.player_names)
+        self.player_fuzzy_index.rebuild(self.player_names)
+        self.player_search_index.rebuild(self.player_names)
+        self.player_search_index.warm(self.player_register_count)
+        self.player_list_index.rebuild(self.player_names, self.player_register_count)
+
+    def save_check_player(self, *names: str):
+        """指定した確認用プレイヤーの行の保存を予約（削除済みなら行を削除）"""
+        self.mark_dirty("check_player_names", *names)
+
+    def save_check_player_names(self):
+        """確認用プレイヤー名全体の保存を予約（一括処理用。通常は save_check_player を使用）"""
+        self.mark_dirty("check_player_names")
+
+    def load_check_player_names(self):
+        """確認用プレイヤー名をDBから読み込み"""
+        try:
+            self._migrate_legacy_players("check_players", self.CHECK_PLAYER_NAMES_FILE)
+            self.check_player_names, self.check_player_register_count = self.player_store.load("check_players")
+            print(f"📂 確認用プレイヤー名を読み込みました: {len(self.check_player_names)}人")
+        except Exception as e:
+            print(f"❌ 確認用プレイヤー名読み込みエラー: {e}")
+            self.check_player_names = {}
+            self.check_player_register_count = {}
+
+    def check_indexes(self) -> Dict[str, List[str]]:
+        """二次インデックスを記録と突き合わせ、データセットごとの不整合を返す"""
+        problems = {"player_names": self.player_index.check(self.player_names)}
+        fuzzy_names = self.player_fuzzy_index.indexed_names()
+        for name in fuzzy_names ^ set(self.player_names):
+            state = "記録にない名前" if name in fuzzy_names else "未登録の名前"
+            problems["player_names"].append(f"表記ゆれ索引: {state} {name}")
+        search_names = set(self.player_search_index.folded)
+        for name in search_names ^ set(self.player_names):
+            state = "記録にない名前" if name in search_names else "未登録の名前"
+            problems["player_names"].append(f"検索索引: {state} {name}")
+        if len(self.player_search_index.sorted_keys) != len(search_names):
+            problems["player_names"].append("検索索引: ソート済み配列の件数が一致しません")
+        problems["player_names"].extend(self.player_list_index.check(self.player_names, self.player_register_count))
+        return problems
+
+    # ====== 書き込み遅延 (write-behind) ======
+    def mark_dirty(self, dataset: str, *keys: str):
+        """データセットを変更済みとして記録する。keys を省略するとデータセット全体を書き込み対象にする"""
+        self.write_stats["marks"] += 1
+        self._dataset_write_stats(dataset)["marks"] += 1
+        if not keys:
+            self._dirty[dataset] = None
+        elif dataset not in self._dirty:
+            self._dirty[dataset] = set(keys)
+        elif self._dirty[dataset] is not None:
+            self._dirty[dataset].update(keys)
+        self._pending_marks += 1
+
+        if self._flusher_task is None:
+            # フラッシャー起動前 (起動処理中など) はその場で書き込む
+            self.flush_sync()
+            return
+        self._flush_wakeup.set()
+        if self._pending_marks >= self.FLUSH_MAX_PENDING:
+            self._flush_now.set()
+
+    def _collect_flush_jobs(self) -> list:
+        """dirty なデータセットの書き込み内容をイベントループ上でスナップショットする（リングファイルはここで書き出す）"""
+        dirty, self._dirty = self._dirty, {}
+        self._pending_marks = 0
+        jobs = []
+
+        # リングファイルのページを先に書き出す（スナップショットから旧形式の履歴が消える前に）
+        # 追記と拡張 (mmap の作り直し) はイベントループ上で行うため、書き出しもここで行う
+        # (ワーカースレッドで行うと拡張で閉じた mmap に触れることがある。数ページの msync なので軽い)
+        if "scan_rings" in dirty:
+            try:
+                for ring in self.scan_rings.values():
+                    ring.flush()
+                self._count_writes(["scan_rings"])
+            except Exception as e:
+                print(f"❌ 保存エラー (scan_rings): {e}")
+                self._restore_failed([("scan_rings", None, None)])
+
+        # ジャーナルへの追記 → (必要なら) スナップショットへの畳み込み の順で書き込む
+        pending, self._journal_pending = self._journal_pending, []
+        if pending:
+            jobs.append(("journal", None, pending))
+        unsnapshotted = self.journal.records_since_snapshot + len(pending)
+        compact_due = (
+            unsnapshotted >= self.COMPACT_EVERY_RECORDS
+            or (unsnapshotted > 0 and time.monotonic() - self._last_compact >= self.COMPACT_INTERVAL_SEC)
+        )
+        if "snapshot" in dirty or compact_due:
+            jobs.append(("snapshot", None, (self._state_snapshot(), self._journal_seq)))
+            self._last_compact = time.monotonic()
+
+        for dataset, keys in dirty.items():
+            if dataset in ("player_names", "check_player_names"):
+                if dataset == "player_names":
+                    players, counts = self.player_names, self.player_register_count
+                else:
+                    players, counts = self.check_player_names, self.check_player_register_count
+                names = set(players) | set(counts) if keys is None else keys
+                rows = [(name, dict(players[name]) if name in players else None, counts.get(name)) for name in names]
+                jobs.append((dataset, keys, rows))
+        return jobs
+
+    def _run_flush_jobs(self, jobs: list) -> tuple:
+        """スナップショットを実際に書き込む（ワーカースレッドで実行）。(失敗したジョブ, 書き込めたデータセット) を返す
+
+        統計はワーカースレッドから書き換えず、呼び出し元がイベントループ上で _count_writes に渡します。
+        """
+        failed, written = [], []
+        for dataset, keys, payload in jobs:
+            try:
+                if dataset == "journal":
+                    self.journal.append_many(payload)
+                elif dataset == "snapshot":
+                    state, seq = payload
+                    self.journal.compact(state, seq)
+                else:
+                    table = "players" if dataset == "player_names" else "check_players"
+                    if keys is None:
+                        players = {name: data for name, data, _ in payload if data is not None}
+                        counts = {name: count for name, _, count in payload if count is not None}
+                        self.player_store.replace_all(table, players, counts)
+                    else:
+                        self.player_store.upsert_many(table, payload)
+                written.append(dataset)
+            except Exception as e:
+                print(f"❌ 保存エラー ({dataset}): {e}")
+                failed.append((dataset, keys, payload))
+        return failed, written
+
+    def _dataset_write_stats(self, dataset: str) -> Dict[str, int]:
+        return self.dataset_write_stats.setdefault(dataset, {"marks": 0, "writes": 0})
+
+    def _count_writes(self, datasets: list):
+        """書き込めたデータセットを統計に加える（イベントループ上、または flush_sync の呼び出し元で実行）"""
+        for dataset in datasets:
+            self.write_stats["writes"] += 1
+            self._dataset_write_stats(dataset)["writes"] += 1
+
+    def _restore_failed(self, failed: list):
+        """書き込みに失敗したデータセットを次回のフラッシュで再試行する"""
+        for dataset, keys, payload in failed:
+            if dataset == "journal":
+                # 追記できなかったレコードは順序を保って先頭に戻す
+                self._journal_pending[:0] = payload
+            elif keys is None or self._dirty.get(dataset, set()) is None:
+                self._dirty[dataset] = None
+            else:
+                self._dirty.setdefault(dataset, set()).update(keys)
+            self._pending_marks += 1
+        if failed and self._flush_wakeup is not None:
+            self._flush_wakeup.set()
+
+    def flush_sync(self):
+        """保留中の変更をその場で書き込む（イベントループ外・起動処理用）"""
+        jobs = self._collect_flush_jobs()
+        if jobs:
+            self.write_stats["flushes"] += 1
+            failed, written = self._run_flush_jobs(jobs)
+            self._count_writes(written)
+            self._restore_failed(failed)
+
+    async def flush(self):
+        """保留中の変更をワーカースレッドで書き込む（イベントループはブロックしない）"""
+        async with self._flush_lock:
+            jobs = self._collect_flush_jobs()
+            if not jobs:
+                return
+            self.write_stats["flushes"] += 1
+            failed, written = await asyncio.to_thread(self._run_flush_jobs, jobs)
+            self._count_writes(written)
+            self._restore_failed(failed)
+
+    def start_flusher(self):
+        """バックグラウンドの書き込みタスクを開始（イベントループ上で呼び出す）"""
+        if self._flusher_task is not None:
+            return
+        self._flush_wakeup = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher_task = asyncio.get_running_loop().create_task(self._flusher_loop())
+        if self._dirty:
+            self._flush_wakeup.set()
+
+    async def _flusher_loop(self):
+        while not self._closing:
+            await self._flush_wakeup.wait()
+            # 最初の変更から一定時間（または一定件数まで）後続の変更を待ってまとめる
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.FLUSH_WINDOW_SEC)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            self._flush_now.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ バックグラウンド保存エラー: {e}")
+
+    async def close(self):
+        """フラッシャーを停止し、保留中の変更をすべて書き込む（終了時用）"""
+        if self._flusher_task is not None:
+            # 書き込み中のスレッドを途中で切らないよう、ループ自身に終了させる
+            self._closing = True
+            self._flush_wakeup.set()
+            self._flush_now.set()
+            await self._flusher_task
+            await self.flush()
+            self._flusher_task = None
+        else:
+            self.flush_sync()
+        self.player_store.close()
+        self.ocr_cache.close()
+        for ring in self.scan_rings.values():
+            ring.close()
+
+    def get_write_stats(self) -> dict:
+        """書き込み統計（まとめられた書き込み数 = データセットごとの 変更要求数 - 実際の書き込み数 の合計）
+
+        畳み込みの時期が来たスナップショットなど、変更要求なしに書き込んだ分で相殺しないようデータセットごとに数えます。
+        """
+        stats = dict(self.write_stats)
+        datasets = {dataset: dict(counts) for dataset, counts in self.dataset_write_stats.items()}
+        stats["datasets"] = datasets
+        stats["coalesced"] = sum(max(0, counts["marks"] - counts["writes"]) for counts in datasets.values())
+        # プレイヤー記録 (データベース) と設定 (ジャーナル・スナップショット) の書き込み回数
+        stats["player_writes"] = sum(datasets.get(d, {}).get("writes", 0) for d in ("player_names", "check_player_names"))
+        stats["state_writes"] = sum(datasets.get(d, {}).get("writes", 0) for d in ("journal", "snapshot"))
+        stats["pending"] = self._pending_marks
+        stats["journal_records"] = self.journal.records_since_snapshot + len(self._journal_pending)
+        stats["scan_ring_appends"] = sum(ring.appends for ring in self.scan_rings.values())
+        return stats
+
+    def validate_settings(self):
+        """設定項目の整合性チェック"""
+        if self.OWNER_ID == 0:
+            print("⚠️ 警告: OWNER_ID が設定されていません。環境変数を確認してください。")
+        if not self.CONFIG_FILE:
+             print("❌ エラー: CONFIG_FILE が定義されていません。")
+             
+    def is_authorized(self, user_id: int) -> bool:
+        """ユーザーがオーナーまたは管理者かチェック"""
+        return user_id == self.OWNER_ID or user_id in self.ADMIN_IDS
+
+    # ====== 管理者モード管理 ======
+    def is_in_admin_mode(self, user_id: int) -> bool:
+        """ユーザーが管理者モード中かチェック"""
+        if user_id not in self.admin_mode_users:
+            return False
+        last_activity = self.admin_mode_users[user_id]
+        if (datetime.now(JST) - last_activity).total_seconds() > self.ADMIN_MODE_TIMEOUT:
+            del self.admin_mode_users[user_id]
+            return False
+        return True
+
+    def enter_admin_mode(self, user_id: int):
+        """管理者モードに入る"""
+        self.admin_mode_users[user_id] = datetime.now(JST)
+
+    def update_admin_mode(self, user_id: int):
+        """管理者モードのタイムスタンプを更新"""
+        self.admin_mode_users[user_id] = datetime.now(JST)
+
+    def exit_admin_mode(self, user_id: int):
+        """管理者モードから抜ける"""
+        if user_id in self.admin_mode_users:
+            del self.admin_mode_users[user_id]
+
+    def _ensure_dirs(self):
+        """必要なディレクトリを作成"""
+        for d in [self.REPORT_IMAGES_DIR, self.CHECK_IMAGES_DIR]:
+            if not os.path.exists(d):
+                os.makedirs(d)
+                print(f"📁 ディレクトリを作成しました: {d}")
@@ -0,0 +1,166 @@
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+# 回路遮断器 (サーキットブレーカー) の状態
+CLOSED = "closed"        # 通常どおり使う
+OPEN = "open"            # 失敗が続いたので cooldown 秒間は使わない
+HALF_OPEN = "half_open"  # cooldown 後、試しに1件だけ送って回復したか確かめる
+
+# 失敗として数える呼び出し結果
+FAILURES = ("error", "timeout", "throttled")
+
+class EngineHealth:
+    """エンジン1つ分の直近の呼び出し結果 (window 秒・最大 samples 件) と遮断器の状態"""
+
+    def __init__(self, samples: int):
+        self.calls: deque = deque(maxlen=samples)  # (時刻, 結果, 所要時間 ms)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None  # 半開状態で試しに送った時刻
+        self.opens = 0
+
+    def prune(self, now: float, window: float):
+        while self.calls and self.calls[0][0] < now - window:
+            self.calls.popleft()
+
+class EngineRouter:
+    """エンジンの健全性と応答時間を見て、画像ごとに試すエンジンの順番を決める
+
+    呼び出し結果は OCR エンジンのアダプターから record() で受け取ります ('ok' / 'error' / 'timeout' / 'throttled')。
+    'cancelled' (ヘッジで負けて取り消した呼び出し) は失敗に数えず、応答時間の下限として p90 の計算にだけ使います
+    (遅い呼び出しほど取り消されるため、除くと p90 が実際より短くなり、ヘッジの開始が早まり続けるのを防ぐ)。
+    連続 failure_threshold 回の失敗、または直近の失敗率が error_rate_threshold 以上になると遮断器を開き、
+    cooldown 秒後に半開状態にして1件だけ試します (成功すれば閉じ、失敗すれば再び開く)。
+    order() は候補をコスト順 (設定のエンジン順) のまま、遮断中のエンジンを除き、
+    直近の p90 応答時間が latency_target_ms を超えるエンジンを後ろへ回します。
+    """
+
+    def __init__(self, latency_target_ms: float = 15000, cooldown: float = 120, failure_threshold: int = 3,
+                 error_rate_threshold: float = 0.5, min_samples: int = 10, window: float = 600, samples: int = 100):
+        self.latency_target_ms = latency_target_ms
+        self.cooldown = cooldown
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.window = window
+        self.samples = samples
+        self.health: Dict[str, EngineHealth] = {}
+
+    def _health(self, engine: str) -> EngineHealth:
+        health = self.health.get(engine)
+        if health is None:
+            health = self.health[engine] = EngineHealth(self.samples)
+        return health
+
+    # ====== 記録 ======
+    def record(self, engine: str, outcome: str, elapsed_ms: Optional[float], now: Optional[float] = None):
+        """アダプターから呼ばれる: 呼び出し1回分の結果を記録し、遮断器の状態を更新する
+
+        elapsed_ms が None の取り消し (枠を待っている間に取り消され、呼び出していない) は応答時間の記録に含めません。
+        """
+        now = time.monotonic() if now is None else now
+        health = self._health(engine)
+        if elapsed_ms is not None:
+            health.calls.append((now, outcome, elapsed_ms))
+        health.prune(now, self.window)
+        if outcome == "cancelled":
+            # 遮断後の試行が取り消された場合は、次の1件を試せるようにする
+            health.probe_started = None
+            return
+        if outcome == "ok":
+            health.consecutive_failures = 0
+            if health.state != CLOSED:
+                print(f"✅ {engine.upper()} が回復しました (遮断を解除)")
+            health.state = CLOSED
+            health.probe_started = None
+            return
+
+        health.consecutive_failures += 1
+        if health.state == HALF_OPEN:
+            self._open(engine, health, now, "試行に失敗")
+            return
+        if health.state == CLOSED:
+            if health.consecutive_failures >= self.failure_threshold:
+                self._open(engine, health, now, f"{health.consecutive_failures}回連続で失敗")
+                return
+            total = sum(1 for _, o, _ in health.calls if o != "cancelled")
+            failures = sum(1 for _, o, _ in health.calls if o in FAILURES)
+            if total >= self.min_samples and failures / total >= self.error_rate_threshold:
+                self._open(engine, health, now, f"直近の失敗率 {failures / total:.0%}")
+
+    def _open(self, engine: str, health: EngineHealth, now: float, reason: str):
+        health.state = OPEN
+        health.opened_at = now
+        health.probe_started = None
+        health.opens += 1
+        print(f"🚧 {engine.upper()} を {self.cooldown:g}秒間使いません ({reason})")
+
+    # ====== 選択 ======
+    def _allowed(self, health: EngineHealth, now: float) -> bool:
+        if health.state == OPEN:
+            return now - health.opened_at >= self.cooldown
+        if health.state == HALF_OPEN:
+            # 試行中の1件の結果を待つ (結果が来ないまま cooldown を過ぎたら次の1件を試す)
+            return health.probe_started is None or now - health.probe_started >= self.cooldown
+        return True
+
+    def acquire(self, engine: str, now: Optional[float] = None) -> bool:
+        """呼び出す直前に確認する: 今このエンジンへ送ってよいか (遮断後の試行ならその1件として記録する)"""
+        now = time.monotonic() if now is None else now
+        health = self._health(engine)
+        if not self._allowed(health, now):
+            return False
+        if health.state != CLOSED:
+            health.state = HALF_OPEN
+            health.probe_started = now
+        return True
+
+    def latency_p90(self, engine: str) -> Optional[float]:
+        """直近の成功した (または取り消すまで応答がなかった) 呼び出しの p90 応答時間 (ms)。記録がなければ None"""
+        health = self._health(engine)
+        latencies = sorted(ms for _, outcome, ms in health.calls if outcome in ("ok", "cancelled"))
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]
+
+    def order(self, candidates: Iterable[str], now: Optional[float] = None) -> List[str]:
+        """試す順番: 遮断中のエンジンを除き、応答時間の目標を満たすものをコスト順で先に並べる"""
+        now = time.monotonic() if now is None else now
+        fast, slow = [], []
+        for engine in candidates:
+            if not self._allowed(self._health(engine), now):
+                continue
+            p90 = self.latency_p90(engine)
+            (fast if p90 is None or p90 <= self.latency_target_ms else slow).append(engine)
+        return fast + slow
+
+    def reset(self, engine: Optional[str] = None):
+        """遮断器を閉じ、記録を消す (engine を省略した場合は全エンジン)"""
+        for name in ([engine] if engine else list(self.health)):
+            self.health[name] = EngineHealth(self.samples)
+
+    # ====== 統計 ======
+    def get_stats(self, now: Optional[float] = None) -> Dict[str, Dict]:
+        now = time.monotonic() if now is None else now
+        stats = {}
+        for engine, health in self.health.items():
+            health.prune(now, self.window)
+            latencies = sorted(ms for _, outcome, ms in health.calls if outcome == "ok")
+            counts = {outcome: 0 for outcome in ("ok", *FAILURES, "cancelled")}
+            for _, outcome, _ in health.calls:
+                counts[outcome] = counts.get(outcome, 0) + 1
+            calls = len(health.calls) - counts["cancelled"]
+            stats[engine] = {
+                "state": health.state,
+                "calls": calls,
+                **counts,
+                "error_rate": sum(counts[o] for o in FAILURES) / calls if calls else 0.0,
+                "p50_ms": latencies[len(latencies) // 2] if latencies else None,
+                "p90_ms": self.latency_p90(engine),
+                "consecutive_failures": health.consecutive_failures,
+                "opens": health.opens,
+                "retry_in": max(0.0, self.cooldown - (now - health.opened_at)) if health.state == OPEN else 0.0,
+            }
+        return stats
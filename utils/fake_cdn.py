@@ -0,0 +1,131 @@
+import asyncio
+import io
+import itertools
+from typing import Dict, Optional
+
+from aiohttp import web
+from PIL import Image
+
+# Discord の添付ファイル配信 (cdn.discordapp.com) とメディアプロキシ (media.discordapp.net) の代わりに
+# ローカルで画像を配信するサーバー。オフラインでの動作確認とベンチマークに使います。
+#   /attachments/<id>/<name>        元の画像をそのまま返す
+#   /proxy/attachments/<id>/<name>  width / height / format を指定すると縮小・変換した画像を返す
+
+class FakeAttachment:
+    """discord.Attachment の代わり (AttachmentFetcher が使う属性だけを持つ)"""
+
+    def __init__(self, attachment_id: int, filename: str, url: str, proxy_url: str, size: int,
+                 width: int, height: int, content_type: str):
+        self.id = attachment_id
+        self.filename = filename
+        self.url = url
+        self.proxy_url = proxy_url
+        self.size = size
+        self.width = width
+        self.height = height
+        self.content_type = content_type
+
+class FakeDiscordCDN:
+    """添付画像を配信するローカルサーバー
+
+    bandwidth (バイト/秒) を指定すると、応答サイズに応じた転送時間だけ待ってから返します。
+    縮小版は本物のプロキシと同じく、一度作ったものをキャッシュして返します。
+    fail_proxy=True の間はプロキシへの要求に HTTP 500 を返します (元の URL へのフォールバック確認用)。
+    """
+
+    def __init__(self, bandwidth: Optional[float] = None, host: str = "127.0.0.1"):
+        self.bandwidth = bandwidth
+        self.host = host
+        self.fail_proxy = False
+        self.base_url = ""
+        self._files: Dict[int, tuple] = {}   # 添付ファイルID -> (ファイル名, バイト列, content_type)
+        self._variants: Dict[tuple, bytes] = {}  # (添付ファイルID, 幅, 高さ, 形式, 可逆) -> 縮小版 (プロキシのキャッシュ)
+        self._ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self.stats = {"original_requests": 0, "proxy_requests": 0, "bytes_sent": 0}
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/attachments/{id}/{name}", self._original)
+        app.router.add_get("/proxy/attachments/{id}/{name}", self._proxy)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://{self.host}:{port}"
+        return self.base_url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def add(self, filename: str, data: bytes) -> FakeAttachment:
+        """画像を登録し、その添付ファイルを返す (start() の後に呼ぶ)"""
+        attachment_id = next(self._ids)
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+            content_type = Image.MIME.get(img.format, "application/octet-stream")
+        self._files[attachment_id] = (filename, data, content_type)
+        path = f"attachments/{attachment_id}/{filename}"
+        return FakeAttachment(
+            attachment_id, filename, f"{self.base_url}/{path}?ex=0&hm=fake", f"{self.base_url}/proxy/{path}?ex=0&hm=fake",
+            len(data), width, height, content_type
+        )
+
+    async def _send(self, data: bytes, content_type: str) -> web.Response:
+        if self.bandwidth:
+            await asyncio.sleep(len(data) / self.bandwidth)
+        self.stats["bytes_sent"] += len(data)
+        return web.Response(body=data, content_type=content_type)
+
+    def _lookup(self, request: web.Request) -> tuple:
+        entry = self._files.get(int(request.match_info["id"]))
+        if entry is None or entry[0] != request.match_info["name"]:
+            raise web.HTTPNotFound()
+        return entry
+
+    async def _original(self, request: web.Request) -> web.Response:
+        _, data, content_type = self._lookup(request)
+        self.stats["original_requests"] += 1
+        return await self._send(data, content_type)
+
+    async def _proxy(self, request: web.Request) -> web.Response:
+        attachment_id = int(request.match_info["id"])
+        _, data, content_type = self._lookup(request)
+        self.stats["proxy_requests"] += 1
+        if self.fail_proxy:
+            raise web.HTTPInternalServerError()
+        query = request.query
+        if "width" not in query and "height" not in query and "format" not in query:
+            return await self._send(data, content_type)
+        try:
+            width = int(query["width"]) if "width" in query else None
+            height = int(query["height"]) if "height" in query else None
+        except ValueError:
+            raise web.HTTPBadRequest()
+        fmt = query.get("format", "png").lower()
+        if fmt not in ("webp", "png", "jpeg"):
+            raise web.HTTPBadRequest()
+        key = (attachment_id, width, height, fmt, query.get("quality") == "lossless")
+        body = self._variants.get(key)
+        if body is None:
+            body = await asyncio.to_thread(_resize, data, *key[1:])
+            self._variants[key] = body
+        return await self._send(body, f"image/{fmt}")
+
+def _resize(data: bytes, width: Optional[int], height: Optional[int], fmt: str, lossless: bool) -> bytes:
+    """メディアプロキシと同じく、指定された大きさに縮小して指定の形式で返す (拡大はしない)"""
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert("RGB")
+        w, h = img.size
+        target = (min(width or w, w), min(height or h, h))
+        if target != (w, h):
+            img = img.resize(target, Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        if fmt == "webp":
+            img.save(out, "WEBP", lossless=lossless, quality=80)
+        else:
+            img.save(out, fmt.upper())
+        return out.getvalue()
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import Callable, List, Optional, Sequence, Union
+
+# OCR エンジンの非同期クライアントの代わり (ネットワークなしでアダプターやスケジューラを試すため)
+# 応答までの待ち時間 (秒、または呼び出しごとに秒数を返す関数)・返す内容・失敗を指定できます。
+#   FakeGeminiModel   ... GenerativeModel.generate_content_async の代わり
+#   FakeVisionClient  ... ImageAnnotatorAsyncClient.batch_annotate_images の代わり
+#   FakeThrottlingModel ... 同時に受け付ける数を超えた要求に 429 を返す Gemini の代わり (同時実行数の調整の確認用)
+
+def _latency(latency) -> float:
+    return latency() if callable(latency) else latency
+
+def fake_annotations(lines: Sequence[tuple]) -> list:
+    """Vision の text_annotations の代わりを作る
+
+    lines: (文字列, x, y, 幅, 高さ) の並び。先頭要素は全文 (各文字列を改行で連結)、以降は1語ずつ
+    """
+    def annotation(text, x, y, w, h):
+        vertices = [SimpleNamespace(x=x, y=y), SimpleNamespace(x=x + w, y=y),
+                    SimpleNamespace(x=x + w, y=y + h), SimpleNamespace(x=x, y=y + h)]
+        return SimpleNamespace(description=text, bounding_poly=SimpleNamespace(vertices=vertices))
+
+    full = "\n".join(line[0] for line in lines)
+    return [annotation(full, 0, 0, 0, 0)] + [annotation(*line) for line in lines]
+
+class FakeThrottled(Exception):
+    """回数制限の代わり (google.api_core の ResourceExhausted と同じく code が 429)"""
+    code = 429
+
+class FakeGeminiModel:
+    """Gemini の代わり: latency 秒待ってから result を JSON にしたテキストを返す (error を指定すると例外)"""
+
+    def __init__(self, latency: Union[float, Callable[[], float]] = 0.0, result: Optional[dict] = None,
+                 error: Optional[Exception] = None):
+        self.latency = latency
+        self.result = result if result is not None else {"name": "FakePlayer", "player_id": "#FAKE0", "sc_id": "FakeHeroId"}
+        self.error = error
+        self.calls = 0
+
+    async def generate_content_async(self, contents, request_options=None):
+        self.calls += 1
+        await asyncio.sleep(_latency(self.latency))
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(text=f"```json\n{json.dumps(self.result, ensure_ascii=False)}\n```")
+
+    def generate_content(self, contents, request_options=None):
+        """同期版 (asyncio.to_thread で呼んでいた従来の方式との比較用、待ち時間中はスレッドを占有する)"""
+        self.calls += 1
+        time.sleep(_latency(self.latency))
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(text=json.dumps(self.result, ensure_ascii=False))
+
+class FakeThrottlingModel(FakeGeminiModel):
+    """同時に capacity 件 (数、または呼び出しごとにその時点の数を返す関数) までしか受け付けない Gemini の代わり
+
+    受け付けた要求は latency 秒後に結果を返し、超えた分は throttle_latency 秒後に 429 (FakeThrottled) を返します。
+    """
+
+    def __init__(self, capacity: Union[int, Callable[[], int]], latency: Union[float, Callable[[], float]] = 0.0,
+                 throttle_latency: float = 0.0, result: Optional[dict] = None):
+        super().__init__(latency, result)
+        self.capacity = capacity
+        self.throttle_latency = throttle_latency
+        self.in_flight = 0
+        self.accepted = 0
+        self.throttled = 0
+
+    async def generate_content_async(self, contents, request_options=None):
+        if self.in_flight >= _latency(self.capacity):
+            self.calls += 1
+            self.throttled += 1
+            await asyncio.sleep(self.throttle_latency)
+            raise FakeThrottled("429 Resource has been exhausted")
+        self.in_flight += 1
+        self.accepted += 1
+        try:
+            return await super().generate_content_async(contents, request_options)
+        finally:
+            self.in_flight -= 1
+
+class FakeVisionClient:
+    """Vision の代わり: latency 秒待ってから annotations を返す
+
+    error_message を指定すると画像ごとのエラーの応答を返します (error_code は google.rpc.Code、8 は回数制限)
+    """
+
+    def __init__(self, latency: Union[float, Callable[[], float]] = 0.0, annotations: Optional[List] = None, error_message: str = "", error_code: int = 0):
+        self.latency = latency
+        self.annotations = annotations if annotations is not None else []
+        self.error_message = error_message
+        self.error_code = error_code
+        self.calls = 0
+
+    def _response(self):
+        error = SimpleNamespace(message=self.error_message, code=self.error_code)
+        result = SimpleNamespace(text_annotations=self.annotations, error=error)
+        return SimpleNamespace(responses=[result])
+
+    async def batch_annotate_images(self, requests, timeout=None):
+        self.calls += 1
+        await asyncio.sleep(_latency(self.latency))
+        return self._response()
+
+    def text_detection(self, image=None):
+        """同期版 (従来の ImageAnnotatorClient.text_detection 相当)"""
+        self.calls += 1
+        time.sleep(_latency(self.latency))
+        return self._response().responses[0]
@@ -0,0 +1,175 @@
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# OCR で取り違えやすい文字 (NFKC・小文字化の後に適用)
+CONFUSABLES = str.maketrans({
+    "0": "o",
+    "1": "l",
+    "|": "l",
+    "ー": "-",  # 長音記号
+    "\u2010": "-",  # ハイフン
+    "\u2212": "-",  # マイナス記号
+})
+# 表示に影響しない文字 (異体字セレクタ・ゼロ幅文字)
+IGNORED_CHARS = {"\ufe0e", "\ufe0f", "\u200b", "\u200c", "\u200d", "\u2060"}
+
+def fuzzy_key(name: str) -> str:
+    """表記ゆれを吸収した比較用の名前 (NFKC → 小文字化 → 空白除去 → 取り違えやすい文字を統一)"""
+    text = unicodedata.normalize("NFKC", name).casefold()
+    text = "".join(ch for ch in text if not ch.isspace() and ch not in IGNORED_CHARS)
+    return text.translate(CONFUSABLES)
+
+def _distance_within_one(a: str, b: str) -> Optional[int]:
+    """距離1以内かどうかだけを線形時間で判定する (len(a) <= len(b))"""
+    if a == b:
+        return 0
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return 1 if a[i + 1:] == b[i + 1:] else None
+    return 1 if a[i:] == b[i + 1:] else None
+
+def bounded_levenshtein(a: str, b: str, limit: int) -> Optional[int]:
+    """編集距離が limit 以下ならその値を、超えるなら None を返す（途中で打ち切る）"""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    if len(a) > len(b):
+        a, b = b, a
+    if limit <= 1:
+        distance = _distance_within_one(a, b)
+        return None if distance is None or distance > limit else distance
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if current[j] < row_min:
+                row_min = current[j]
+        if row_min > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+class FuzzyNameIndex:
+    """編集距離が閾値以内の名前を探すための bigram 転置インデックス
+
+    編集1回で変わる bigram は高々2個なので、距離 k 以内の名前は
+    検索語の bigram のうち任意の 2k+1 個のどれかを必ず共有します。
+    そこで出現頻度の低い (転置リストの短い) 2k+1 個だけを引いて候補を集め、
+    転置リストは (bigram, 長さ) ごとに分けてあり、長さの差が k を超える名前は最初から引きません。
+    最後に打ち切り付きの編集距離で確認します。
+    bigram が足りない短い名前は長さ別の一覧から探します。
+    """
+
+    Q = 2
+    START, END = "\x02", "\x03"
+
+    def __init__(self, max_distance: int = 1):
+        self.max_distance = max_distance
+        self.names: Dict[str, Set[str]] = {}        # 比較用キー -> 元の名前
+        self.postings: Dict[Tuple[str, int], Set[str]] = {}  # (bigram, 長さ) -> 比較用キー
+        self.gram_counts: Dict[str, int] = {}       # bigram の出現数 (珍しい順に並べるため)
+        self.by_length: Dict[int, Set[str]] = {}    # 長さ -> 比較用キー (短い名前の検索用)
+        self._keys: Dict[str, str] = {}             # 元の名前 -> 比較用キー
+        self.stats = {"searches": 0, "candidates": 0, "verified": 0}
+
+    def _grams(self, key: str) -> List[str]:
+        padded = f"{self.START}{key}{self.END}"
+        return [padded[i:i + self.Q] for i in range(len(padded) - self.Q + 1)]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._keys
+
+    def indexed_names(self) -> Set[str]:
+        return set(self._keys)
+
+    def add(self, name: str):
+        if name in self._keys:
+            return
+        key = fuzzy_key(name)
+        self._keys[name] = key
+        owners = self.names.setdefault(key, set())
+        owners.add(name)
+        if len(owners) > 1:
+            return
+        for gram in set(self._grams(key)):
+            self.postings.setdefault((gram, len(key)), set()).add(key)
+            self.gram_counts[gram] = self.gram_counts.get(gram, 0) + 1
+        self.by_length.setdefault(len(key), set()).add(key)
+
+    def remove(self, name: str):
+        key = self._keys.pop(name, None)
+        if key is None:
+            return
+        owners = self.names[key]
+        owners.discard(name)
+        if owners:
+            return
+        del self.names[key]
+        for gram in set(self._grams(key)):
+            keys = self.postings.get((gram, len(key)))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[(gram, len(key))]
+            self.gram_counts[gram] -= 1
+            if not self.gram_counts[gram]:
+                del self.gram_counts[gram]
+        bucket = self.by_length[len(key)]
+        bucket.discard(key)
+        if not bucket:
+            del self.by_length[len(key)]
+
+    def rebuild(self, names: Iterable[str]):
+        """名前の一覧から作り直す（読み込み・一括処理用）"""
+        self.names, self.postings, self.gram_counts, self.by_length, self._keys = {}, {}, {}, {}, {}
+        for name in names:
+            self.add(name)
+
+    def refresh(self, players: Dict, names: Iterable[str]):
+        """指定した名前だけを現在の記録に合わせて追加・削除する（改名は旧名と新名の両方を渡す）"""
+        for name in names:
+            if name in players:
+                self.add(name)
+            else:
+                self.remove(name)
+
+    def _candidates(self, key: str, limit: int) -> Set[str]:
+        grams = self._grams(key)
+        needed = limit * self.Q + 1
+        lengths = range(max(0, len(key) - limit), len(key) + limit + 1)
+        found = set()
+        if len(grams) < needed:
+            # bigram が少なすぎてフィルタが効かない短い名前は長さで探す
+            for length in lengths:
+                found |= self.by_length.get(length, set())
+            return found
+        # 出現数の少ない (珍しい) bigram から needed 個の位置を選ぶ
+        grams.sort(key=lambda g: self.gram_counts.get(g, 0))
+        for gram in set(grams[:needed]):
+            for length in lengths:
+                keys = self.postings.get((gram, length))
+                if keys:
+                    found |= keys
+        return found
+
+    def search(self, name: str, max_distance: Optional[int] = None) -> List[Tuple[str, int]]:
+        """距離が閾値以内の登録名を (名前, 距離) の近い順で返す"""
+        limit = self.max_distance if max_distance is None else max_distance
+        key = fuzzy_key(name)
+        candidates = self._candidates(key, limit)
+        self.stats["searches"] += 1
+        self.stats["candidates"] += len(candidates)
+        results = []
+        self.stats["verified"] += len(candidates)
+        for candidate in candidates:
+            distance = bounded_levenshtein(key, candidate, limit)
+            if distance is not None:
+                results.extend((owner, distance) for owner in self.names[candidate])
+        results.sort(key=lambda item: (item[1], item[0]))
+        return results
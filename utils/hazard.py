@@ -0,0 +1,89 @@
+from typing import List, Optional, Tuple
+
+from utils.fuzzy_index import fuzzy_key
+from utils.player_index import normalize_player_id
+
+# お荷物リスト (config.player_names) との照合
+# 名前は変更やよくある名前の重複があるため、player_id → sc_id → 名前 → 表記ゆれ の順に照合します
+
+MATCH_LABELS = {
+    "player_id": "プレイヤーID",
+    "sc_id": "Supercell ID",
+    "name": "名前",
+    "fuzzy": "名前 (表記ゆれ)",
+    "fuzzy_review": "名前 (表記ゆれ・要確認)",
+}
+
+# 表記ゆれで一致とみなす名前の最短の長さ (比較用キーの文字数)
+# 短い名前は1文字違いの別人が多い (Ben/Ken, Mox/Max, Lea/Leo, sore/sora, ゆき/ゆう, K3n/Ken) ため、
+# これより短い名前や候補が複数ある場合は一致とせず、管理者に確認を依頼するだけにします
+FUZZY_MIN_LENGTH = 6
+
+def _ids_conflict(entry: dict, player_id) -> bool:
+    """プレイヤーIDがどちらも読めていて異なる場合は別人 (よくある名前)"""
+    scanned_id = normalize_player_id(player_id)
+    registered_id = normalize_player_id(entry.get('player_id'))
+    return bool(scanned_id and registered_id and scanned_id != registered_id)
+
+def fuzzy_matches(config, name: str, player_id=None) -> List[str]:
+    """編集距離が閾値以内で、プレイヤーIDが食い違わない登録名 (近い順)"""
+    return [
+        candidate for candidate, _ in config.player_fuzzy_index.search(name)
+        if not _ids_conflict(config.player_names.get(candidate, {}), player_id)
+    ]
+
+def find_hazard(config, name: str, player_id=None, sc_id=None, fuzzy: bool = True) -> Tuple[Optional[str], Optional[str]]:
+    """お荷物リストに該当する登録名と、一致したキー ('player_id' | 'sc_id' | 'name' | 'fuzzy') を返す
+
+    表記ゆれの候補はあるが一致とはみなせない場合 (名前が短い・候補が複数) は (None, 'fuzzy_review') を返します。
+    この場合はお荷物扱いにせず、呼び出し側で管理者に確認を依頼します。
+    """
+    index = config.player_index
+    registered = index.find_by_player_id(player_id)
+    if registered is not None:
+        return registered, "player_id"
+    registered = index.find_by_sc_id(sc_id)
+    if registered is not None and not _ids_conflict(config.player_names.get(registered, {}), player_id):
+        # Supercell ID は OCR の読み違いで他人と一致することがあるため、プレイヤーIDが食い違う場合は採用しない
+        return registered, "sc_id"
+
+    entry = config.player_names.get(name)
+    if entry is not None:
+        if _ids_conflict(entry, player_id):
+            return None, None
+        return name, "name"
+
+    if fuzzy:
+        # OCR の1文字違いなど、編集距離が閾値以内の登録名
+        # 十分に長い名前で、閾値以内の候補がちょうど1件の場合だけ一致とする
+        candidates = config.player_fuzzy_index.search(name)
+        matches = [c for c, _ in candidates if not _ids_conflict(config.player_names.get(c, {}), player_id)]
+        if not matches:
+            return None, None
+        if len(fuzzy_key(name)) >= FUZZY_MIN_LENGTH and len(candidates) == 1:
+            return matches[0], "fuzzy"
+        return None, "fuzzy_review"
+    return None, None
+
+def merge_identity(config, old_name: str, new_name: str) -> bool:
+    """同じプレイヤーが改名して報告された場合に、旧名の記録を新しい名前へ統合する
+
+    呼び出し側はプレイヤーIDで一致した場合 (find_hazard のキーが 'player_id') だけ呼びます。
+    Supercell ID だけの一致では統合しません。
+    """
+    if old_name == new_name or old_name not in config.player_names:
+        return False
+    entry = config.player_names.pop(old_name)
+    old_count = config.player_register_count.pop(old_name, 0)
+    if new_name in config.player_names:
+        # 両方の名前で記録がある場合は新しい名前の記録を残し、回数を合算
+        entry = config.player_names[new_name]
+    entry['name'] = new_name
+    previous = entry.setdefault('previous_names', [])
+    if old_name not in previous:
+        previous.append(old_name)
+    config.player_names[new_name] = entry
+    config.player_register_count[new_name] = config.player_register_count.get(new_name, 0) + old_count
+    config.save_player(old_name, new_name)
+    print(f"🔗 同一プレイヤーの記録を統合しました: {old_name} -> {new_name}")
+    return True
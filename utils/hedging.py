@@ -0,0 +1,107 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# 投機的な並行実行 (ヘッジ)
+# 最初のエンジンが delay 秒以内に有効な結果を返さなければ、次のエンジンも並行して呼び出し、
+# 先に有効な結果を返した方を採用して、もう一方は取り消します。
+
+class HedgeResult:
+    """run_hedged の結果
+
+    value: 採用した結果 (どちらも有効な結果を返さなければ None)
+    winner: 0 = 最初のエンジン / 1 = 予備のエンジン / None = どちらも失敗
+    hedged: 予備のエンジンを呼び出したか
+    errors: 失敗したエンジンの番号 -> 例外
+    """
+
+    def __init__(self, value: Any = None, winner: Optional[int] = None, hedged: bool = False,
+                 errors: Optional[Dict[int, BaseException]] = None):
+        self.value = value
+        self.winner = winner
+        self.hedged = hedged
+        self.errors = errors or {}
+
+async def run_hedged(primary: Callable[[], Awaitable[Any]], launch_backup: Callable[[], Awaitable[Optional[Callable[[], Awaitable[Any]]]]],
+                     delay: float, valid: Callable[[Any], bool] = bool) -> HedgeResult:
+    """primary() を開始し、delay 秒以内に有効な結果が出なければ予備も開始して、先に有効な結果を返した方を採用する
+
+    launch_backup() は予備の呼び出し関数を返す (予備を使えない場合は None)。
+    最初のエンジンが delay 秒より前に失敗した場合は予備を開始せずに返します (通常のフォールバックに任せる)。
+    """
+    tasks = [asyncio.ensure_future(primary())]
+    result = HedgeResult()
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            backup = await launch_backup()
+            if backup is not None:
+                tasks.append(asyncio.ensure_future(backup()))
+                result.hedged = True
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # 同時に終わった場合は最初のエンジンを優先
+            for task in sorted(done, key=tasks.index):
+                index = tasks.index(task)
+                if task.exception() is not None:
+                    result.errors[index] = task.exception()
+                elif valid(task.result()):
+                    result.value, result.winner = task.result(), index
+                    return result
+        return result
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+class HedgeTracker:
+    """ヘッジの設定と統計
+
+    mode: 'off' = 使わない / 'on' = 使う / 'ab' = 使う・使わないを交互にして応答時間を比較
+    """
+
+    MODES = ("off", "on", "ab")
+
+    def __init__(self, mode: str = "off", min_delay: float = 3.0, samples: int = 500):
+        self.mode = mode
+        self.min_delay = min_delay
+        self._ab_toggle = False
+        self.latencies = {"hedge": deque(maxlen=samples), "plain": deque(maxlen=samples)}
+        self.stats = {"scans": 0, "hedged": 0, "backup_wins": 0}
+
+    def use_hedge(self) -> bool:
+        """今回の解析でヘッジを使うか"""
+        if self.mode == "off":
+            return False
+        if self.mode == "on":
+            return True
+        self._ab_toggle = not self._ab_toggle
+        return self._ab_toggle
+
+    def delay(self, p90_ms: Optional[float], timeout: float) -> float:
+        """予備を開始するまでの秒数: 最初のエンジンの直近の p90 (記録がなければタイムアウトの半分)。min_delay 未満にはしない"""
+        base = p90_ms / 1000 if p90_ms is not None else timeout / 2
+        return max(self.min_delay, base)
+
+    def record(self, hedging: bool, seconds: float, hedged: bool = False, backup_won: bool = False):
+        """エンジンを呼び出した解析1件分の所要時間を記録する"""
+        self.latencies["hedge" if hedging else "plain"].append(seconds)
+        if hedging:
+            self.stats["scans"] += 1
+            self.stats["hedged"] += int(hedged)
+            self.stats["backup_wins"] += int(backup_won)
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats["mode"] = self.mode
+        stats["min_delay"] = self.min_delay
+        stats["hedge_rate"] = stats["hedged"] / stats["scans"] if stats["scans"] else 0.0
+        for variant, samples in self.latencies.items():
+            ordered = sorted(samples)
+            stats[variant] = {
+                "samples": len(ordered),
+                "p50": ordered[len(ordered) // 2] if ordered else None,
+                "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] if ordered else None,
+            }
+        return stats
@@ -1,3 +1,4 @@
+import asyncio
 import re
 
 def normalize_text(text: str) -> str:
@@ -63,7 +64,19 @@ def normalize_synonyms(text: str) -> str:
     return SYNONYM_PATTERN.sub(lambda m: SYNONYMS[m.group(0).lower()], text.lower())
 
 def run_unit_tests() -> list[str]:
-    """ヘルパー関数の単体テストを実行"""
+    """ヘルパー関数と、お荷物判定・レート制限で使う部品の単体テストを実行"""
+    import io
+    import os
+    import tempfile
+    from PIL import Image
+    from utils.aimd import AimdController
+    from utils.attachments import AttachmentBuffer, image_size
+    from utils.engine_router import EngineRouter
+    from utils.fuzzy_index import FuzzyNameIndex, bounded_levenshtein
+    from utils.journal import MutationJournal
+    from utils.ratelimit import QuotaReservations, RateLimiter
+    from utils.timestamp_ring import TimestampRing
+
     results = []
     try:
         # テスト 1: normalize_text
@@ -79,9 +92,388 @@ def run_unit_tests() -> list[str]:
         assert has_any("あいうえお", ["か", "う"]), "has_any が失敗しました"
         results.append("✅ テスト: has_any")
 
+        # テスト 4: bounded_levenshtein (閾値を超えたら None)
+        assert bounded_levenshtein("kitten", "sitting", 3) == 3, "bounded_levenshtein が失敗しました (1)"
+        assert bounded_levenshtein("kitten", "sitting", 2) is None, "bounded_levenshtein が失敗しました (2)"
+        assert bounded_levenshtein("abc", "abc", 1) == 0, "bounded_levenshtein が失敗しました (3)"
+        assert bounded_levenshtein("abc", "abd", 1) == 1, "bounded_levenshtein が失敗しました (4)"
+        assert bounded_levenshtein("ab", "ba", 1) is None, "bounded_levenshtein が失敗しました (5)"
+        assert bounded_levenshtein("", "ab", 2) == 2, "bounded_levenshtein が失敗しました (6)"
+        results.append("✅ テスト: bounded_levenshtein")
+
+        # テスト 5: FuzzyNameIndex (追加・削除・改名・検索)
+        index = FuzzyNameIndex()
+        index.rebuild(["Ryuusei", "Ken", "ken"])
+        assert index.search("Ryuusel") == [("Ryuusei", 1)], "FuzzyNameIndex の検索が失敗しました"
+        assert index.search("RYUUSEI") == [("Ryuusei", 0)], "FuzzyNameIndex の表記ゆれの吸収が失敗しました"
+        index.remove("ken")
+        assert index.search("Ken") == [("Ken", 0)], "FuzzyNameIndex の削除が失敗しました (同じキーの名前)"
+        players = {"Ryuusei2": {}, "Ken": {}}
+        index.refresh(players, ["Ryuusei", "Ryuusei2"])
+        assert index.search("Ryuusei") == [("Ryuusei2", 1)], "FuzzyNameIndex の改名が失敗しました"
+        index.add("Ken")
+        assert len(index) == 2 and "Ryuusei" not in index, "FuzzyNameIndex の件数が一致しません"
+        results.append("✅ テスト: FuzzyNameIndex")
+
+        # テスト 6: TimestampRing (追記・期限切れ・拡張・開き直し)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.ring")
+            ring = TimestampRing(path, capacity=4)
+            for ts in range(1, 7):
+                ring.append(float(ts))
+            assert ring.grows == 1 and ring.capacity == 8, "TimestampRing の拡張が失敗しました"
+            assert ring.expire(2.0) == 2 and list(ring) == [3.0, 4.0, 5.0, 6.0], "TimestampRing の期限切れが失敗しました"
+            ring.close()
+            ring = TimestampRing(path)
+            assert list(ring) == [3.0, 4.0, 5.0, 6.0], "TimestampRing の開き直しが失敗しました"
+            ring.close()
+            keyed = TimestampRing(os.path.join(tmp, "users.ring"), capacity=2, keyed=True)
+            for ts, user_id in ((1.0, 10), (2.0, 20), (3.0, 30)):
+                keyed.append(ts, user_id)
+            assert list(keyed) == [(1.0, 10), (2.0, 20), (3.0, 30)], "TimestampRing (キー付き) が失敗しました"
+            keyed.close()
+        results.append("✅ テスト: TimestampRing")
+
+        # テスト 7: RateLimiter (ウィンドウの境界: ちょうど window 秒前の記録は数えない)
+        now = 1_000_000.0
+        limiter = RateLimiter()
+        limiter.record("flash", now - 3600, now)
+        assert limiter.count("flash", 3600, now) == 0, "RateLimiter の境界が失敗しました (1)"
+        assert limiter.count("flash", 86400, now) == 1, "RateLimiter の境界が失敗しました (2)"
+        limiter.record("flash", now - 3599.5, now)
+        assert limiter.count("flash", 3600, now) == 1, "RateLimiter の境界が失敗しました (3)"
+        assert not limiter.allows("flash", {3600: 1}, now), "RateLimiter の判定が失敗しました (1)"
+        assert limiter.retry_after("flash", {3600: 1}, now) == 0.5, "RateLimiter の待ち時間が失敗しました"
+        assert limiter.allows("flash", {3600: 1}, now + 0.5), "RateLimiter の判定が失敗しました (2)"
+        limiter.record("flash", now - 86400, now)
+        assert limiter.count("flash", 86400, now) == 2, "RateLimiter の期限切れの記録が数えられています"
+        assert limiter.allows("vision", {3600: 1}, now) and not limiter.allows("vision", {3600: 0}, now), "RateLimiter の判定が失敗しました (3)"
+        results.append("✅ テスト: RateLimiter")
+
+        # テスト 8: ScanScheduler (同じチャンネルの反映は投入順・解析の失敗も反映処理へ渡す)
+        asyncio.run(_check_scan_commit_order())
+        results.append("✅ テスト: ScanScheduler (反映順)")
+
+        # テスト 9: ScanScheduler (一括処理は対話・投稿に譲り、同時実行は workers - 1 まで)
+        asyncio.run(_check_scan_priorities())
+        results.append("✅ テスト: ScanScheduler (優先度)")
+
+        # テスト 10: QuotaReservations (予約→確定・返却・期限切れ・待ち時間・解析終了時の精算)
+        limiter = RateLimiter()
+        reservations = QuotaReservations(ttl=60)
+        limits = {3600: 2}
+        first = reservations.reserve(limiter, "flash", limits, now)
+        second = reservations.reserve(limiter, "flash", limits, now)
+        assert first and second and reservations.reserve(limiter, "flash", limits, now) is None, "QuotaReservations が枠を超えて予約しました"
+        assert reservations.retry_after(limiter, "flash", limits, now) == 3600, "QuotaReservations の待ち時間が予約を数えていません (1)"
+        # 確定: 呼び出し側が記録し、予約は消える (記録と予約の合計で判定)
+        reservations.commit(first)
+        limiter.record("flash", now - 100, now)
+        assert reservations.active("flash", now) == 1 and reservations.reserve(limiter, "flash", limits, now) is None, "QuotaReservations の確定が失敗しました"
+        # 返却: 枠が戻る
+        reservations.release(second)
+        third = reservations.reserve(limiter, "flash", limits, now)
+        assert third is not None, "QuotaReservations の返却が失敗しました"
+        # 記録1件 + 予約1件で上限: 記録が期限切れになるまで待つ (予約を数えなければ 0 秒になる)
+        assert reservations.retry_after(limiter, "flash", limits, now) == 3500, "QuotaReservations の待ち時間が予約を数えていません (2)"
+        # 期限切れ: ttl を過ぎた予約は数えず、後から確定しても数えない
+        later = now + 61
+        assert not reservations.holds(third, later) and reservations.active("flash", later) == 0, "QuotaReservations の期限切れが失敗しました"
+        reservations.commit(third)
+        assert reservations.stats["expired"] == 1 and reservations.stats["committed"] == 1, "QuotaReservations の統計が一致しません"
+        # 精算: 推奨エンジン (flash) が失敗して予備 (lite) で成功した場合、flash は返却・lite は確定
+        held = {engine: reservations.reserve(limiter, engine, {3600: 5}, later) for engine in ("flash", "lite")}
+        reservations.settle(held, {"lite"})
+        assert reservations.stats["released"] == 2 and reservations.stats["committed"] == 2, "QuotaReservations の精算が失敗しました"
+        assert reservations.active("flash", later) == 0 and reservations.active("lite", later) == 0, "QuotaReservations の精算後に予約が残っています"
+        results.append("✅ テスト: QuotaReservations")
+
+        # テスト 11: MutationJournal (途切れた最終行の切り捨て・畳み込み途中のクラッシュ)
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = MutationJournal(os.path.join(tmp, "journal.jsonl"), os.path.join(tmp, "snapshot.json"))
+            journal.append_many([{"seq": seq, "op": "set", "key": f"k{seq}"} for seq in (1, 2, 3)])
+            intact = os.path.getsize(journal.journal_path)
+            with open(journal.journal_path, "ab") as f:
+                f.write(b'{"seq":4,"op":"se')  # 書き込み中のクラッシュ
+            state, records, last_seq = journal.load()
+            assert state is None and [r["seq"] for r in records] == [1, 2, 3] and last_seq == 3, "MutationJournal が途切れた行以外を失いました"
+            assert os.path.getsize(journal.journal_path) == intact, "MutationJournal が途切れた行を切り捨てていません"
+            journal.append_many([{"seq": 4, "op": "set", "key": "k4"}])
+            _, records, last_seq = journal.load()
+            assert [r["seq"] for r in records] == [1, 2, 3, 4] and last_seq == 4, "MutationJournal の切り捨て後の追記が読めません"
+
+            # スナップショットの書き込み後・ジャーナルの切り詰め前にクラッシュした状態を再現する
+            with open(journal.journal_path, "rb") as f:
+                before_compact = f.read()
+            journal.compact({"k": 4}, 4)
+            with open(journal.journal_path, "wb") as f:
+                f.write(before_compact)
+            journal.append_many([{"seq": 5, "op": "set", "key": "k5"}])
+            state, records, last_seq = journal.load()
+            assert state == {"k": 4}, "MutationJournal のスナップショットが読めません"
+            assert [r["seq"] for r in records] == [5] and last_seq == 5, f"MutationJournal が畳み込み済みのレコードを二重に適用します: {records}"
+            assert journal.records_since_snapshot == 1, "MutationJournal の未畳み込み件数が一致しません"
+        results.append("✅ テスト: MutationJournal")
+
+        # テスト 12: EngineRouter (閉 → 開 → 半開 → 閉、取り消された試行)
+        router = EngineRouter(cooldown=10, failure_threshold=2)
+        router.record("flash", "error", 100.0, now=0.0)
+        assert router.health["flash"].state == "closed", "EngineRouter が1回の失敗で遮断しました"
+        router.record("flash", "timeout", 100.0, now=1.0)
+        assert router.health["flash"].state == "open", "EngineRouter が連続した失敗で遮断していません"
+        assert not router.acquire("flash", now=5.0) and router.order(["flash", "lite"], now=5.0) == ["lite"], "EngineRouter が遮断中のエンジンを使いました"
+        assert router.acquire("flash", now=11.0) and router.health["flash"].state == "half_open", "EngineRouter が cooldown 後に半開になりません"
+        assert not router.acquire("flash", now=12.0), "EngineRouter が半開で2件目を送りました"
+        router.record("flash", "cancelled", None, now=12.0)
+        assert router.acquire("flash", now=12.0), "EngineRouter が取り消された試行の後に次の試行を送れません"
+        router.record("flash", "error", 100.0, now=13.0)
+        assert router.health["flash"].state == "open" and not router.acquire("flash", now=14.0), "EngineRouter が試行の失敗で再び遮断していません"
+        assert router.acquire("flash", now=23.0), "EngineRouter が再び半開になりません"
+        router.record("flash", "ok", 100.0, now=24.0)
+        assert router.health["flash"].state == "closed" and router.acquire("flash", now=24.0), "EngineRouter が試行の成功で閉じません"
+        asyncio.run(_check_engine_slot_cancel())
+        results.append("✅ テスト: EngineRouter")
+
+        # テスト 13: run_hedged (負けた側の取り消しと予約の返却・予備は共有の順番から次のエンジンを取る)
+        asyncio.run(_check_hedged_fallback())
+        results.append("✅ テスト: run_hedged")
+
+        # テスト 14: AimdController (成功で 1/上限 ずつ上げ、429・タイムアウトでは応答1巡につき1回だけ半分にする)
+        controller = AimdController({"flash": 8}, {"flash": 4})
+        controller.record("flash", "ok", 100.0, now=10.0)
+        controller.record("flash", "ok", 100.0, now=10.0)
+        assert abs(controller.windows["flash"].limit - (4.25 + 1 / 4.25)) < 1e-9, "AimdController の増やし方が 1/上限 ではありません"
+        controller.record("flash", "throttled", 1000.0, now=20.0)
+        limit = controller.windows["flash"].limit
+        assert abs(limit - (4.25 + 1 / 4.25) / 2) < 1e-9 and controller.limit("flash") == 2, "AimdController が 429 で半分にしていません"
+        # 下げる前 (19.5秒) に送っていた呼び出しの失敗では重ねて下げない
+        controller.record("flash", "timeout", 500.0, now=20.0)
+        controller.record("flash", "throttled", 1000.0, now=20.5)
+        assert controller.windows["flash"].limit == limit and controller.windows["flash"].decreases == 1, "AimdController が同じ混雑で何度も下げました"
+        # 下げた後に送った呼び出しがタイムアウトしたら、もう一度下げる
+        controller.record("flash", "timeout", 1000.0, now=21.5)
+        assert controller.windows["flash"].decreases == 2 and controller.windows["flash"].congestion == 4, "AimdController が次の応答でタイムアウトを数えていません"
+        assert controller.limit("flash") == 1, "AimdController の上限が min_limit を下回りました"
+        controller.record("flash", "cancelled", None, now=22.0)
+        assert controller.windows["flash"].congestion == 4, "AimdController が取り消しを混雑として数えました"
+        asyncio.run(_check_aimd_throttling())
+        results.append("✅ テスト: AimdController")
+
+        # テスト 15: image_size (プロキシの縮小版の座標換算には、指定した大きさではなく実際の大きさを使う)
+        output = io.BytesIO()
+        Image.new("RGB", (1600, 900)).save(output, "WEBP")
+        data = bytearray(output.getvalue())
+        assert image_size(memoryview(data)) == (1600, 900), "image_size が画像の大きさを読めません"
+        assert image_size(memoryview(bytearray(b"not an image"))) is None, "image_size が画像でないデータの大きさを返しました"
+        assert AttachmentBuffer("", data, None, (3200, 1800), image_size(memoryview(data))).scale == 2.0, "AttachmentBuffer の倍率が一致しません"
+        results.append("✅ テスト: image_size")
+
     except AssertionError as e:
         results.append(f"❌ テスト失敗: {e}")
     except Exception as e:
         results.append(f"❌ テストエラー: {e}")
     
     return results
+
+# ====== 非同期の部品のテスト (run_unit_tests から asyncio.run で実行、失敗は AssertionError) ======
+async def _check_scan_commit_order():
+    from utils.scan_scheduler import ScanScheduler
+
+    scheduler = ScanScheduler(workers=3)
+    committed = []
+
+    def analyze(delay: float, fail: bool = False):
+        async def run():
+            await asyncio.sleep(delay)
+            if fail:
+                raise ValueError("解析失敗")
+            return delay
+        return run
+
+    def commit(label: str):
+        async def run(result, error):
+            committed.append((label, result, type(error).__name__ if error else None))
+            return label
+        return run
+
+    # 後から投入した c が最初に解析を終え、b は解析に失敗する
+    tasks = [
+        scheduler.submit("channel", analyze(0.05), commit("a")),
+        scheduler.submit("channel", analyze(0.02, fail=True), commit("b")),
+        scheduler.submit("channel", analyze(0.0), commit("c")),
+    ]
+    assert await asyncio.gather(*tasks) == ["a", "b", "c"], "ScanScheduler の戻り値が一致しません"
+    assert [label for label, _, _ in committed] == ["a", "b", "c"], f"ScanScheduler の反映順が投入順ではありません: {committed}"
+    assert committed[1] == ("b", None, "ValueError"), "ScanScheduler が解析の失敗を反映処理へ渡していません"
+    assert committed[2] == ("c", 0.0, None), "ScanScheduler が失敗の後の反映を行っていません"
+    # 反映処理がない場合は解析の例外がそのまま返る
+    try:
+        await scheduler.submit(None, analyze(0.0, fail=True))
+        raise AssertionError("ScanScheduler が解析の例外を返していません")
+    except ValueError:
+        pass
+    assert scheduler.stats["completed"] == 4 and scheduler.stats["failed"] == 1, "ScanScheduler の統計が一致しません"
+    assert not scheduler._tails, "ScanScheduler のチャンネルごとの末尾が残っています"
+
+async def _check_engine_slot_cancel():
+    """遮断後の試行が同時呼び出し数の枠を待っている間に取り消されても、次の試行を送れる"""
+    import time
+    from utils.engine_router import EngineRouter
+    from utils.fake_engines import FakeGeminiModel
+    from utils.ocr_engines import GeminiEngine
+    from utils.scan_scheduler import ScanScheduler
+
+    scheduler = ScanScheduler(workers=2, engine_caps={"flash": 1})
+    router = EngineRouter(cooldown=10, failure_threshold=1)
+    engine = GeminiEngine("flash", FakeGeminiModel(0.05), 5, scheduler.engine_slot, router)
+    router.record("flash", "error", 100.0, now=time.monotonic() - 20)  # cooldown を過ぎた遮断
+    busy = asyncio.create_task(engine.generate(["prompt"]))  # 枠を埋めておく
+    await asyncio.sleep(0)
+    assert router.acquire("flash"), "EngineRouter が cooldown 後に試行を送れません"
+    probe = asyncio.create_task(engine.generate(["prompt"]))
+    await asyncio.sleep(0.01)
+    probe.cancel()
+    await asyncio.gather(probe, return_exceptions=True)
+    health = router.health["flash"]
+    assert health.probe_started is None and engine.stats["cancelled"] == 1, "枠を待っている間の取り消しが記録されていません"
+    assert engine.stats["calls"] == 1 and len(health.calls) == 1, "呼び出していない取り消しが応答時間に記録されました"
+    await busy
+    assert health.state == "closed", "EngineRouter が成功した呼び出しで閉じません"
+
+async def _check_hedged_fallback():
+    """BrawlStarsCog._hybrid_extract と同じ手順 (受付 → ヘッジ → 精算) を代替クライアントで実行する"""
+    import functools
+    from utils.engine_router import EngineRouter
+    from utils.fake_engines import FakeGeminiModel
+    from utils.hedging import run_hedged
+    from utils.ocr_engines import GeminiEngine
+    from utils.ratelimit import QuotaReservations, RateLimiter
+
+    router = EngineRouter()
+    limiter = RateLimiter()
+    reservations = QuotaReservations()
+    now = 1_000_000.0
+
+    async def scan(latencies: dict, errors: dict, delay: float):
+        engines = {
+            name: GeminiEngine(name, FakeGeminiModel(latency, error=errors.get(name)), 5, monitor=router)
+            for name, latency in latencies.items()
+        }
+        held, used, launched = {}, set(), []
+
+        def admit(engine: str) -> bool:
+            reservation = reservations.reserve(limiter, engine, {3600: 10}, now)
+            if reservation is None:
+                return False
+            if not router.acquire(engine):
+                reservations.release(reservation)
+                return False
+            held[engine] = reservation
+            return True
+
+        order = iter(router.order(list(engines)))
+        engine = next(order)
+        assert admit(engine)
+        launched.append(engine)
+
+        async def launch_backup():
+            for backup in order:
+                if admit(backup):
+                    launched.append(backup)
+                    return functools.partial(engines[backup].generate, ["prompt"])
+            return None
+
+        outcome = await run_hedged(functools.partial(engines[engine].generate, ["prompt"]), launch_backup, delay)
+        if outcome.winner is not None:
+            used.add(launched[outcome.winner])
+        reservations.settle(held, used)
+        await asyncio.sleep(0.01)  # 取り消した側の後始末を待つ
+        return outcome, launched, list(order), engines
+
+    # Flash が遅く、予備の Lite が先に返す: Flash は取り消して予約を返却、Lite の予約を確定、Vision は残る
+    outcome, launched, remaining, engines = await scan({"flash": 0.5, "lite": 0.01, "vision": 0.01}, {}, 0.02)
+    assert outcome.hedged and launched == ["flash", "lite"] and outcome.winner == 1, f"run_hedged の予備が一致しません: {launched}"
+    assert remaining == ["vision"], f"run_hedged が順番のエンジンを飛ばしました: {remaining}"
+    assert engines["flash"].stats["cancelled"] == 1, "run_hedged が負けた側を取り消していません"
+    assert reservations.stats["committed"] == 1 and reservations.stats["released"] == 1, "負けた側の予約が返却されていません"
+    assert reservations.active("flash", now) == 0 and reservations.active("lite", now) == 0, "精算後に予約が残っています"
+
+    # Flash が delay より前に失敗した場合は予備を開始せず、次のエンジンは通常のフォールバックに残る
+    outcome, launched, remaining, _ = await scan({"flash": 0.0, "lite": 0.01, "vision": 0.01}, {"flash": ValueError("失敗")}, 0.5)
+    assert not outcome.hedged and outcome.winner is None and 0 in outcome.errors, "run_hedged が早い失敗で予備を開始しました"
+    assert launched == ["flash"] and remaining == ["lite", "vision"], f"run_hedged が予備の順番を消費しました: {remaining}"
+    assert reservations.stats["released"] == 2, "失敗したエンジンの予約が返却されていません"
+
+async def _check_scan_priorities():
+    from utils.scan_scheduler import ScanScheduler
+
+    scheduler = ScanScheduler(workers=2)
+    started = []
+    gates = {}
+    peak_batch = 0
+
+    def job(label: str):
+        gate = gates[label] = asyncio.Event()
+
+        async def run():
+            nonlocal peak_batch
+            started.append(label)
+            peak_batch = max(peak_batch, scheduler.running_by_class["batch"])
+            await gate.wait()
+            return label
+        return run
+
+    async def release(label: str):
+        gates[label].set()
+        await asyncio.sleep(0.01)
+
+    tasks = [scheduler.submit(None, job(f"batch{i}"), priority="batch") for i in range(3)]
+    await asyncio.sleep(0.01)
+    assert started == ["batch0"], f"一括処理が workers - 1 を超えて開始されました: {started}"
+    # 一括処理が待っている間に投稿とコマンドが届く: 空いている1枠はコマンドが先に使う
+    tasks.append(scheduler.submit(None, job("live"), priority="live"))
+    tasks.append(scheduler.submit(None, job("interactive"), priority="interactive"))
+    await asyncio.sleep(0.01)
+    assert started == ["batch0", "interactive"], f"コマンドが先に開始されていません: {started}"
+    # 一括処理が終わって空いた枠は、待っている投稿に譲る
+    await release("batch0")
+    assert started == ["batch0", "interactive", "live"], f"一括処理が投稿に順番を譲っていません: {started}"
+    # 対話・投稿の待ちがなくなれば一括処理を再開する (実行中は1件まで)
+    await release("interactive")
+    assert started[-1] == "batch1", f"一括処理が再開されていません: {started}"
+    await release("live")
+    assert started[-1] == "batch1", f"一括処理が workers - 1 を超えて開始されました: {started}"
+    for label in ("batch1", "batch2"):
+        await release(label)
+    await asyncio.gather(*tasks)
+    assert started[-1] == "batch2" and peak_batch == 1, f"一括処理の同時実行数が一致しません: {peak_batch}"
+
+async def _check_aimd_throttling():
+    """同時に2件までしか受け付けない代替 Gemini に6件ずつ送り、上限を下げるのが1巡に1回だけであることを確かめる"""
+    from utils.aimd import AimdController
+    from utils.fake_engines import FakeGeminiModel, FakeThrottlingModel
+    from utils.ocr_engines import GeminiEngine
+
+    controller = AimdController({"flash": 8, "lite": 8}, {"flash": 4, "lite": 4})
+    model = FakeThrottlingModel(capacity=2, latency=0.05, throttle_latency=0.01)
+    engine = GeminiEngine("flash", model, 5, monitor=controller)
+    window = controller._window("flash")
+
+    async def burst():
+        return await asyncio.gather(*(engine.generate(["prompt"]) for _ in range(6)), return_exceptions=True)
+
+    expected = 4.0
+    for rtt in (1, 2):
+        await burst()
+        # 同時に返った4件の 429 で1回だけ半分にし、受け付けられた2件の成功でそれぞれ 1/上限 上げる
+        expected /= 2
+        expected += 1 / expected
+        expected += 1 / expected
+        assert window.decreases == rtt and window.congestion == 4 * rtt, f"AimdController が同じ混雑で何度も下げました: {window.decreases}"
+        assert abs(window.limit - expected) < 1e-9, f"AimdController の上限が一致しません: {window.limit} != {expected}"
+    assert model.throttled == 8 and model.accepted == 4, "FakeThrottlingModel の受付数が一致しません"
+
+    # 同時に送った呼び出しがまとめてタイムアウトした場合も1回だけ下げる
+    lite = GeminiEngine("lite", FakeGeminiModel(latency=0.2), 0.02, monitor=controller)
+    await asyncio.gather(*(lite.generate(["prompt"]) for _ in range(3)), return_exceptions=True)
+    assert controller.windows["lite"].decreases == 1 and controller.limit("lite") == 2, "AimdController がタイムアウトで1回だけ下げていません"
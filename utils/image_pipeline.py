@@ -0,0 +1,183 @@
+import asyncio
+import io
+import time
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from PIL import Image
+
+# Gemini に渡す画像の長辺 (px)
+MODEL_MAX_SIZE = 1600
+# 保存する WebP の長辺 (px) と画質
+ARCHIVE_MAX_SIZE = 1280
+ARCHIVE_QUALITY = 75
+# Vision に送る切り出し画像の JPEG 画質 (元の解像度のまま送るため、サイズを抑える)
+VISION_ROI_QUALITY = 90
+
+class PreprocessedImage:
+    """前処理の結果 (ワーカープロセスから pickle で返すため、バイト列と数値だけを持つ)"""
+
+    def __init__(self, model_png: bytes, archive_webp: bytes, source_size: tuple, cpu_ms: float, peak_rss_kb: int = 0,
+                 model_roi_png: Optional[bytes] = None, vision_roi: Optional[bytes] = None):
+        self.model_png = model_png        # Gemini 入力用 (長辺 MODEL_MAX_SIZE 以下の PNG)
+        self.archive_webp = archive_webp  # 保存用 (長辺 ARCHIVE_MAX_SIZE 以下の WebP)
+        self.source_size = source_size
+        self.cpu_ms = cpu_ms
+        self.peak_rss_kb = peak_rss_kb    # 処理したワーカープロセスのピーク RSS
+        # 上端からの帯だけを切り出した画像 (ROI、切り出さない場合は None)
+        self.model_roi_png = model_roi_png  # Gemini 用
+        self.vision_roi = vision_roi        # Vision 用 (元の解像度の JPEG。座標が元画像と一致する)
+
+def peak_rss_kb() -> int:
+    """このプロセスのピーク RSS (KB)。取得できない環境では 0"""
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _fit(img: Image.Image, max_size: int, resample) -> Image.Image:
+    w, h = img.size
+    if max(w, h) <= max_size:
+        return img
+    scale = max_size / max(w, h)
+    return img.resize((int(w * scale), int(h * scale)), resample)
+
+def _fit_size(size: tuple, max_size: int) -> tuple:
+    w, h = size
+    if max(w, h) <= max_size:
+        return size
+    scale = max_size / max(w, h)
+    return int(w * scale), int(h * scale)
+
+def _encode(img: Image.Image, fmt: str, **params) -> bytes:
+    out = io.BytesIO()
+    img.save(out, fmt, **params)
+    return out.getvalue()
+
+def _top_band(img: Image.Image, ratio: float) -> Image.Image:
+    return img.crop((0, 0, img.width, max(1, int(img.height * ratio))))
+
+def preprocess_image(data: bytes, roi_ratio: float = 1.0) -> PreprocessedImage:
+    """ワーカープロセスで実行: 元画像のバイト列から Gemini 入力用 PNG と保存用 WebP を1回で作る
+
+    デコードは1回だけです。JPEG は draft() で Gemini 入力用の大きさ以上の
+    縮小デコード (1/2・1/4・1/8) を行い、保存用は元画像ではなく Gemini 入力用から縮小します。
+    大きい中間画像はすぐに閉じて、ワーカーのピークメモリを抑えます。
+    roi_ratio < 1 の場合は、上端から高さ roi_ratio までの帯を切り出した画像も作ります
+    (Vision 用は縮小デコードしていない場合だけ)。
+    """
+    start = time.thread_time()
+    with Image.open(io.BytesIO(data)) as img:
+        source_size = img.size
+        if img.format == "JPEG":
+            # 指定した大きさを下回らない範囲で DCT 段階の縮小デコード (JPEG 以外では何もしない)
+            img.draft("RGB", _fit_size(source_size, MODEL_MAX_SIZE))
+        decoded = img.convert("RGB")
+
+    vision_roi = None
+    if roi_ratio < 1.0 and decoded.size == source_size:
+        with _top_band(decoded, roi_ratio) as band:
+            vision_roi = _encode(band, "JPEG", quality=VISION_ROI_QUALITY)
+
+    model_img = _fit(decoded, MODEL_MAX_SIZE, Image.Resampling.BICUBIC)
+    if model_img is not decoded:
+        decoded.close()
+    # 圧縮率より速度を優先 (Gemini へ送るだけなのでサイズ差は小さい)
+    model_png = _encode(model_img, "PNG", compress_level=1)
+    model_roi_png = None
+    if roi_ratio < 1.0:
+        with _top_band(model_img, roi_ratio) as band:
+            model_roi_png = _encode(band, "PNG", compress_level=1)
+
+    archive_img = _fit(model_img, ARCHIVE_MAX_SIZE, Image.Resampling.LANCZOS)
+    archive_webp = _encode(archive_img, "WEBP", quality=ARCHIVE_QUALITY)
+    archive_img.close()
+    model_img.close()
+
+    return PreprocessedImage(
+        model_png, archive_webp, source_size, (time.thread_time() - start) * 1000, peak_rss_kb(),
+        model_roi_png, vision_roi
+    )
+
+class ImagePreprocessor:
+    """画像の前処理 (デコード・リサイズ・エンコード) をプロセスプールで実行する
+
+    イベントループのスレッドや GIL を共有するスレッドプールで重い処理を行わないため、
+    バースト時も複数コアを使え、Discord の heartbeat が遅れません。
+    結果は AttachmentBuffer ごとに1回だけ計算し、解析と保存で共有します。
+    """
+
+    def __init__(self, workers: int = 2):
+        self.workers = max(1, workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.stats = {"images": 0, "failures": 0, "cpu_ms": 0.0, "wall_ms": 0.0, "peak_rss_kb": 0}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def resize(self, workers: int):
+        """プールの大きさを変更する（実行中の処理は古いプールで最後まで実行）"""
+        self.workers = max(1, workers)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    async def run(self, data: bytes, roi_ratio: float = 1.0) -> PreprocessedImage:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(self._executor(), preprocess_image, data, roi_ratio)
+        except BrokenProcessPool:
+            # ワーカーが異常終了した場合は次回作り直す
+            self._pool = None
+            self.stats["failures"] += 1
+            raise
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        self.stats["images"] += 1
+        self.stats["cpu_ms"] += result.cpu_ms
+        self.stats["peak_rss_kb"] = max(self.stats["peak_rss_kb"], result.peak_rss_kb)
+        self.stats["wall_ms"] += (time.perf_counter() - start) * 1000
+        return result
+
+    async def process(self, buffer, roi_ratio: Optional[float] = None) -> PreprocessedImage:
+        """バッファの前処理結果を返す (roi_ratio ごとに初回だけ実行し、同時に呼ばれても1回にまとめる)
+
+        roi_ratio を省略した場合は帯の切り出しを使わない呼び出し (保存用 WebP など) とみなし、
+        どの roi_ratio の結果でも再利用します。失敗した結果は残さず、次の呼び出しで作り直します。
+        """
+        memo = buffer.preprocessed
+        if roi_ratio is None:
+            if memo:
+                return await asyncio.shield(next(iter(memo.values())))
+            roi_ratio = 1.0
+        future = memo.get(roi_ratio)
+        if future is None:
+            future = memo[roi_ratio] = asyncio.ensure_future(self.run(buffer.data, roi_ratio))
+
+            def forget_failure(done, key=roi_ratio):
+                if (done.cancelled() or done.exception() is not None) and memo.get(key) is done:
+                    del memo[key]
+
+            future.add_done_callback(forget_failure)
+        return await asyncio.shield(future)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["workers"] = self.workers
+        images = stats["images"]
+        stats["avg_cpu_ms"] = stats["cpu_ms"] / images if images else 0.0
+        stats["avg_wall_ms"] = stats["wall_ms"] / images if images else 0.0
+        return stats
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
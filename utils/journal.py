@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+from typing import Optional, Tuple
+
+class MutationJournal:
+    """型付きの変更を追記専用ファイルに記録し、定期的にスナップショットへ畳み込むジャーナル
+
+    ジャーナルは1行1レコードの JSON Lines で、各レコードは連番 (seq) を持ちます。
+    スナップショットには畳み込み済みの最後の seq が記録されるため、
+    スナップショット書き込み後・ジャーナル切り詰め前にクラッシュしても二重適用は起きません。
+    書き込み途中で途切れた最終行は読み込み時に無視されます。
+    """
+
+    def __init__(self, journal_path: str, snapshot_path: str):
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        self.records_since_snapshot = 0
+
+    def exists(self) -> bool:
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+
+    def load(self) -> Tuple[Optional[dict], list, int]:
+        """(スナップショットの状態, 再生すべきレコード, 最後の seq) を返す"""
+        state, last_seq = None, 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            state = snapshot.get("state")
+            last_seq = snapshot.get("seq", 0)
+
+        records = []
+        if os.path.exists(self.journal_path):
+            valid_bytes = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete line")
+                        record = json.loads(line)
+                    except ValueError:
+                        # 途中で途切れた行（書き込み中のクラッシュ）以降は信用しない
+                        print(f"⚠️ ジャーナルの破損した行を切り捨てました: {self.journal_path}")
+                        break
+                    valid_bytes += len(line)
+                    if record.get("seq", 0) > last_seq:
+                        records.append(record)
+                        last_seq = record["seq"]
+            # 以降の追記が破損行の後ろに続かないよう、正常な部分だけを残す
+            if valid_bytes != os.path.getsize(self.journal_path):
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(valid_bytes)
+        self.records_since_snapshot = len(records)
+        return state, records, last_seq
+
+    def append_many(self, records: list):
+        """レコードをまとめて追記し、1回だけ fsync する"""
+        if not records:
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records)
+        with self._lock:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self.records_since_snapshot += len(records)
+
+    def compact(self, state: dict, seq: int):
+        """状態をスナップショットとして書き出し、ジャーナルを切り詰める"""
+        with self._lock:
+            temp_file = f"{self.snapshot_path}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump({"seq": seq, "state": state}, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.snapshot_path)
+            # スナップショットに含まれたのでジャーナルは空にしてよい
+            with open(self.journal_path, "w", encoding="utf-8") as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self.records_since_snapshot = 0
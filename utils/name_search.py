@@ -0,0 +1,153 @@
+import bisect
+import heapq
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+class NameSearchIndex:
+    """オートコンプリート用の名前検索インデックス
+
+    小文字化 (casefold) した名前をキャッシュし、前方一致はソート済み配列の二分探索、
+    部分一致は 1文字・2文字の n-gram の転置リストの積集合で候補を絞ってから確認します。
+    結果は「前方一致 → 部分一致」の順に、それぞれ登録回数の多い順で返します。
+    """
+
+    MAX_CHAR = "\U0010ffff"
+
+    def __init__(self, latency_samples: int = 1000):
+        self.folded: Dict[str, str] = {}             # 名前 -> 小文字化した名前
+        self.sorted_keys: List[Tuple[str, str]] = []  # (小文字化した名前, 名前) のソート済み配列
+        self.grams: Dict[str, Set[str]] = {}          # 1文字・2文字 -> 名前
+        # 空文字検索 (登録回数上位) の結果と、その時点の登録回数・以降に変更された名前
+        self._top_cache: Optional[List[str]] = None
+        self._top_counts: Dict[str, int] = {}
+        self._top_dirty: Set[str] = set()
+        self.latencies = deque(maxlen=latency_samples)
+        self.searches = 0
+
+    @staticmethod
+    def _grams_of(folded: str) -> Set[str]:
+        grams = set(folded)
+        grams.update(folded[i:i + 2] for i in range(len(folded) - 1))
+        return grams
+
+    def __len__(self) -> int:
+        return len(self.folded)
+
+    def add(self, name: str):
+        if name in self.folded:
+            return
+        folded = name.casefold()
+        self.folded[name] = folded
+        bisect.insort(self.sorted_keys, (folded, name))
+        for gram in self._grams_of(folded):
+            self.grams.setdefault(gram, set()).add(name)
+        self._top_dirty.add(name)
+
+    def remove(self, name: str):
+        folded = self.folded.pop(name, None)
+        if folded is None:
+            return
+        i = bisect.bisect_left(self.sorted_keys, (folded, name))
+        if i < len(self.sorted_keys) and self.sorted_keys[i] == (folded, name):
+            del self.sorted_keys[i]
+        for gram in self._grams_of(folded):
+            names = self.grams.get(gram)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self.grams[gram]
+        self._top_dirty.add(name)
+
+    def rebuild(self, names: Iterable[str]):
+        """名前の一覧から作り直す（読み込み・一括処理用）"""
+        self.folded = {name: name.casefold() for name in names}
+        self.sorted_keys = sorted((folded, name) for name, folded in self.folded.items())
+        self.grams = {}
+        for name, folded in self.folded.items():
+            for gram in self._grams_of(folded):
+                self.grams.setdefault(gram, set()).add(name)
+        self._top_cache = None
+        self._top_dirty = set()
+
+    def refresh(self, players: Dict, names: Iterable[str]):
+        """指定した名前だけを現在の記録に合わせて追加・削除する（登録回数の変化もここで反映）"""
+        for name in names:
+            if name in players:
+                self.add(name)
+            else:
+                self.remove(name)
+            # 登録回数が変わると上位の並びも変わる
+            self._top_dirty.add(name)
+
+    def _prefix_matches(self, query: str) -> List[str]:
+        lo = bisect.bisect_left(self.sorted_keys, (query,))
+        hi = bisect.bisect_left(self.sorted_keys, (query + self.MAX_CHAR,))
+        return [name for _, name in self.sorted_keys[lo:hi]]
+
+    def _substring_matches(self, query: str) -> Set[str]:
+        # クエリの2文字 (1文字だけならその文字) の転置リストの積集合を、短いものから取る
+        grams = self._grams_of(query) if len(query) == 1 else {query[i:i + 2] for i in range(len(query) - 1)}
+        postings = sorted((self.grams.get(gram, set()) for gram in grams), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = set(postings[0])
+        for names in postings[1:]:
+            candidates &= names
+            if not candidates:
+                return candidates
+        if len(query) <= 2:
+            return candidates
+        return {name for name in candidates if query in self.folded[name]}
+
+    def search(self, query: str, counts: Dict[str, int], limit: int = 25) -> List[str]:
+        """前方一致を優先し、同じ順位の中では登録回数の多い順に最大 limit 件を返す"""
+        start = time.perf_counter()
+        query = query.casefold()
+        # nlargest は同じ回数なら入力順を保つので、名前順に並べてから渡す
+        if not query:
+            results = self._top_names(counts, limit)
+        else:
+            prefix = self._prefix_matches(query)
+            results = heapq.nlargest(limit, prefix, key=lambda n: counts.get(n, 0))
+            if len(results) < limit:
+                rest = sorted(self._substring_matches(query).difference(prefix), key=self.folded.get)
+                results += heapq.nlargest(limit - len(results), rest, key=lambda n: counts.get(n, 0))
+        self.searches += 1
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        return results
+
+    def _top_names(self, counts: Dict[str, int], limit: int) -> List[str]:
+        """登録回数の上位。前回の結果に変更された名前だけを混ぜて更新する"""
+        cache, dirty = self._top_cache, self._top_dirty
+        # 上位の名前が消えた・回数が減った場合は、圏外の名前が繰り上がるので数え直す
+        if cache is not None and (limit > len(cache) and len(cache) < len(self.folded) or any(
+            name in self._top_counts and (name not in self.folded or counts.get(name, 0) < self._top_counts[name])
+            for name in dirty
+        )):
+            cache = None
+        if cache is None:
+            cache = heapq.nlargest(limit, (name for _, name in self.sorted_keys), key=lambda n: counts.get(n, 0))
+        elif dirty:
+            pool = set(cache) | {name for name in dirty if name in self.folded}
+            cache = sorted(pool, key=lambda n: (-counts.get(n, 0), self.folded[n], n))[:max(limit, len(cache))]
+        self._top_cache = cache
+        self._top_counts = {name: counts.get(name, 0) for name in cache}
+        self._top_dirty = set()
+        return cache[:limit]
+
+    def warm(self, counts: Dict[str, int], limit: int = 25):
+        """登録回数の上位を先に計算しておく（読み込み直後の最初の入力を速くするため）"""
+        self._top_names(counts, limit)
+
+    def latency_stats(self) -> Dict[str, float]:
+        """直近の検索レイテンシ (ミリ秒)"""
+        samples = sorted(self.latencies)
+        if not samples:
+            return {"searches": self.searches, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "searches": self.searches,
+            "p50": samples[len(samples) // 2],
+            "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            "max": samples[-1],
+        }
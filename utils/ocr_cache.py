@@ -0,0 +1,194 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+class OCRCache:
+    """画像の内容 (SHA-256) をキーにした OCR 結果のキャッシュ (SQLite)
+
+    同じスクリーンショットの再投稿や、管理者による履歴の再スキャンで
+    Flash / Lite / Vision の回数枠を消費しないように、解析結果を保存します。
+    キーは (SHA-256, 種類) で、種類は解析方法ごとの結果の形式を区別します
+    ('all' = hybrid_extract_all_info, 'name' = extract_brawlstars_name)。
+    Discord の添付ファイルID からの対応表も持ち、同じメッセージの再スキャンでは
+    ハッシュ計算（やダウンロード）を省略できます。
+    結果の合計サイズが max_bytes を超えたら、最後に使われたのが古いものから削除します (LRU)。
+    get / put は SQLite への書き込みを伴うため、イベントループからは asyncio.to_thread で呼び出します
+    (内部のロックで複数のスレッドからの呼び出しを直列化します)。
+    """
+
+    # 1行あたりの結果以外のおおよその容量 (キー・列・インデックス)
+    ROW_OVERHEAD = 128
+    # 上限を超えたら上限の 90% まで削除する (毎回の削除を避けるため)
+    EVICT_TO = 0.9
+    # 削除対象を古い順に読み出す1回あたりの行数 (表全体を読み込まないため)
+    EVICT_BATCH = 256
+
+    def __init__(self, path: str, max_bytes: int = 8 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_results ("
+            "sha256 TEXT NOT NULL, "
+            "kind TEXT NOT NULL, "
+            "value TEXT NOT NULL, "
+            "engine TEXT, "
+            "image_bytes INTEGER NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "last_used REAL NOT NULL, "
+            "PRIMARY KEY (sha256, kind)"
+            ") WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ocr_results_lru ON ocr_results (last_used)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_attachments ("
+            "attachment_id INTEGER NOT NULL, "
+            "kind TEXT NOT NULL, "
+            "sha256 TEXT NOT NULL, "
+            "PRIMARY KEY (attachment_id, kind)"
+            ") WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ocr_attachments_sha ON ocr_attachments (sha256)")
+        self.conn.commit()
+        row = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr_results").fetchone()
+        self.entries, self.total_bytes = row
+        self.stats = {
+            "lookups": 0,
+            "attachment_hits": 0,
+            "hash_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "bytes_saved": 0,
+            "quota_saved": {},
+        }
+
+    def _find(self, kind: str, attachment_id: Optional[int], buffer) -> Tuple[Optional[tuple], Optional[str]]:
+        if attachment_id is not None:
+            row = self.conn.execute(
+                "SELECT r.sha256, r.value, r.engine, r.image_bytes FROM ocr_attachments a "
+                "JOIN ocr_results r ON r.sha256 = a.sha256 AND r.kind = a.kind "
+                "WHERE a.attachment_id = ? AND a.kind = ?",
+                (attachment_id, kind)
+            ).fetchone()
+            if row is not None:
+                return row, "attachment_hits"
+        if buffer is not None:
+            row = self.conn.execute(
+                "SELECT sha256, value, engine, image_bytes FROM ocr_results WHERE sha256 = ? AND kind = ?",
+                (buffer.sha256, kind)
+            ).fetchone()
+            if row is not None:
+                return row, "hash_hits"
+        return None, None
+
+    def get(self, kind: str, attachment_id: Optional[int] = None, buffer=None, record_miss: bool = True) -> Optional[Any]:
+        """キャッシュ済みの結果を返す（添付ファイルID → 画像のハッシュの順に探す）。なければ None
+
+        record_miss=False はダウンロード前の下見用で、見つからなくてもミスとして数えない
+        """
+        with self._lock:
+            row, hit = self._find(kind, attachment_id, buffer)
+            if row is None:
+                if record_miss:
+                    self.stats["lookups"] += 1
+                    self.stats["misses"] += 1
+                return None
+            self.stats["lookups"] += 1
+            sha256, value, engine, image_bytes = row
+            self.conn.execute(
+                "UPDATE ocr_results SET last_used = ? WHERE sha256 = ? AND kind = ?",
+                (time.time(), sha256, kind)
+            )
+            if attachment_id is not None and hit == "hash_hits":
+                # 再投稿された画像: 次からは添付ファイルIDで引けるようにする
+                self._link(attachment_id, kind, sha256)
+            self.conn.commit()
+            self.stats[hit] += 1
+            self.stats["bytes_saved"] += image_bytes
+            if engine:
+                quota = self.stats["quota_saved"]
+                quota[engine] = quota.get(engine, 0) + 1
+        return json.loads(value)
+
+    def _link(self, attachment_id: int, kind: str, sha256: str):
+        self.conn.execute(
+            "INSERT INTO ocr_attachments (attachment_id, kind, sha256) VALUES (?, ?, ?) "
+            "ON CONFLICT(attachment_id, kind) DO UPDATE SET sha256 = excluded.sha256",
+            (attachment_id, kind, sha256)
+        )
+
+    def put(self, kind: str, buffer, value: Any, engine: Optional[str] = None, attachment_id: Optional[int] = None):
+        """解析結果を保存し、容量を超えた分を古いものから削除する"""
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode("utf-8")) + self.ROW_OVERHEAD
+        sha256 = buffer.sha256
+        with self._lock:
+            old = self.conn.execute(
+                "SELECT size FROM ocr_results WHERE sha256 = ? AND kind = ?", (sha256, kind)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT INTO ocr_results (sha256, kind, value, engine, image_bytes, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(sha256, kind) DO UPDATE SET value = excluded.value, engine = excluded.engine, "
+                "image_bytes = excluded.image_bytes, size = excluded.size, last_used = excluded.last_used",
+                (sha256, kind, encoded, engine, len(buffer), size, time.time())
+            )
+            if old is None:
+                self.entries += 1
+                self.total_bytes += size
+            else:
+                self.total_bytes += size - old[0]
+            if attachment_id is not None:
+                self._link(attachment_id, kind, sha256)
+            self._evict()
+            self.conn.commit()
+            self.stats["stores"] += 1
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * self.EVICT_TO)
+        while self.total_bytes > target:
+            # last_used のインデックスで古い順に少しずつ読み、目標まで減った時点でやめる
+            rows = self.conn.execute(
+                "SELECT sha256, kind, size FROM ocr_results ORDER BY last_used LIMIT ?", (self.EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            victims = []
+            for sha256, kind, size in rows:
+                if self.total_bytes <= target:
+                    break
+                victims.append((sha256, kind))
+                self.total_bytes -= size
+                self.entries -= 1
+            self.conn.executemany("DELETE FROM ocr_results WHERE sha256 = ? AND kind = ?", victims)
+            self.conn.executemany("DELETE FROM ocr_attachments WHERE sha256 = ? AND kind = ?", victims)
+            self.stats["evictions"] += len(victims)
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM ocr_results")
+            self.conn.execute("DELETE FROM ocr_attachments")
+            self.conn.commit()
+            self.entries, self.total_bytes = 0, 0
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats["quota_saved"] = dict(self.stats["quota_saved"])
+        hits = stats["attachment_hits"] + stats["hash_hits"]
+        stats["hit_rate"] = hits / stats["lookups"] if stats["lookups"] else 0.0
+        stats["entries"] = self.entries
+        stats["total_bytes"] = self.total_bytes
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
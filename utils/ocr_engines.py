@@ -0,0 +1,143 @@
+import asyncio
+import contextlib
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# OCR エンジン (Gemini Flash / Flash-Lite・Vision) の非同期アダプター
+# 各 SDK の非同期クライアントを使い、呼び出し中にスレッドを占有しません
+# (asyncio.to_thread の既定スレッドプールはチャットの Groq 呼び出しやファイル書き込みと共有のため)。
+# 同時実行数の上限は slot (ScanScheduler.engine_slot) で、応答時間の上限は timeout で設定します。
+# 呼び出しの結果 ('ok' / 'error' / 'timeout' / 'throttled' / 'cancelled') と所要時間は monitor (EngineRouter・AimdController) に渡します
+# (枠を待っている間に取り消された場合は、呼び出していないので所要時間は None)。
+
+# HTTP 429 (Too Many Requests) と、gRPC の RESOURCE_EXHAUSTED (google.rpc.Code)
+HTTP_TOO_MANY_REQUESTS = 429
+RPC_RESOURCE_EXHAUSTED = 8
+
+class EngineError(Exception):
+    """エンジン呼び出しの失敗 (元の例外は __cause__)"""
+
+class EngineTimeout(EngineError):
+    """エンジンが timeout 秒以内に応答しなかった"""
+
+class EngineThrottled(EngineError):
+    """エンジンが回数制限 (429) を返した"""
+
+def is_throttled(error: BaseException) -> bool:
+    """SDK の例外が回数制限によるものか (google.api_core の例外は code に HTTP ステータスを持つ)"""
+    return getattr(error, "code", None) == HTTP_TOO_MANY_REQUESTS
+
+class OCREngine:
+    """エンジン呼び出しの共通部分: 同時実行数の上限・タイムアウト・統計"""
+
+    def __init__(self, name: str, timeout: float, slot: Optional[Callable[[str], Any]] = None, monitor=None):
+        self.name = name
+        self.timeout = timeout
+        self._slot = slot   # エンジン名 -> async with で使う枠 (None なら上限なし)
+        # record(エンジン名, 結果, 所要時間 ms) を持つもの、またはその並び (None なら記録しない)
+        self.monitors = tuple(monitor) if isinstance(monitor, (list, tuple)) else ((monitor,) if monitor is not None else ())
+        self.stats = {"calls": 0, "errors": 0, "timeouts": 0, "cancelled": 0, "total_ms": 0.0, "in_flight": 0, "max_in_flight": 0}
+
+    def _record(self, outcome: str, elapsed_ms: Optional[float]):
+        for monitor in self.monitors:
+            monitor.record(self.name, outcome, elapsed_ms)
+
+    async def _call(self, request: Callable[[], Awaitable[Any]],
+                    check: Optional[Callable[[Any], None]] = None) -> Tuple[Any, float]:
+        """(応答, 呼び出しにかかった時間 ms) を返す。枠を待っていた時間は含まない
+
+        失敗は EngineTimeout / EngineThrottled / EngineError にして送出します。
+        check は応答の中身に含まれるエラーを確認する関数 (失敗なら EngineError を送出する)
+        """
+        entered = False
+        try:
+            async with (self._slot(self.name) if self._slot else contextlib.nullcontext()):
+                entered = True
+                stats = self.stats
+                stats["calls"] += 1
+                stats["in_flight"] += 1
+                stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+                started = time.perf_counter()
+                outcome = "ok"
+                try:
+                    # 枠を待っていた時間は含めず、呼び出しそのものにだけタイムアウトを適用する
+                    response = await asyncio.wait_for(request(), self.timeout)
+                    if check is not None:
+                        check(response)
+                    return response, (time.perf_counter() - started) * 1000
+                except asyncio.CancelledError:
+                    # ヘッジで負けた側など、呼び出し元が取り消した場合
+                    outcome = "cancelled"
+                    stats["cancelled"] += 1
+                    raise
+                except asyncio.TimeoutError:
+                    outcome = "timeout"
+                    stats["timeouts"] += 1
+                    raise EngineTimeout(f"{self.name} が {self.timeout:g}秒以内に応答しませんでした")
+                except EngineError as e:
+                    outcome = "throttled" if isinstance(e, EngineThrottled) else "error"
+                    stats["errors"] += 1
+                    raise
+                except Exception as e:
+                    stats["errors"] += 1
+                    if is_throttled(e):
+                        outcome = "throttled"
+                        raise EngineThrottled(f"{self.name}: {e}") from e
+                    outcome = "error"
+                    raise EngineError(f"{self.name}: {e}") from e
+                finally:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    stats["in_flight"] -= 1
+                    stats["total_ms"] += elapsed_ms
+                    self._record(outcome, elapsed_ms)
+        except asyncio.CancelledError:
+            if not entered:
+                # 枠を待っている間に取り消された (ヘッジで負けた側など)。呼び出していないので所要時間は None とし、
+                # 遮断後の試行として送る予定だった1件が結果待ちのまま残らないよう、取り消しとして記録する
+                self.stats["cancelled"] += 1
+                self._record("cancelled", None)
+            raise
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats["timeout"] = self.timeout
+        stats["avg_ms"] = stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
+
+class GeminiEngine(OCREngine):
+    """google.generativeai の GenerativeModel.generate_content_async を使うアダプター"""
+
+    def __init__(self, name: str, model, timeout: float, slot=None, monitor=None):
+        super().__init__(name, timeout, slot, monitor)
+        self.model = model
+
+    async def generate(self, contents: list) -> Tuple[str, float]:
+        """プロンプトと画像を送り、(応答のテキスト, 呼び出し時間 ms) を返す"""
+        response, elapsed_ms = await self._call(
+            lambda: self.model.generate_content_async(contents, request_options={"timeout": self.timeout})
+        )
+        return response.text, elapsed_ms
+
+class VisionEngine(OCREngine):
+    """google.cloud.vision の ImageAnnotatorAsyncClient を使うアダプター (文字検出のみ)"""
+
+    def __init__(self, client, timeout: float, slot=None, monitor=None):
+        super().__init__("vision", timeout, slot, monitor)
+        self.client = client
+
+    async def text_detection(self, content: bytes) -> Tuple[List, float]:
+        """画像を送り、(文字検出結果 text_annotations, 呼び出し時間 ms) を返す。API がエラーを返した場合は例外"""
+        request = {"image": {"content": content}, "features": [{"type_": "TEXT_DETECTION"}]}
+        response, elapsed_ms = await self._call(
+            lambda: self.client.batch_annotate_images(requests=[request], timeout=self.timeout), self._check
+        )
+        return list(response.responses[0].text_annotations), elapsed_ms
+
+    @staticmethod
+    def _check(response):
+        # 画像ごとのエラーは例外ではなく応答の中に入っている
+        error = response.responses[0].error
+        if error.message:
+            if error.code == RPC_RESOURCE_EXHAUSTED:
+                raise EngineThrottled(f"vision: {error.message}")
+            raise EngineError(f"Vision API エラー: {error.message}")
@@ -0,0 +1,130 @@
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+# プレイヤーID: '#' + 大文字英数字 (OCR が 'O' と読んだものは '0' に寄せる)
+PLAYER_ID_PATTERN = re.compile(r"^#[0-9A-Z]{3,12}$")
+# Supercell ID: 英単語を2〜4個つなげた CamelCase (例: HeroicHungryNebula)。末尾の数字は許容する
+SC_ID_PATTERN = re.compile(r"(?:[A-Z][a-z]+){2,4}[0-9]{0,6}")
+
+def normalize_player_id(value) -> Optional[str]:
+    """プレイヤーIDを比較用に正規化する（'Unknown' や形式外の値は None）"""
+    if not isinstance(value, str):
+        return None
+    value = value.strip().upper().replace("O", "0")
+    return value if PLAYER_ID_PATTERN.match(value) else None
+
+def normalize_sc_id(value) -> Optional[str]:
+    """Supercell ID を比較用に正規化する（大文字小文字は区別しない。'Unknown' や形式外の値は None）
+
+    OCR が拾った見出しやタグの断片を本人の証拠として扱わないよう、CamelCase の形式のものだけを受け付けます。
+    """
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    return value.casefold() if SC_ID_PATTERN.fullmatch(value) else None
+
+def normalize_user_id(value) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+class PlayerIndex:
+    """プレイヤー記録 (名前 -> 記録) に対する二次インデックス
+
+    user_id -> 名前の集合、player_id -> 名前、sc_id -> 名前 を保持します。
+    同じ player_id / sc_id を持つ名前が複数ある場合は、先に登録された名前を返します。
+    名前ごとに「何で索引したか」を覚えておくため、記録が書き換えられた後でも
+    古いキーから確実に外せます。
+    """
+
+    def __init__(self):
+        self.by_user: Dict[int, Set[str]] = {}
+        self.by_player_id: Dict[str, Dict[str, None]] = {}  # 挿入順を保つため dict を集合として使う
+        self.by_sc_id: Dict[str, Dict[str, None]] = {}
+        self._indexed: Dict[str, Tuple[Optional[int], Optional[str], Optional[str]]] = {}
+
+    @staticmethod
+    def _keys(entry) -> Tuple[Optional[int], Optional[str], Optional[str]]:
+        if not isinstance(entry, dict):
+            return None, None, None
+        return (
+            normalize_user_id(entry.get("user_id")),
+            normalize_player_id(entry.get("player_id")),
+            normalize_sc_id(entry.get("sc_id")),
+        )
+
+    def _remove(self, name: str):
+        keys = self._indexed.pop(name, None)
+        if keys is None:
+            return
+        user_id, player_id, sc_id = keys
+        for mapping, key in ((self.by_user, user_id), (self.by_player_id, player_id), (self.by_sc_id, sc_id)):
+            if key is None:
+                continue
+            names = mapping.get(key)
+            if names is not None:
+                if isinstance(names, set):
+                    names.discard(name)
+                else:
+                    names.pop(name, None)
+                if not names:
+                    del mapping[key]
+
+    def _add(self, name: str, entry):
+        keys = self._keys(entry)
+        if keys == (None, None, None):
+            return
+        user_id, player_id, sc_id = keys
+        if user_id is not None:
+            self.by_user.setdefault(user_id, set()).add(name)
+        if player_id is not None:
+            self.by_player_id.setdefault(player_id, {})[name] = None
+        if sc_id is not None:
+            self.by_sc_id.setdefault(sc_id, {})[name] = None
+        self._indexed[name] = keys
+
+    def rebuild(self, players: Dict):
+        """記録全体から索引を作り直す（読み込み・一括処理用）"""
+        self.__init__()
+        for name, entry in players.items():
+            self._add(name, entry)
+
+    def refresh(self, players: Dict, names):
+        """指定した名前の索引だけを現在の記録に合わせて更新する（削除された名前は外す）"""
+        for name in names:
+            self._remove(name)
+            if name in players:
+                self._add(name, players[name])
+
+    def names_for_user(self, user_id: int) -> List[str]:
+        """ユーザーが登録したプレイヤー名の一覧"""
+        return sorted(self.by_user.get(user_id, ()))
+
+    def find_by_player_id(self, player_id) -> Optional[str]:
+        names = self.by_player_id.get(normalize_player_id(player_id))
+        return next(iter(names)) if names else None
+
+    def find_by_sc_id(self, sc_id) -> Optional[str]:
+        names = self.by_sc_id.get(normalize_sc_id(sc_id))
+        return next(iter(names)) if names else None
+
+    def check(self, players: Dict) -> List[str]:
+        """索引が記録と一致しているか検証し、不整合の説明を返す（空なら正常）"""
+        expected = PlayerIndex()
+        expected.rebuild(players)
+        problems = []
+        for label, actual, wanted in (
+            ("user_id", self.by_user, expected.by_user),
+            ("player_id", self.by_player_id, expected.by_player_id),
+            ("sc_id", self.by_sc_id, expected.by_sc_id),
+        ):
+            for key in set(actual) | set(wanted):
+                have = set(actual.get(key, ()))
+                want = set(wanted.get(key, ()))
+                if have != want:
+                    problems.append(f"{label}={key}: 索引 {sorted(have)} / 記録 {sorted(want)}")
+        for name in set(self._indexed) | set(expected._indexed):
+            if self._indexed.get(name) != expected._indexed.get(name):
+                problems.append(f"{name}: 索引キー {self._indexed.get(name)} / 記録 {expected._indexed.get(name)}")
+        return problems
@@ -0,0 +1,116 @@
+import bisect
+from typing import Dict, Iterable, List, Tuple
+
+class PlayerListIndex:
+    """/playerlist のページを作るための並び替え済みリスト
+
+    要注意 (登録2回以上) は (-回数, 名前) 順、一般 (1回) は名前順の配列を
+    二分探索で挿入・削除して維持します。描画済みのページ文字列はページごとに保持し、
+    変更で内容がずれたページだけを破棄します。
+    ページ 0 は要注意プレイヤー、ページ 1 以降は一般プレイヤーを PAGE_SIZE 人ずつ表示します。
+    """
+
+    PAGE_SIZE = 50
+
+    def __init__(self):
+        self.priority: List[Tuple[int, str]] = []  # (-回数, 名前)
+        self.normal: List[str] = []
+        self.counts: Dict[str, int] = {}           # 索引した時点の回数
+        self._pages: Dict[int, Tuple[str, str]] = {}  # ページ -> (タイトル, 本文)
+        self.stats = {"renders": 0, "cache_hits": 0}
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def _invalidate_normal(self, position: int):
+        # 挿入・削除した位置より後ろの一般ページはすべて1人ずつずれる
+        first = 1 + position // self.PAGE_SIZE
+        for page in [p for p in self._pages if p >= first]:
+            del self._pages[page]
+
+    def _remove(self, name: str):
+        count = self.counts.pop(name, None)
+        if count is None:
+            return
+        if count >= 2:
+            i = bisect.bisect_left(self.priority, (-count, name))
+            del self.priority[i]
+            self._pages.pop(0, None)
+        else:
+            i = bisect.bisect_left(self.normal, name)
+            del self.normal[i]
+            self._invalidate_normal(i)
+
+    def _add(self, name: str, count: int):
+        self.counts[name] = count
+        if count >= 2:
+            bisect.insort(self.priority, (-count, name))
+            self._pages.pop(0, None)
+        else:
+            i = bisect.bisect_left(self.normal, name)
+            self.normal.insert(i, name)
+            self._invalidate_normal(i)
+
+    def rebuild(self, players: Dict, counts: Dict):
+        """記録全体から作り直す（読み込み・一括処理用）"""
+        self.counts = {name: counts.get(name, 1) for name in players}
+        self.priority = sorted((-c, name) for name, c in self.counts.items() if c >= 2)
+        self.normal = sorted(name for name, c in self.counts.items() if c < 2)
+        self._pages = {}
+
+    def refresh(self, players: Dict, counts: Dict, names: Iterable[str]):
+        """指定した名前だけを現在の記録・回数に合わせて入れ直す（改名は旧名と新名の両方を渡す）"""
+        for name in names:
+            count = counts.get(name, 1) if name in players else None
+            if self.counts.get(name) == count:
+                continue
+            self._remove(name)
+            if count is not None:
+                self._add(name, count)
+
+    @property
+    def max_pages(self) -> int:
+        return 1 + max(1, (len(self.normal) + self.PAGE_SIZE - 1) // self.PAGE_SIZE)
+
+    def _render(self, page: int) -> Tuple[str, str]:
+        lines = []
+        if page == 0:
+            title = "🔴 要注意プレイヤーリスト (2回以上報告)"
+            for neg_count, name in self.priority:
+                lines.append(f"🔴 **{name}** — `{-neg_count}回報告`")
+            if not lines:
+                lines.append("該当するプレイヤーはいません。")
+        else:
+            start = (page - 1) * self.PAGE_SIZE
+            title = f"📋 一般プレイヤーリスト ({page})"
+            for name in self.normal[start:start + self.PAGE_SIZE]:
+                lines.append(f"• **{name}**")
+            if not lines:
+                lines.append("登録者はまだいません。")
+        return title, "\n".join(lines)
+
+    def page(self, page: int) -> Tuple[int, str, str]:
+        """(範囲内に収めたページ番号, タイトル, 本文) を返す。描画済みならキャッシュを使う"""
+        page = max(0, min(page, self.max_pages - 1))
+        cached = self._pages.get(page)
+        if cached is None:
+            cached = self._render(page)
+            self._pages[page] = cached
+            self.stats["renders"] += 1
+        else:
+            self.stats["cache_hits"] += 1
+        return (page, *cached)
+
+    def check(self, players: Dict, counts: Dict) -> List[str]:
+        """並びとキャッシュ済みページが記録と一致しているか検証する"""
+        expected = PlayerListIndex()
+        expected.rebuild(players, counts)
+        problems = []
+        if self.priority != expected.priority:
+            problems.append("一覧索引: 要注意プレイヤーの並びが一致しません")
+        if self.normal != expected.normal:
+            problems.append("一覧索引: 一般プレイヤーの並びが一致しません")
+        for page, cached in self._pages.items():
+            if page >= expected.max_pages or cached != expected._render(page):
+                problems.append(f"一覧索引: ページ {page + 1} のキャッシュが古くなっています")
+        return problems
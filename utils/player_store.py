@@ -0,0 +1,96 @@
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+class PlayerStore:
+    """プレイヤー記録を SQLite に1行ずつ保存するストレージエンジン
+
+    テーブルは報告用 (players) と確認用 (check_players) の2つで、
+    どちらも name を主キーとし、記録本体 (JSON) と登録回数を1行に持ちます。
+    記録本体と回数は片方だけ存在することもあるため、どちらも NULL を許容します。
+    """
+
+    TABLES = ("players", "check_players")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL: 書き込みは追記のみ、読み込みをブロックしない
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for table in self.TABLES:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "name TEXT PRIMARY KEY, "
+                "data TEXT, "
+                "count INTEGER"
+                ") WITHOUT ROWID"
+            )
+        self.conn.commit()
+
+    def _check_table(self, table: str):
+        if table not in self.TABLES:
+            raise ValueError(f"不明なテーブル: {table}")
+
+    def is_empty(self, table: str) -> bool:
+        self._check_table(table)
+        with self._lock:
+            row = self.conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+        return row is None
+
+    def load(self, table: str) -> Tuple[Dict, Dict]:
+        """テーブル全体を (players, counts) の辞書として読み込む"""
+        self._check_table(table)
+        players, counts = {}, {}
+        with self._lock:
+            rows = self.conn.execute(f"SELECT name, data, count FROM {table}").fetchall()
+        for name, data, count in rows:
+            if data is not None:
+                players[name] = json.loads(data)
+            if count is not None:
+                counts[name] = count
+        return players, counts
+
+    def _write_row(self, table: str, name: str, data: Optional[dict], count: Optional[int]):
+        if data is None and count is None:
+            self.conn.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+        else:
+            encoded = json.dumps(data, ensure_ascii=False) if data is not None else None
+            self.conn.execute(
+                f"INSERT INTO {table} (name, data, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET data = excluded.data, count = excluded.count",
+                (name, encoded, count)
+            )
+
+    def upsert(self, table: str, name: str, data: Optional[dict], count: Optional[int]):
+        """1行だけ書き込む（data と count が両方 None の場合は行を削除）"""
+        self.upsert_many(table, [(name, data, count)])
+
+    def upsert_many(self, table: str, rows: Iterable[Tuple[str, Optional[dict], Optional[int]]]):
+        """(name, data, count) の行をまとめて1トランザクションで書き込む"""
+        self._check_table(table)
+        with self._lock:
+            for name, data, count in rows:
+                self._write_row(table, name, data, count)
+            self.conn.commit()
+
+    def delete(self, table: str, name: str):
+        self._check_table(table)
+        with self._lock:
+            self.conn.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+            self.conn.commit()
+
+    def replace_all(self, table: str, players: Dict, counts: Dict):
+        """テーブル全体を置き換える（移行・一括処理用）"""
+        self._check_table(table)
+        with self._lock:
+            self.conn.execute(f"DELETE FROM {table}")
+            for name in set(players) | set(counts):
+                self._write_row(table, name, players.get(name), counts.get(name))
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
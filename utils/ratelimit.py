@@ -0,0 +1,250 @@
+import bisect
+import itertools
+from typing import Dict, Hashable, Iterable, List, Optional
+
+class SlidingWindowCounter:
+    """分単位のバケットをリング状に並べたスライディングウィンドウカウンター
+
+    各ウィンドウ (既定: 1時間・24時間) について「完全にウィンドウ内にあるバケットの合計」を
+    逐次更新で保持し、境界にまたがる1バケットだけを二分探索するため、
+    件数の判定は履歴の長さに関係なく O(1) (償却) で、かつ正確です。
+    """
+
+    def __init__(self, windows: Iterable[int] = (3600, 86400), bucket_sec: int = 60):
+        self.bucket_sec = bucket_sec
+        self.windows = tuple(sorted(windows))
+        # 最長ウィンドウ + 境界バケット分のスロットを持つリング
+        self.size = self.windows[-1] // bucket_sec + 2
+        self._slots: List[Optional[list]] = [None] * self.size  # 各スロット: [バケット番号, [タイムスタンプ...]]
+        self._full: Dict[int, int] = {w: 0 for w in self.windows}  # 境界バケットより新しいバケットの合計
+        self._edge: Dict[int, Optional[int]] = {w: None for w in self.windows}  # 境界バケットの番号
+        self._newest = None
+
+    def _bucket(self, idx: int) -> Optional[list]:
+        slot = self._slots[idx % self.size]
+        if slot is not None and slot[0] == idx:
+            return slot[1]
+        return None
+
+    def _recompute(self, window: int, edge: int):
+        self._full[window] = sum(len(slot[1]) for slot in self._slots if slot is not None and slot[0] > edge)
+        self._edge[window] = edge
+
+    def _advance(self, now: float):
+        """境界を現在時刻まで進め、ウィンドウから外れたバケットを合計から引く"""
+        for window in self.windows:
+            edge = int((now - window) // self.bucket_sec)
+            old = self._edge[window]
+            if old == edge:
+                continue
+            if old is None or edge < old or edge - old > self.size:
+                # 初回・時刻の巻き戻り・長時間の停止後は数え直す
+                self._recompute(window, edge)
+                continue
+            for idx in range(old + 1, edge + 1):
+                bucket = self._bucket(idx)
+                if bucket:
+                    self._full[window] -= len(bucket)
+            self._edge[window] = edge
+
+    def record(self, ts: float, now: Optional[float] = None):
+        """タイムスタンプを1件記録する (最長ウィンドウより古いものは捨てる)"""
+        if now is not None and now - ts >= self.windows[-1]:
+            return
+        idx = int(ts // self.bucket_sec)
+        slot = self._slots[idx % self.size]
+        if slot is None or slot[0] != idx:
+            # 古いバケットのスロットを再利用する (境界が未更新でまだ合計に含まれていれば差し引く)
+            if slot is not None:
+                for window in self.windows:
+                    edge = self._edge[window]
+                    if edge is not None and slot[0] > edge:
+                        self._full[window] -= len(slot[1])
+            slot = [idx, []]
+            self._slots[idx % self.size] = slot
+        bisect.insort(slot[1], ts)
+        for window in self.windows:
+            edge = self._edge[window]
+            if edge is not None and idx > edge:
+                self._full[window] += 1
+        if self._newest is None or idx > self._newest:
+            self._newest = idx
+
+    def count(self, window: int, now: float) -> int:
+        """now - ts < window を満たす件数"""
+        self._advance(now)
+        edge = self._edge[window]
+        total = self._full[window]
+        bucket = self._bucket(edge)
+        if bucket:
+            total += len(bucket) - bisect.bisect_right(bucket, now - window)
+        return total
+
+    def wait_time(self, window: int, limit: int, now: float) -> float:
+        """件数が limit 未満に戻るまでの秒数 (制限内なら 0)"""
+        count = self.count(window, now)
+        if count < limit:
+            return 0.0
+        # 古い方から (count - limit + 1) 件目が期限切れになる時刻を探す
+        need = count - limit + 1
+        cutoff = now - window
+        edge = self._edge[window]
+        newest = self._newest if self._newest is not None else edge
+        for idx in range(edge, newest + 1):
+            bucket = self._bucket(idx)
+            if not bucket:
+                continue
+            start = bisect.bisect_right(bucket, cutoff) if idx == edge else 0
+            available = len(bucket) - start
+            if need <= available:
+                return max(0.0, bucket[start + need - 1] + window - now)
+            need -= available
+        return 0.0
+
+    def timestamps(self, now: float) -> List[float]:
+        """最長ウィンドウ内のタイムスタンプを古い順に返す (保存用)"""
+        cutoff = now - self.windows[-1]
+        result = []
+        for slot in sorted((s for s in self._slots if s is not None), key=lambda s: s[0]):
+            result.extend(ts for ts in slot[1] if ts > cutoff)
+        return result
+
+class RateLimiter:
+    """キー (エンジン名・ユーザーID) ごとにスライディングウィンドウカウンターを管理する"""
+
+    def __init__(self, windows: Iterable[int] = (3600, 86400), bucket_sec: int = 60):
+        self.windows = tuple(sorted(windows))
+        self.bucket_sec = bucket_sec
+        self.counters: Dict[Hashable, SlidingWindowCounter] = {}
+
+    def counter(self, key: Hashable) -> SlidingWindowCounter:
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = SlidingWindowCounter(self.windows, self.bucket_sec)
+            self.counters[key] = counter
+        return counter
+
+    def record(self, key: Hashable, ts: float, now: Optional[float] = None):
+        self.counter(key).record(ts, now)
+
+    def count(self, key: Hashable, window: int, now: float) -> int:
+        counter = self.counters.get(key)
+        return counter.count(window, now) if counter else 0
+
+    def allows(self, key: Hashable, limits: Dict[int, int], now: float) -> bool:
+        """limits = {ウィンドウ秒: 上限件数} のすべてを満たしていれば True"""
+        counter = self.counters.get(key)
+        if counter is None:
+            return all(limit > 0 for limit in limits.values())
+        return all(counter.count(window, now) < limit for window, limit in limits.items())
+
+    def retry_after(self, key: Hashable, limits: Dict[int, int], now: float) -> float:
+        """すべての制限を満たすまでの待ち時間 (秒)"""
+        counter = self.counters.get(key)
+        if counter is None:
+            return 0.0
+        return max((counter.wait_time(window, limit, now) for window, limit in limits.items()), default=0.0)
+
+    def timestamps(self, key: Hashable, now: float) -> List[float]:
+        counter = self.counters.get(key)
+        return counter.timestamps(now) if counter else []
+
+    def prune(self, now: float):
+        """最長ウィンドウ内に記録がなくなったキーを削除 (ユーザーごとのカウンター用)"""
+        for key in [k for k, c in self.counters.items() if c.count(self.windows[-1], now) == 0]:
+            del self.counters[key]
+
+class Reservation:
+    """回数枠の予約1件 (key = エンジン名)"""
+
+    __slots__ = ("token", "key", "created_at", "expires_at")
+
+    def __init__(self, token: int, key: Hashable, created_at: float, expires_at: float):
+        self.token = token
+        self.key = key
+        self.created_at = created_at
+        self.expires_at = expires_at
+
+class QuotaReservations:
+    """受付時に確保し、解析の結果で確定 (commit)・返却 (release) する回数枠の予約
+
+    予約中の件数は RateLimiter に記録済みの件数に足して判定するため、同時に受け付けた画像が
+    同じ残り枠を取り合って上限を超えることがありません。確定した分の記録 (record_scan) は呼び出し側で行います。
+    確定も返却もされないまま ttl 秒を過ぎた予約 (ジョブが異常終了した場合など) は期限切れとして数えません。
+    """
+
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        self._active: Dict[Hashable, Dict[int, Reservation]] = {}
+        self._tokens = itertools.count(1)
+        self.stats = {"reserved": 0, "committed": 0, "released": 0, "expired": 0, "rejected": 0}
+
+    def _prune(self, key: Hashable, now: float) -> Dict[int, Reservation]:
+        active = self._active.get(key, {})
+        for token in [t for t, r in active.items() if r.expires_at <= now]:
+            del active[token]
+            self.stats["expired"] += 1
+        return active
+
+    def active(self, key: Hashable, now: float) -> int:
+        """期限内の予約の件数"""
+        return len(self._prune(key, now))
+
+    def holds(self, reservation: Optional[Reservation], now: float) -> bool:
+        """予約がまだ有効か (確定・返却・期限切れでないか)"""
+        if reservation is None:
+            return False
+        return reservation.token in self._prune(reservation.key, now)
+
+    def allows(self, limiter: RateLimiter, key: Hashable, limits: Dict[int, int], now: float) -> bool:
+        """記録済みの件数 + 予約中の件数が limits のすべてを下回っていれば True"""
+        reserved = self.active(key, now)
+        return all(limiter.count(key, window, now) + reserved < limit for window, limit in limits.items())
+
+    def reserve(self, limiter: RateLimiter, key: Hashable, limits: Dict[int, int], now: float) -> Optional[Reservation]:
+        """枠が残っていれば1件予約して返す (残っていなければ None)"""
+        if not self.allows(limiter, key, limits, now):
+            self.stats["rejected"] += 1
+            return None
+        reservation = Reservation(next(self._tokens), key, now, now + self.ttl)
+        self._active.setdefault(key, {})[reservation.token] = reservation
+        self.stats["reserved"] += 1
+        return reservation
+
+    def commit(self, reservation: Reservation):
+        """予約した枠を使った (記録は呼び出し側で行う)。期限切れの後でも呼んでよい"""
+        if self._active.get(reservation.key, {}).pop(reservation.token, None) is not None:
+            self.stats["committed"] += 1
+
+    def release(self, reservation: Reservation):
+        """予約した枠を使わなかったので返す"""
+        if self._active.get(reservation.key, {}).pop(reservation.token, None) is not None:
+            self.stats["released"] += 1
+
+    def settle(self, held: Dict[Hashable, Reservation], used: Iterable[Hashable]):
+        """解析の終了時: 使ったキー (エンジン) の予約を確定し、使わなかったキーの予約を返却する"""
+        used = set(used)
+        for key, reservation in held.items():
+            if key in used:
+                self.commit(reservation)
+            else:
+                self.release(reservation)
+
+    def retry_after(self, limiter: RateLimiter, key: Hashable, limits: Dict[int, int], now: float) -> float:
+        """予約中の分も使われるものとして、次の1件を予約できるまでの待ち時間 (秒)"""
+        reserved = self.active(key, now)
+        counter = limiter.counters.get(key)
+        waits = []
+        for window, limit in limits.items():
+            if reserved >= limit:
+                # 予約だけで上限に達している: 確定すれば今から window 秒後まで空かない
+                waits.append(float(window))
+            elif counter is not None:
+                waits.append(counter.wait_time(window, limit - reserved, now))
+        return max(waits, default=0.0)
+
+    def get_stats(self, now: float) -> Dict:
+        stats = dict(self.stats)
+        stats["active"] = {key: self.active(key, now) for key in self._active}
+        stats["ttl"] = self.ttl
+        return stats
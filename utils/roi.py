@@ -0,0 +1,112 @@
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+# 注目領域 (ROI) の切り出し
+# プロフィール画面で必要な情報 (ヘッダー・名前・Supercell ID・キャラ下のプレイヤーID・統計の見出し) は
+# 画面の上側に集まっているため、画像の上端から一定の高さまでの帯だけを OCR エンジンへ送ります。
+# 上端 (y=0) と横幅はそのままなので、Vision の座標を使う既存の判定はそのまま動きます。
+# 帯の高さは、全体画像を Vision に送ったときの必要な文字の位置から学習します。
+
+def _bottom(annotation) -> int:
+    return max(v.y for v in annotation.bounding_poly.vertices)
+
+def scale_annotations(annotations, scale: float):
+    """縮小して送った画像の Vision の座標を元の画像の座標に戻す (その場で書き換える)"""
+    for ann in annotations:
+        for v in ann.bounding_poly.vertices:
+            v.x = round(v.x * scale)
+            v.y = round(v.y * scale)
+
+def relevant_bottom(annotations, anchor_keywords: Iterable[str]) -> Optional[int]:
+    """プロフィール画面の判定・抽出に必要な文字の最も下の y 座標 (プロフィール画面と判定できなければ None)
+
+    必要な文字: '#' で始まるプレイヤーID と、画面判定に使う統計の見出し2つ (上から2つ目まで)
+    """
+    anchor_keywords = tuple(anchor_keywords)
+    id_bottoms, anchor_bottoms = [], []
+    for ann in annotations[1:]:
+        text = ann.description.strip()
+        if text.startswith('#') and len(text) > 3:
+            id_bottoms.append(_bottom(ann))
+        elif any(kw in text for kw in anchor_keywords):
+            anchor_bottoms.append(_bottom(ann))
+    if not id_bottoms or len(anchor_bottoms) < 2:
+        return None
+    anchor_bottoms.sort()
+    return max(min(id_bottoms), anchor_bottoms[1])
+
+class RoiTracker:
+    """ROI の高さ (画像の高さに対する比率) の学習と、全体画像 / 切り出し画像の A/B 統計
+
+    mode: 'off' = 常に全体画像 / 'on' = 学習済みなら切り出し / 'ab' = 全体と切り出しを交互に送って比較
+    """
+
+    MODES = ("off", "on", "ab")
+
+    def __init__(self, mode: str = "on", fixed_ratio: float = 0.0, margin: float = 0.05,
+                 min_observations: int = 5, samples: int = 50):
+        self.mode = mode
+        self.fixed_ratio = fixed_ratio          # 0 の場合は学習した値を使う
+        self.margin = margin
+        self.min_observations = min_observations
+        self.observations = deque(maxlen=samples)
+        self._ab_toggle = False
+        self.stats: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def ratio(self) -> float:
+        """切り出す帯の高さの比率 (1.0 は切り出さない)"""
+        if self.fixed_ratio > 0:
+            return min(1.0, self.fixed_ratio)
+        if len(self.observations) < self.min_observations:
+            return 1.0
+        # 直近で最も下まで必要だった画像に余白を足す
+        return min(1.0, max(self.observations) + self.margin)
+
+    def use_crop(self) -> bool:
+        """今回のエンジン呼び出しで切り出し画像を送るか"""
+        if not self.enabled or self.ratio >= 1.0:
+            return False
+        if self.mode == "on":
+            return True
+        self._ab_toggle = not self._ab_toggle
+        return self._ab_toggle
+
+    def observe(self, bottom: int, height: int):
+        """全体画像を Vision に送った結果から、必要な文字の下端を記録する"""
+        if height > 0:
+            self.observations.append(min(1.0, bottom / height))
+
+    def record(self, engine: str, cropped: bool, payload_bytes: int, ms: float, ok: bool):
+        variant = "cropped" if cropped else "full"
+        entry = self.stats.setdefault(engine, {}).setdefault(
+            variant, {"calls": 0, "bytes": 0, "ms": 0.0, "successes": 0}
+        )
+        entry["calls"] += 1
+        entry["bytes"] += payload_bytes
+        entry["ms"] += ms
+        entry["successes"] += int(ok)
+
+    def get_stats(self) -> Dict:
+        """エンジン・全体/切り出しごとの平均送信サイズ・平均レイテンシ・成功率"""
+        summary = {}
+        for engine, variants in self.stats.items():
+            for variant, entry in variants.items():
+                calls = entry["calls"]
+                summary.setdefault(engine, {})[variant] = {
+                    "calls": calls,
+                    "avg_bytes": entry["bytes"] / calls if calls else 0.0,
+                    "avg_ms": entry["ms"] / calls if calls else 0.0,
+                    "success_rate": entry["successes"] / calls if calls else 0.0,
+                }
+        return {
+            "mode": self.mode,
+            "ratio": self.ratio,
+            "learned": len(self.observations),
+            "fixed": self.fixed_ratio > 0,
+            "engines": summary,
+        }
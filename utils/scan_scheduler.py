@@ -0,0 +1,256 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# 優先度クラス: スラッシュコマンド / チャンネルへの投稿 / 履歴の一括処理
+PRIORITIES = ("interactive", "live", "batch")
+# 重み付き公平スケジューリングの重み (待機中のクラス同士で、おおよそこの比率で順番が回る)
+DEFAULT_WEIGHTS = {"interactive": 6, "live": 3, "batch": 1}
+
+def estimate_drain(pending: Dict[str, int], concurrency: Dict[str, int], workers: int, latency: Dict[str, float]) -> float:
+    """エンジンごとの待ち件数 pending がすべて終わるまでの目安 (秒)
+
+    エンジンごとの同時呼び出し数 concurrency で回す巡回数 × 1回の所要時間 latency と、
+    全体をワーカー数 workers で分け合った場合の時間の大きい方を返します。
+    """
+    workers = max(1, workers)
+    per_engine = [
+        -(-count // max(1, min(concurrency.get(engine, workers), workers))) * latency[engine]
+        for engine, count in pending.items() if count
+    ]
+    shared = sum(count * latency[engine] for engine, count in pending.items()) / workers
+    return max(per_engine + [shared], default=0.0)
+
+class ScanJob:
+    """スケジューラに投入された画像1枚分の処理"""
+
+    def __init__(self, key: Optional[Hashable], analyze: Callable[[], Awaitable[Any]],
+                 commit: Optional[Callable[[Any, Optional[BaseException]], Awaitable[Any]]],
+                 priority: str = "live"):
+        self.key = key
+        self.priority = priority
+        self.analyze = analyze
+        self.commit = commit
+        self.analyzed: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+
+class ScanScheduler:
+    """画像解析のワーカープール
+
+    解析 (ダウンロード + OCR エンジン呼び出し) は最大 workers 件を並行して実行し、
+    エンジンごとの同時実行数は engine_slot() で engine_caps 以下に抑えます
+    (有効な adaptive を渡すと engine_caps の代わりにその limit(エンジン名) に従います。上限は adaptive 側で決めます)。
+    結果の反映 (記録の更新・返信) はキー (チャンネル) ごとに投入順で行うため、
+    同じチャンネルへの返信の順番は解析の完了順に関係なく投稿順のままです。
+    レート制限による受付判定は投入前に呼び出し側で行います。
+
+    待機列は優先度クラス (PRIORITIES) ごとに分かれ、クラス間はストライドスケジューリング
+    (重みの逆数ずつ進む仮想時刻が最も小さいクラスから取り出す) で公平に順番を回します。
+    batch は譲る側で、interactive / live が待機している間は開始せず、
+    実行中の数も workers - 1 までに抑えて常に1枠を他のクラスのために空けておきます。
+    """
+
+    def __init__(self, workers: int = 3, engine_caps: Optional[Dict[str, int]] = None, throughput_window: int = 60,
+                 weights: Optional[Dict[str, int]] = None, wait_samples: int = 1000, adaptive=None):
+        self.workers = max(1, workers)
+        self.engine_caps: Dict[str, int] = dict(engine_caps or {})
+        self.adaptive = adaptive  # enabled と limit(エンジン名) を持つもの (AimdController)。None なら engine_caps のみ
+        self.engine_running: Dict[str, int] = {}
+        self.running = 0
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self._queues: Dict[str, deque] = {priority: deque() for priority in PRIORITIES}
+        self._pass: Dict[str, float] = {priority: 0.0 for priority in PRIORITIES}  # クラスごとの仮想時刻
+        self._vtime = 0.0                                  # 最後に取り出したクラスの仮想時刻
+        self.running_by_class: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self.waits: Dict[str, deque] = {priority: deque(maxlen=wait_samples) for priority in PRIORITIES}
+        self._wakeup = asyncio.Event()
+        self._engine_cond = asyncio.Condition()
+        self._tails: Dict[Hashable, asyncio.Task] = {}   # キー -> 最後に投入された反映処理
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._completions: deque = deque()                # 直近の完了時刻 (スループット計算用)
+        self.throughput_window = throughput_window
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "wait_total": 0.0, "max_engine_running": {}}
+
+    # ====== 設定 ======
+    def configure(self, workers: Optional[int] = None, engine_caps: Optional[Dict[str, int]] = None):
+        """ワーカー数・エンジンごとの上限を変更する（実行中の処理はそのまま）"""
+        if workers is not None:
+            self.workers = max(1, workers)
+            self._wakeup.set()
+        if engine_caps is not None:
+            self.engine_caps.update(engine_caps)
+            asyncio.ensure_future(self._notify_engines())
+
+    async def _notify_engines(self):
+        async with self._engine_cond:
+            self._engine_cond.notify_all()
+
+    # ====== 投入 ======
+    def submit(self, key: Optional[Hashable], analyze: Callable[[], Awaitable[Any]],
+               commit: Optional[Callable[[Any, Optional[BaseException]], Awaitable[Any]]] = None,
+               priority: str = "live") -> asyncio.Task:
+        """処理を投入し、完了を待てるタスクを返す
+
+        commit を渡した場合は analyze の結果 (または例外) を commit(result, error) に渡し、
+        同じ key の commit は投入順に1件ずつ実行します。key が None の場合は順序を保証しません。
+        タスクの値は commit の戻り値 (commit がなければ analyze の結果) です。
+        """
+        if priority not in self._queues:
+            raise ValueError(f"不明な優先度: {priority}")
+        job = ScanJob(key, analyze, commit, priority)
+        self.stats["submitted"] += 1
+        queue = self._queues[priority]
+        if not queue:
+            # 待機していなかったクラスは、休んでいた間の分の順番を貯め込まないよう現在の仮想時刻から始める
+            self._pass[priority] = max(self._pass[priority], self._vtime)
+        queue.append(job)
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        previous = self._tails.get(key) if key is not None else None
+        task = asyncio.create_task(self._finish(job, previous))
+        if key is not None:
+            self._tails[key] = task
+            task.add_done_callback(lambda t, k=key: self._tails.get(k) is t and self._tails.pop(k))
+        return task
+
+    def _eligible(self, priority: str) -> bool:
+        if not self._queues[priority]:
+            return False
+        if priority == "batch":
+            # 対話・投稿の待ちがあれば譲る。1枠は常に他のクラスのために空けておく
+            if self._queues["interactive"] or self._queues["live"]:
+                return False
+            return self.running_by_class["batch"] < max(1, self.workers - 1)
+        return True
+
+    def _next_job(self) -> Optional[ScanJob]:
+        """仮想時刻が最も小さい (重みに対して順番が回ってきていない) クラスの先頭を取り出す"""
+        candidates = [priority for priority in PRIORITIES if self._eligible(priority)]
+        if not candidates:
+            return None
+        priority = min(candidates, key=lambda p: (self._pass[p], PRIORITIES.index(p)))
+        self._vtime = self._pass[priority]
+        self._pass[priority] += 1 / self.weights[priority]
+        return self._queues[priority].popleft()
+
+    async def _dispatch(self):
+        while self.queued:
+            job = self._next_job() if self.running < self.workers else None
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            self.running += 1
+            self.running_by_class[job.priority] += 1
+            asyncio.create_task(self._run(job))
+
+    async def _run(self, job: ScanJob):
+        job.started_at = time.monotonic()
+        wait = job.started_at - job.submitted_at
+        self.stats["wait_total"] += wait
+        self.waits[job.priority].append(wait)
+        try:
+            result = await job.analyze()
+        except Exception as e:
+            job.analyzed.set_exception(e)
+        else:
+            job.analyzed.set_result(result)
+        finally:
+            self.running -= 1
+            self.running_by_class[job.priority] -= 1
+            self._wakeup.set()
+
+    async def _finish(self, job: ScanJob, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            # 同じチャンネルの前の画像の反映が終わるまで待つ (失敗していても順番だけ守る)
+            await asyncio.wait([previous])
+        error = None
+        result = None
+        try:
+            result = await job.analyzed
+        except Exception as e:
+            error = e
+        try:
+            if job.commit is not None:
+                return await job.commit(result, error)
+            if error is not None:
+                raise error
+            return result
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.stats["completed"] += 1
+            now = time.monotonic()
+            self._completions.append(now)
+            while self._completions and self._completions[0] < now - self.throughput_window:
+                self._completions.popleft()
+
+    # ====== エンジンごとの同時実行数 ======
+    def engine_cap(self, engine: str) -> int:
+        """現在の同時実行数の上限: adaptive が有効ならその上限、そうでなければ設定の上限 (未設定ならワーカー数)"""
+        if self.adaptive is not None and self.adaptive.enabled:
+            return self.adaptive.limit(engine)
+        return self.engine_caps.get(engine, self.workers)
+
+    @asynccontextmanager
+    async def engine_slot(self, engine: str):
+        """エンジン呼び出しの前後で使う。上限 (engine_cap) に空きが出るまで待つ"""
+        async with self._engine_cond:
+            await self._engine_cond.wait_for(lambda: self.engine_running.get(engine, 0) < self.engine_cap(engine))
+            running = self.engine_running.get(engine, 0) + 1
+            self.engine_running[engine] = running
+            peaks = self.stats["max_engine_running"]
+            peaks[engine] = max(peaks.get(engine, 0), running)
+        try:
+            yield
+        finally:
+            async with self._engine_cond:
+                self.engine_running[engine] -= 1
+                self._engine_cond.notify_all()
+
+    # ====== 統計 ======
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def has_pending(self, *priorities: str) -> bool:
+        """指定したクラスに待機中・実行中の処理があるか (一括処理が回数枠を譲るかの判断用)"""
+        return any(self._queues[p] or self.running_by_class[p] for p in priorities)
+
+    def wait_stats(self) -> Dict[str, Dict[str, float]]:
+        """クラスごとの待ち時間 (秒、直近の開始分) の p50 / p95"""
+        stats = {}
+        for priority, waits in self.waits.items():
+            samples = sorted(waits)
+            if not samples:
+                stats[priority] = {"samples": 0, "p50": 0.0, "p95": 0.0}
+                continue
+            stats[priority] = {
+                "samples": len(samples),
+                "p50": samples[len(samples) // 2],
+                "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            }
+        return stats
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats["max_engine_running"] = dict(self.stats["max_engine_running"])
+        stats["workers"] = self.workers
+        stats["engine_caps"] = dict(self.engine_caps)
+        stats["engine_limits"] = {engine: self.engine_cap(engine) for engine in self.engine_caps}
+        stats["queued"] = self.queued
+        stats["queued_by_class"] = {priority: len(queue) for priority, queue in self._queues.items()}
+        stats["running_by_class"] = dict(self.running_by_class)
+        stats["waits"] = self.wait_stats()
+        stats["running"] = self.running
+        started = stats["submitted"] - stats["queued"]
+        stats["avg_wait"] = stats["wait_total"] / started if started else 0.0
+        # 直近 throughput_window 秒の完了数を 1分あたりに換算
+        stats["images_per_min"] = len(self._completions) * 60 / self.throughput_window
+        return stats
@@ -0,0 +1,126 @@
+import mmap
+import os
+import struct
+from typing import Iterator, List, Optional
+
+class TimestampRing:
+    """固定長のタイムスタンプを mmap したリングファイルに保存する
+
+    ファイルはヘッダー (マジック・レコード長・容量・head・tail) と
+    固定長レコードの配列からなり、追記はレコード1件分 (8バイト、キー付きは16バイト) を
+    その場で書き込むだけです。期限切れのレコードは head を進めるだけで捨てられ、
+    ファイルを書き直すのは容量が足りなくなったときの拡張だけです。
+    head / tail は通算の件数で、スロット位置は件数 % 容量 で求めます。
+    """
+
+    MAGIC = b"TSR1"
+    HEADER = struct.Struct("<4sHHIQQ")  # マジック, バージョン, レコード長, 容量, head, tail
+    HEADER_SIZE = 32
+    VERSION = 1
+
+    def __init__(self, path: str, capacity: int = 1024, keyed: bool = False):
+        self.path = path
+        self.keyed = keyed
+        # キー付き: (タイムスタンプ, ユーザーID)、キーなし: タイムスタンプのみ (array('d') と同じ並び)
+        self.record = struct.Struct("<dq" if keyed else "<d")
+        self.appends = 0
+        self.grows = 0
+        if not os.path.exists(path):
+            self._create(path, capacity)
+        self._open()
+
+    def _create(self, path: str, capacity: int, records: Optional[list] = None):
+        records = records or []
+        with open(path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.record.size, capacity, 0, len(records)))
+            f.write(b"\0" * (self.HEADER_SIZE - self.HEADER.size))
+            for item in records:
+                f.write(self.record.pack(*item) if self.keyed else self.record.pack(item))
+            f.truncate(self.HEADER_SIZE + capacity * self.record.size)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _open(self):
+        self._file = open(self.path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, version, record_size, capacity, head, tail = self.HEADER.unpack_from(self._mm, 0)
+        if magic != self.MAGIC or version != self.VERSION or record_size != self.record.size:
+            self.close()
+            raise ValueError(f"リングファイルの形式が不正です: {self.path}")
+        if len(self._mm) < self.HEADER_SIZE + capacity * record_size or not head <= tail <= head + capacity:
+            self.close()
+            raise ValueError(f"リングファイルが破損しています: {self.path}")
+        self.capacity = capacity
+        self.head = head
+        self.tail = tail
+
+    def _write_pointers(self):
+        struct.pack_into("<QQ", self._mm, 12, self.head, self.tail)
+
+    def _offset(self, index: int) -> int:
+        return self.HEADER_SIZE + (index % self.capacity) * self.record.size
+
+    def _read(self, index: int):
+        item = self.record.unpack_from(self._mm, self._offset(index))
+        return item if self.keyed else item[0]
+
+    def __len__(self) -> int:
+        return self.tail - self.head
+
+    def __iter__(self) -> Iterator:
+        """有効なレコードを古い順に返す"""
+        for index in range(self.head, self.tail):
+            yield self._read(index)
+
+    def append(self, ts: float, key: Optional[int] = None):
+        """1件追記する（レコードを書いてから tail を進めるので、途中で落ちても壊れない）"""
+        if len(self) >= self.capacity:
+            self._grow()
+        item = (ts, key) if self.keyed else (ts,)
+        self.record.pack_into(self._mm, self._offset(self.tail), *item)
+        self.tail += 1
+        self._write_pointers()
+        self.appends += 1
+
+    def expire(self, cutoff: float) -> int:
+        """cutoff 以前のレコードを head を進めて捨てる（追記は時刻順なので先頭から見ればよい）"""
+        removed = 0
+        while self.head < self.tail:
+            item = self._read(self.head)
+            ts = item[0] if self.keyed else item
+            if ts > cutoff:
+                break
+            self.head += 1
+            removed += 1
+        if removed:
+            self._write_pointers()
+        return removed
+
+    def _grow(self):
+        """容量を倍にして有効なレコードだけを書き直す"""
+        self.rewrite(list(self), self.capacity * 2)
+        self.grows += 1
+
+    def rewrite(self, items: List, capacity: Optional[int] = None):
+        """リングファイルを items で作り直す（一時ファイル経由で置き換え。旧形式からの移行にも使用）"""
+        items = sorted(items, key=(lambda item: item[0]) if self.keyed else None)
+        capacity = capacity or self.capacity
+        while capacity < len(items):
+            capacity *= 2
+        self.close()
+        temp_file = f"{self.path}.tmp"
+        self._create(temp_file, capacity, items)
+        os.replace(temp_file, self.path)
+        self._open()
+
+    def flush(self):
+        """変更されたページをディスクへ書き出す"""
+        self._mm.flush()
+
+    def close(self):
+        if getattr(self, "_mm", None) is not None:
+            self._mm.close()
+            self._mm = None
+        if getattr(self, "_file", None) is not None:
+            self._file.close()
+            self._file = None